@@ -1,23 +1,17 @@
 from datetime import datetime
-from typing import Optional, TypedDict
-from plugins.scripts.complete_flights.constants import COMPLETE_FLIGHTS_COLUMNS, MONGODB
+from typing import List, Optional, TypedDict
+
+from commands.migration import Migration, parse_args, run_migration
+from plugins.scripts.complete_flights.constants import COMPLETE_FLIGHTS_COLUMNS
 import pymongo
 from pymongo.collection import Collection
+from pymongo.database import Database
 from pymongo.errors import CollectionInvalid
 
 
 FLIGHTS_EXPIRATION_SECONDS = 60 * 60 * 24 * 365
-
-client: pymongo.MongoClient = pymongo.MongoClient(
-    host=MONGODB.HOST,
-    port=MONGODB.PORT,
-    username=MONGODB.USERNAME,
-    password=MONGODB.PASSWORD,
-)
-
-old_db = client["aircraft-utilization-main"]
-
-new_db = client["aircraft-utilization-main-1"]
+OLD_DB = "aircraft-utilization-main"
+NEW_DB = "aircraft-utilization-main-1"
 
 
 class OldFlights(TypedDict):
@@ -44,7 +38,7 @@ class NewFlights(TypedDict):
     built: Optional[datetime]
 
 
-def new_flights_collection() -> Collection[NewFlights]:
+def new_flights_collection(new_db: Database) -> Collection[NewFlights]:
     try:
         new_flights = new_db.create_collection(
             name="flights",
@@ -60,20 +54,19 @@ def new_flights_collection() -> Collection[NewFlights]:
     return new_flights
 
 
-def upload_to_new_db() -> None:
-    old_flights = old_db["flights"]
-    new_flights = new_flights_collection()
-    flights_batch = []
-    for old_flight in old_flights.find():
-        built_str = old_flight["built"]
-        if built_str:
-            try:
-                built = datetime.strptime(built_str, "%Y-%m-%d")
-            except ValueError:
-                built = None
-        else:
-            built = None
-        new_flight = NewFlights(
+def parse_built(built_str: Optional[str]) -> Optional[datetime]:
+    if not built_str:
+        return None
+    try:
+        return datetime.strptime(built_str, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def to_new_flight(old_flight: OldFlights) -> dict:
+    return {
+        "_id": old_flight["_id"],
+        **NewFlights(
             icao24=old_flight["icao24"],
             landed_at=old_flight["landed_at"],
             duration_minutes=old_flight["duration_minutes"],
@@ -82,13 +75,27 @@ def upload_to_new_db() -> None:
             manufacturer_icao=old_flight["manufacturer_icao"],
             owner=old_flight["owner"],
             operator=old_flight["operator"],
-            built=built,
+            built=parse_built(built_str=old_flight["built"]),
+        ),
+    }
+
+
+class BuiltStringToDatetimeMigration(Migration):
+    def __init__(self, field: str = "_id") -> None:
+        super().__init__(
+            name="built_string_to_dt", source_db=OLD_DB, target_db=NEW_DB, field=field
         )
-        flights_batch.append(new_flight)
-        if len(flights_batch) >= 5000:
-            new_flights.insert_many(documents=flights_batch)
-            flights_batch.clear()
-    new_flights.insert_many(documents=flights_batch)
+
+    def target_collection(self, client: pymongo.MongoClient) -> Collection:
+        return new_flights_collection(new_db=client[self.target_db])
+
+    def transform(self, documents: List[dict]) -> List[dict]:
+        return [to_new_flight(old_flight=document) for document in documents]
+
+
+def upload_to_new_db() -> None:
+    args = parse_args(description="Convert migrated flights built dates to datetime")
+    run_migration(migration=BuiltStringToDatetimeMigration(field=args.field), args=args)
 
 
 if __name__ == "__main__":
@@ -1,25 +1,18 @@
-from typing import Optional, TypedDict
+from typing import List, Optional, TypedDict
 
+from commands.migration import Migration, parse_args, run_migration
 import numpy as np
 import pandas as pd
-from plugins.scripts.complete_flights.constants import COMPLETE_FLIGHTS_COLUMNS, MONGODB
+from plugins.scripts.complete_flights.constants import COMPLETE_FLIGHTS_COLUMNS
 import pymongo
 from pymongo.collection import Collection
+from pymongo.database import Database
 from pymongo.errors import CollectionInvalid
 
 
 FLIGHTS_EXPIRATION_SECONDS = 60 * 60 * 24 * 365
-
-client: pymongo.MongoClient = pymongo.MongoClient(
-    host=MONGODB.HOST,
-    port=MONGODB.PORT,
-    username=MONGODB.USERNAME,
-    password=MONGODB.PASSWORD,
-)
-
-old_db = client["aircraft-utilization"]
-
-new_db = client["aircraft-utilization-main"]
+OLD_DB = "aircraft-utilization"
+NEW_DB = "aircraft-utilization-main"
 
 
 class OldFlights(TypedDict):
@@ -40,7 +33,7 @@ class NewFlights(TypedDict):
     built: Optional[str]
 
 
-def new_flights_collection() -> Collection[NewFlights]:
+def new_flights_collection(new_db: Database) -> Collection[NewFlights]:
     try:
         new_flights = new_db.create_collection(
             name="flights",
@@ -64,17 +57,20 @@ def get_metadata() -> pd.DataFrame:
 
 def flights_to_typed(df: pd.DataFrame) -> list[NewFlights]:
     flights = [
-        NewFlights(
-            icao24=r["icao24"],
-            landed_at=r["landed_at"],
-            duration_minutes=r["duration_minutes"],
-            registration=r["registration"],
-            model=r["model"],
-            manufacturer_icao=r["manufacturericao"],
-            owner=r["owner"],
-            operator=r["operator"],
-            built=r["built"],
-        )
+        {
+            "_id": r["_id"],
+            **NewFlights(
+                icao24=r["icao24"],
+                landed_at=r["landed_at"],
+                duration_minutes=r["duration_minutes"],
+                registration=r["registration"],
+                model=r["model"],
+                manufacturer_icao=r["manufacturericao"],
+                owner=r["owner"],
+                operator=r["operator"],
+                built=r["built"],
+            ),
+        }
         for r in df.to_dict("records")
     ]
     return flights
@@ -87,21 +83,26 @@ def prepare_for_insert(flights_batch: list, metadata: pd.DataFrame) -> list[NewF
     return flights_to_typed(df)
 
 
+class MetadataAdditionMigration(Migration):
+    def __init__(self, field: str = "_id") -> None:
+        super().__init__(
+            name="metadata_addition", source_db=OLD_DB, target_db=NEW_DB, field=field
+        )
+        self.metadata: Optional[pd.DataFrame] = None
+
+    def prepare(self) -> None:
+        self.metadata = get_metadata()
+
+    def target_collection(self, client: pymongo.MongoClient) -> Collection:
+        return new_flights_collection(new_db=client[self.target_db])
+
+    def transform(self, documents: List[dict]) -> List[dict]:
+        return prepare_for_insert(flights_batch=documents, metadata=self.metadata)
+
+
 def upload_to_new_db() -> None:
-    metadata = get_metadata()
-    old_flights = old_db["flights"]
-    new_flights = new_flights_collection()
-    flights_batch = []
-    for old_flights in old_flights.find():
-        flights_batch.append(old_flights)
-        if len(flights_batch) >= 5000:
-            flights_list = prepare_for_insert(
-                flights_batch=flights_batch, metadata=metadata
-            )
-            new_flights.insert_many(documents=flights_list)
-            flights_batch.clear()
-    flights_list = prepare_for_insert(flights_batch=flights_batch, metadata=metadata)
-    new_flights.insert_many(documents=flights_list)
+    args = parse_args(description="Add aircraft metadata to migrated flights")
+    run_migration(migration=MetadataAdditionMigration(field=args.field), args=args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,409 @@
+from abc import ABC, abstractmethod
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import UTC, datetime
+import logging
+import os
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, NamedTuple, Union
+
+from plugins.common.metrics import instrumented
+from plugins.scripts.complete_flights.constants import MONGODB, Mongodb
+import pymongo
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class MigrationSettings(NamedTuple):
+    WORKERS: int
+    RANGES: int
+    BATCH_SIZE: int
+    CONTROL_COLLECTION: str
+
+
+MIGRATION = MigrationSettings(
+    WORKERS=int(os.getenv(key="MIGRATION_WORKERS", default=str(os.cpu_count() or 1))),
+    RANGES=int(os.getenv(key="MIGRATION_RANGES", default="64")),
+    BATCH_SIZE=int(os.getenv(key="MIGRATION_BATCH_SIZE", default="5000")),
+    CONTROL_COLLECTION=os.getenv(
+        key="MIGRATION_CONTROL_COLLECTION", default="migrations"
+    ),
+)
+
+
+class MigrationRange(NamedTuple):
+    index: int
+    lower: Any
+    upper: Any
+
+
+class RangeResult(NamedTuple):
+    index: int
+    documents: int
+    seconds: float
+
+
+def ranges_from_boundaries(boundaries: List[Any]) -> List[MigrationRange]:
+    bounds = [None, *boundaries, None]
+    return [
+        MigrationRange(index=index, lower=lower, upper=upper)
+        for index, (lower, upper) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+
+
+def range_filter(
+    field: str, migration_range: MigrationRange, last: Union[List[Any], None] = None
+) -> Dict[str, Any]:
+    conditions = []
+    if last is not None:
+        value, document_id = last
+        if field == "_id":
+            conditions.append({"_id": {"$gt": document_id}})
+        else:
+            conditions.append(
+                {
+                    "$or": [
+                        {field: {"$gt": value}},
+                        {field: value, "_id": {"$gt": document_id}},
+                    ]
+                }
+            )
+    elif migration_range.lower is not None:
+        conditions.append({field: {"$gte": migration_range.lower}})
+    if migration_range.upper is not None:
+        conditions.append({field: {"$lt": migration_range.upper}})
+    if not conditions:
+        return {}
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+class Migration(ABC):
+    def __init__(
+        self,
+        name: str,
+        source_db: str,
+        target_db: str,
+        collection: str = "flights",
+        field: str = "_id",
+    ) -> None:
+        self.name = name
+        self.source_db = source_db
+        self.target_db = target_db
+        self.collection = collection
+        self.field = field
+
+    def prepare(self) -> None:
+        pass
+
+    def source_collection(self, client: pymongo.MongoClient) -> Collection:
+        return client[self.source_db][self.collection]
+
+    def target_collection(self, client: pymongo.MongoClient) -> Collection:
+        return client[self.target_db][self.collection]
+
+    @abstractmethod
+    def transform(self, documents: List[dict]) -> List[dict]:
+        pass
+
+
+class MigrationRunner:
+    def __init__(
+        self,
+        migration: Migration,
+        credentials: Mongodb = MONGODB,
+        workers: int = MIGRATION.WORKERS,
+        ranges: int = MIGRATION.RANGES,
+        batch_size: int = MIGRATION.BATCH_SIZE,
+        control_collection: str = MIGRATION.CONTROL_COLLECTION,
+    ) -> None:
+        self.migration = migration
+        self.credentials = credentials
+        self.workers = workers
+        self.ranges = ranges
+        self.batch_size = batch_size
+        self.control_collection = control_collection
+        self._logger = logging.getLogger(__name__)
+
+    def _client(self) -> pymongo.MongoClient:
+        return pymongo.MongoClient(
+            host=self.credentials.HOST,
+            port=self.credentials.PORT,
+            username=self.credentials.USERNAME,
+            password=self.credentials.PASSWORD,
+        )
+
+    def _control(self, client: pymongo.MongoClient) -> Collection:
+        return client[self.migration.target_db][self.control_collection]
+
+    def _range_id(self, index: int) -> str:
+        return f"{self.migration.name}:{index:05d}"
+
+    def _boundaries(self, client: pymongo.MongoClient) -> List[Any]:
+        if self.ranges < 2:
+            return []
+        buckets = self.migration.source_collection(client=client).aggregate(
+            [
+                {
+                    "$bucketAuto": {
+                        "groupBy": f"${self.migration.field}",
+                        "buckets": self.ranges,
+                    }
+                }
+            ]
+        )
+        return [bucket["_id"]["min"] for bucket in buckets][1:]
+
+    def reset(self) -> None:
+        client = self._client()
+        try:
+            deleted = self._control(client=client).delete_many(
+                {"migration": self.migration.name}
+            )
+            self._logger.info(
+                f"Reset {deleted.deleted_count} checkpoints of {self.migration.name}"
+            )
+        finally:
+            client.close()
+
+    def plan(self) -> List[MigrationRange]:
+        client = self._client()
+        try:
+            control = self._control(client=client)
+            checkpoints = list(
+                control.find({"migration": self.migration.name}).sort("index", 1)
+            )
+            if checkpoints:
+                field = checkpoints[0]["field"]
+                if field != self.migration.field:
+                    self._logger.warning(
+                        f"Resuming {self.migration.name} over planned field {field}"
+                    )
+                    self.migration.field = field
+                pending = [
+                    MigrationRange(
+                        index=checkpoint["index"],
+                        lower=checkpoint["lower"],
+                        upper=checkpoint["upper"],
+                    )
+                    for checkpoint in checkpoints
+                    if not checkpoint["done"]
+                ]
+                self._logger.info(
+                    f"Resuming {self.migration.name}: {len(pending)} of "
+                    f"{len(checkpoints)} ranges pending"
+                )
+                return pending
+            planned = ranges_from_boundaries(boundaries=self._boundaries(client=client))
+            control.insert_many(
+                [
+                    {
+                        "_id": self._range_id(index=migration_range.index),
+                        "migration": self.migration.name,
+                        "field": self.migration.field,
+                        "index": migration_range.index,
+                        "lower": migration_range.lower,
+                        "upper": migration_range.upper,
+                        "last": None,
+                        "documents": 0,
+                        "done": False,
+                    }
+                    for migration_range in planned
+                ]
+            )
+            self._logger.info(
+                f"Planned {self.migration.name}: {len(planned)} ranges "
+                f"over {self.migration.field}"
+            )
+            return planned
+        finally:
+            client.close()
+
+    def _batches(
+        self, source: Collection, migration_range: MigrationRange, last: Any
+    ) -> Iterator[List[dict]]:
+        field = self.migration.field
+        sort = [("_id", 1)] if field == "_id" else [(field, 1), ("_id", 1)]
+        cursor = (
+            source.find(
+                range_filter(field=field, migration_range=migration_range, last=last)
+            )
+            .sort(sort)
+            .batch_size(self.batch_size)
+        )
+        batch: List[dict] = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _insert(self, target: Collection, documents: List[dict]) -> None:
+        if not documents:
+            return
+        try:
+            target.insert_many(documents=documents, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            self._logger.warning(
+                f"Skipped {len(errors)} documents already migrated by "
+                f"{self.migration.name}"
+            )
+
+    def _unmigrated(self, target: Collection, documents: List[dict]) -> List[dict]:
+        ids = [document["_id"] for document in documents if "_id" in document]
+        if not ids:
+            return documents
+        query: Dict[str, Any] = {"_id": {"$in": ids}}
+        field = self.migration.field
+        if field != "_id":
+            values = [
+                document[field]
+                for document in documents
+                if document.get(field) is not None
+            ]
+            if values:
+                query = {
+                    "$and": [
+                        {field: {"$gte": min(values), "$lte": max(values)}},
+                        query,
+                    ]
+                }
+        present = {document["_id"] for document in target.find(query, {"_id": 1})}
+        if not present:
+            return documents
+        self._logger.warning(
+            f"Skipped {len(present)} documents already migrated by "
+            f"{self.migration.name}"
+        )
+        return [
+            document for document in documents if document.get("_id") not in present
+        ]
+
+    @instrumented(stage="migrate_range")
+    def migrate_range(self, migration_range: MigrationRange) -> RangeResult:
+        started = perf_counter()
+        client = self._client()
+        try:
+            control = self._control(client=client)
+            range_id = self._range_id(index=migration_range.index)
+            checkpoint = control.find_one({"_id": range_id})
+            source = self.migration.source_collection(client=client)
+            target = self.migration.target_collection(client=client)
+            documents = 0
+            for number, batch in enumerate(
+                self._batches(
+                    source=source,
+                    migration_range=migration_range,
+                    last=checkpoint["last"],
+                )
+            ):
+                migrated = self.migration.transform(documents=batch)
+                if number == 0:
+                    migrated = self._unmigrated(target=target, documents=migrated)
+                self._insert(target=target, documents=migrated)
+                documents += len(batch)
+                control.update_one(
+                    {"_id": range_id},
+                    {
+                        "$set": {
+                            "last": [
+                                batch[-1].get(self.migration.field),
+                                batch[-1]["_id"],
+                            ],
+                            "updated_at": datetime.now(tz=UTC),
+                        },
+                        "$inc": {"documents": len(batch)},
+                    },
+                )
+            control.update_one(
+                {"_id": range_id},
+                {"$set": {"done": True, "updated_at": datetime.now(tz=UTC)}},
+            )
+        finally:
+            client.close()
+        return RangeResult(
+            index=migration_range.index,
+            documents=documents,
+            seconds=perf_counter() - started,
+        )
+
+    def _results(self, pending: List[MigrationRange]) -> Iterator[RangeResult]:
+        if self.workers < 2 or len(pending) < 2:
+            for migration_range in pending:
+                yield self.migrate_range(migration_range=migration_range)
+            return
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self,),
+        ) as executor:
+            futures = [
+                executor.submit(_migrate_range, migration_range)
+                for migration_range in pending
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def run(self) -> int:
+        self.migration.prepare()
+        pending = self.plan()
+        started = perf_counter()
+        total = 0
+        for done, result in enumerate(self._results(pending=pending), start=1):
+            total += result.documents
+            self._logger.info(
+                f"Range {result.index} of {self.migration.name}: {result.documents} "
+                f"documents in {result.seconds:.1f}s "
+                f"({result.documents / max(result.seconds, 1e-9):.0f} docs/s), "
+                f"{done}/{len(pending)} ranges done"
+            )
+        seconds = perf_counter() - started
+        self._logger.info(
+            f"Migrated {total} documents of {self.migration.name} in {seconds:.1f}s "
+            f"({total / max(seconds, 1e-9):.0f} docs/s)"
+        )
+        return total
+
+
+_worker_runner: Union[MigrationRunner, None] = None
+
+
+def _init_worker(runner: MigrationRunner) -> None:
+    global _worker_runner
+    _worker_runner = runner
+
+
+def _migrate_range(migration_range: MigrationRange) -> RangeResult:
+    return _worker_runner.migrate_range(migration_range=migration_range)
+
+
+def parse_args(description: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--field", choices=["_id", "landed_at"], default="_id")
+    parser.add_argument("--workers", type=int, default=MIGRATION.WORKERS)
+    parser.add_argument("--ranges", type=int, default=MIGRATION.RANGES)
+    parser.add_argument("--batch-size", type=int, default=MIGRATION.BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true")
+    return parser.parse_args()
+
+
+def run_migration(migration: Migration, args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.INFO)
+    runner = MigrationRunner(
+        migration=migration,
+        workers=args.workers,
+        ranges=args.ranges,
+        batch_size=args.batch_size,
+    )
+    if args.restart:
+        runner.reset()
+    return runner.run()
@@ -0,0 +1,48 @@
+import argparse
+import logging
+
+from plugins.common.constants import META_FILENAME
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.replay.constants import REPLAY
+from plugins.scripts.replay.engine import (
+    ReplayEngine,
+    ReplaySettings,
+    get_replay_sink,
+    to_timestamp,
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Replay archived OpenSky snapshots through the flight ETL"
+    )
+    parser.add_argument("--start", type=to_timestamp, required=True)
+    parser.add_argument("--end", type=to_timestamp, required=True)
+    parser.add_argument("--sink", choices=["mongo", "parquet"], default="mongo")
+    parser.add_argument("--target", default=None)
+    parser.add_argument("--workers", type=int, default=REPLAY.WORKERS)
+    parser.add_argument("--chunk-hours", type=int, default=REPLAY.CHUNK_HOURS)
+    return parser.parse_args()
+
+
+def replay() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    s3_credentials = S3BucketConnector.get_credentials()
+    s3_bucket = S3BucketConnector(credentials=s3_credentials)
+    target = args.target or (
+        REPLAY.COLLECTION if args.sink == "mongo" else REPLAY.PREFIX
+    )
+    engine = ReplayEngine(
+        settings=ReplaySettings(
+            credentials=s3_credentials, meta_filename=META_FILENAME
+        ),
+        sink=get_replay_sink(name=args.sink, target=target, s3_bucket=s3_bucket),
+        workers=args.workers,
+        chunk_seconds=args.chunk_hours * 60 * 60,
+    )
+    engine.replay(start=args.start, end=args.end)
+
+
+if __name__ == "__main__":
+    replay()
@@ -1,23 +1,88 @@
 from datetime import datetime, timedelta
+from functools import wraps
 import logging
 import logging.config
+from typing import Any, Callable, Union
 
 from airflow.decorators import task
 from airflow.models.dag import DAG
-from plugins.common.constants import META_FILENAME, SOURCE_FILENAME
+from airflow.models.param import Param
+from airflow.operators.python import get_current_context
+from plugins.common.constants import (
+    ADSB_FUSED,
+    META_FILENAME,
+    PROFILE_MODES,
+    PROFILING,
+    SOURCE_FILENAME,
+    STATE_STORE,
+)
+from plugins.common.profiling import TaskProfiler, profile_key
 from plugins.common.s3 import S3BucketConnector
+from plugins.common.state import get_state_store
 from plugins.scripts.complete_flights.constants import MONGODB
 from plugins.scripts.complete_flights.db import AircraftUtilizationClient
 from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
+from plugins.scripts.opensky.archive import SnapshotArchive
 from plugins.scripts.opensky.client import OpenSkyClient
-from plugins.scripts.opensky.constants import OPENSKY_AUTH
+from plugins.scripts.opensky.constants import OPENSKY_AUTH, STATES_ARCHIVE
 from plugins.scripts.opensky.transformers import ActiveFlightsETL, MetadataETL
+from plugins.scripts.replay.constants import REPLAY
+from plugins.scripts.replay.engine import (
+    ReplayEngine,
+    ReplaySettings,
+    get_replay_sink,
+    to_timestamp,
+)
 
 
 logger = logging.getLogger(__name__)
+DAG_PARAMS = {
+    "profile": Param(False, type="boolean"),
+    "profile_mode": Param(PROFILING.MODE, enum=list(PROFILE_MODES)),
+}
+REPLAY_PARAMS = {
+    **DAG_PARAMS,
+    "start": Param("2024-01-01T00:00:00", type="string"),
+    "end": Param("2024-01-02T00:00:00", type="string"),
+    "sink": Param("mongo", enum=["mongo", "parquet"]),
+    "target": Param(None, type=["null", "string"]),
+    "workers": Param(1, type="integer", minimum=1),
+    "chunk_hours": Param(REPLAY.CHUNK_HOURS, type="integer", minimum=1),
+}
+
+
+def profiled(func: Callable[[], Any]) -> Callable[[], Any]:
+    @wraps(func)
+    def wrapper() -> Any:
+        context = get_current_context()
+        if not (PROFILING.ENABLED or context["params"].get("profile", False)):
+            return func()
+        s3_bucket = (
+            S3BucketConnector(credentials=S3BucketConnector.get_credentials())
+            if PROFILING.UPLOAD
+            else None
+        )
+        key = profile_key(
+            context["dag"].dag_id, context["run_id"], context["task"].task_id
+        )
+        with TaskProfiler(
+            key=key,
+            s3_bucket=s3_bucket,
+            mode=context["params"].get("profile_mode", PROFILING.MODE),
+        ):
+            return func()
+
+    return wrapper
+
+
+def get_archive(s3_bucket: S3BucketConnector) -> Union[SnapshotArchive, None]:
+    if not STATES_ARCHIVE.ENABLED:
+        return None
+    return SnapshotArchive(s3_bucket=s3_bucket)
 
 
 @task(retries=2, retry_delay=timedelta(minutes=5))
+@profiled
 def metadata_report() -> None:
     logger.info("Starting Metadata ETL task")
     s3_credentials = S3BucketConnector.get_credentials()
@@ -31,6 +96,7 @@ def metadata_report() -> None:
 
 
 @task(retries=2, retry_delay=timedelta(seconds=30))
+@profiled
 def active_flights_report() -> None:
     logger.info("Starting Active Flights ETL task")
     s3_credentials = S3BucketConnector.get_credentials()
@@ -40,32 +106,105 @@ def active_flights_report() -> None:
         s3_bucket=s3_bucket,
         opensky_client=opensky_client,
         source_filename=SOURCE_FILENAME,
+        state_store=get_state_store(s3_bucket=s3_bucket, filename=SOURCE_FILENAME),
+        archive=get_archive(s3_bucket=s3_bucket),
     )
     transformer.etl()
     logger.info("Active Flights ETL task finished")
 
 
 @task(retries=1, retry_delay=timedelta(seconds=30))
+@profiled
 def complete_flights_report() -> None:
     logger.info("Starting Complete Flights ETL task")
     s3_credentials = S3BucketConnector.get_credentials()
-    s3_bucket = S3BucketConnector(credentials=s3_credentials)
+    s3_bucket = S3BucketConnector(
+        credentials=s3_credentials, cache=S3BucketConnector.get_cache()
+    )
     db_client = AircraftUtilizationClient(credentials=MONGODB)
     transformer = CompleteFlightsETL(
         s3_bucket=s3_bucket,
         db_client=db_client,
         source_filename=SOURCE_FILENAME,
         meta_filename=META_FILENAME,
+        state_store=get_state_store(s3_bucket=s3_bucket, filename=SOURCE_FILENAME),
     )
     transformer.etl()
     logger.info("Complete Flights ETL task finished")
 
 
+@task(retries=1, retry_delay=timedelta(seconds=30))
+@profiled
+def adsb_report() -> None:
+    logger.info("Starting ADS-B ETL task")
+    s3_credentials = S3BucketConnector.get_credentials()
+    s3_bucket = S3BucketConnector(
+        credentials=s3_credentials, cache=S3BucketConnector.get_cache()
+    )
+    opensky_client = OpenSkyClient(auth=OPENSKY_AUTH)
+    db_client = AircraftUtilizationClient(credentials=MONGODB)
+    state_store = get_state_store(s3_bucket=s3_bucket, filename=SOURCE_FILENAME)
+    active_transformer = ActiveFlightsETL(
+        s3_bucket=s3_bucket,
+        opensky_client=opensky_client,
+        source_filename=SOURCE_FILENAME,
+        state_store=state_store,
+        archive=get_archive(s3_bucket=s3_bucket),
+    )
+    complete_transformer = CompleteFlightsETL(
+        s3_bucket=s3_bucket,
+        db_client=db_client,
+        source_filename=SOURCE_FILENAME,
+        meta_filename=META_FILENAME,
+        state_store=state_store,
+    )
+    source = active_transformer.etl(load=False)
+    complete_transformer.etl(source=source)
+    active_transformer.archive_snapshot()
+    logger.info("ADS-B ETL task finished")
+
+
+@task(retries=1, retry_delay=timedelta(minutes=5))
+@profiled
+def states_archive_compaction() -> None:
+    logger.info("Starting states archive compaction task")
+    day = get_current_context()["data_interval_start"].date()
+    s3_credentials = S3BucketConnector.get_credentials()
+    s3_bucket = S3BucketConnector(credentials=s3_credentials)
+    SnapshotArchive(s3_bucket=s3_bucket).compact(day=day)
+    logger.info("States archive compaction task finished")
+
+
+@task(retries=0)
+@profiled
+def states_replay() -> None:
+    logger.info("Starting states replay task")
+    params = get_current_context()["params"]
+    s3_credentials = S3BucketConnector.get_credentials()
+    s3_bucket = S3BucketConnector(credentials=s3_credentials)
+    target = params["target"] or (
+        REPLAY.COLLECTION if params["sink"] == "mongo" else REPLAY.PREFIX
+    )
+    engine = ReplayEngine(
+        settings=ReplaySettings(
+            credentials=s3_credentials, meta_filename=META_FILENAME
+        ),
+        sink=get_replay_sink(name=params["sink"], target=target, s3_bucket=s3_bucket),
+        workers=params["workers"],
+        chunk_seconds=params["chunk_hours"] * 60 * 60,
+    )
+    engine.replay(
+        start=to_timestamp(value=params["start"]), end=to_timestamp(value=params["end"])
+    )
+    logger.info("States replay task finished")
+
+
 with DAG(
     dag_id="metadata_etl",
     start_date=datetime(2024, 1, 1),
     schedule=timedelta(days=1),
     catchup=False,
+    params=DAG_PARAMS,
 ) as dag:
     metadata_report()
 
@@ -74,5 +213,29 @@ with DAG(
     start_date=datetime(2024, 1, 1),
     schedule=timedelta(minutes=5),
     catchup=False,
+    params=DAG_PARAMS,
+) as dag:
+    if ADSB_FUSED and STATE_STORE.ARROW_QUEUE:
+        adsb_report.override(queue=STATE_STORE.ARROW_QUEUE)()
+    elif ADSB_FUSED:
+        adsb_report()
+    else:
+        active_flights_report() >> complete_flights_report()
+
+with DAG(
+    dag_id="states_archive_compaction",
+    start_date=datetime(2024, 1, 1),
+    schedule="30 0 * * *",
+    catchup=False,
+    params=DAG_PARAMS,
+) as dag:
+    states_archive_compaction()
+
+with DAG(
+    dag_id="states_replay",
+    start_date=datetime(2024, 1, 1),
+    schedule=None,
+    catchup=False,
+    params=REPLAY_PARAMS,
 ) as dag:
-    active_flights_report() >> complete_flights_report()
+    states_replay()
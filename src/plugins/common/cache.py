@@ -0,0 +1,109 @@
+from hashlib import sha256
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import NamedTuple, Union
+
+
+class CachedObject(NamedTuple):
+    etag: str
+    data: bytes
+
+
+class S3DiskCache:
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, bucket: str, key: str) -> tuple:
+        name = sha256(f"{bucket}/{key}".encode()).hexdigest()
+        base = os.path.join(self.directory, name)
+        return f"{base}.data", f"{base}.meta"
+
+    def get(self, bucket: str, key: str) -> Union[CachedObject, None]:
+        data_path, meta_path = self._paths(bucket=bucket, key=key)
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            with open(data_path, "rb") as data_file:
+                data = data_file.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("bucket") != bucket or meta.get("key") != key:
+            return None
+        if len(data) != meta.get("size"):
+            return None
+        return CachedObject(etag=meta["etag"], data=data)
+
+    def put(self, bucket: str, key: str, etag: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            self._logger.info(f"Object {bucket}/{key} is larger than the cache")
+            return
+        data_path, meta_path = self._paths(bucket=bucket, key=key)
+        meta = {"bucket": bucket, "key": key, "etag": etag, "size": len(data)}
+        self._write_atomic(path=data_path, content=data)
+        self._write_atomic(path=meta_path, content=json.dumps(meta).encode())
+        self.evict()
+
+    def touch(self, bucket: str, key: str) -> None:
+        data_path, _ = self._paths(bucket=bucket, key=key)
+        try:
+            os.utime(data_path)
+        except OSError:
+            pass
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def size(self) -> int:
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".data"):
+                total += entry.stat().st_size
+        return total
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".data"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        for _, size, data_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            meta_path = data_path.removesuffix(".data") + ".meta"
+            for path in (meta_path, data_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self._logger.info(f"Evicted {data_path} from S3 cache")
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -1,5 +1,8 @@
 import os
-from typing import NamedTuple, Union
+import tempfile
+from typing import NamedTuple, Tuple, Union
+
+import pyarrow as pa
 
 
 def all_fields_present(self: NamedTuple):
@@ -56,10 +59,66 @@ class S3RolesAnywhere(NamedTuple):
     PRIVATE_KEY_PATH: Union[str, None]
 
 
+class S3Client(NamedTuple):
+    MAX_POOL_CONNECTIONS: int
+    MAX_ATTEMPTS: int
+    CREDENTIALS_CHECK_SECONDS: int
+    CREDENTIALS_CACHE_DIR: str
+    RANGE_BUFFER_SIZE: int
+
+
+class StateStore(NamedTuple):
+    BACKEND: str
+    ARROW_DIR: str
+    CHECKPOINT_SECONDS: int
+    ARROW_QUEUE: str
+    REDIS_URL: str
+
+
+class Metrics(NamedTuple):
+    ENABLED: bool
+    EXPORTERS: Tuple[str, ...]
+    TRACE_MEMORY: bool
+    PREFIX: str
+    TEXTFILE_DIR: str
+    STATSD_HOST: str
+    STATSD_PORT: int
+
+
+class Profiling(NamedTuple):
+    ENABLED: bool
+    DIR: str
+    UPLOAD: bool
+    S3_PREFIX: str
+    MODE: str
+    SAMPLE_SECONDS: float
+    TOP_FUNCTIONS: int
+
+
+class S3Cache(NamedTuple):
+    DIR: Union[str, None]
+    MAX_BYTES: int
+
+
 SOURCE_COLUMNS = SourceColumns()
+SOURCE_SCHEMA = pa.schema(
+    [
+        pa.field(SOURCE_COLUMNS.ICAO24, pa.uint32(), nullable=False),
+        pa.field(SOURCE_COLUMNS.LAST_CONTACT, pa.int32()),
+        pa.field(SOURCE_COLUMNS.VELOCITY, pa.float32()),
+        pa.field(SOURCE_COLUMNS.VERTICAL_RATE, pa.float32()),
+        pa.field(SOURCE_COLUMNS.TAKEOFF_AT, pa.int32()),
+        pa.field(SOURCE_COLUMNS.FLIGHT_LAST_CONTACT, pa.int32()),
+        pa.field(
+            SOURCE_COLUMNS.FLIGHT_TRAJECTORY, pa.dictionary(pa.int8(), pa.string())
+        ),
+        pa.field(SOURCE_COLUMNS.IS_FIRST_CONTACT, pa.bool_()),
+    ]
+)
 SOURCE_FILENAME = os.getenv(key="SOURCE_FILENAME", default="source")
 META_COLUMNS = MetaColumns()
 META_FILENAME = os.getenv(key="META_FILENAME", default="metafile")
+ADSB_FUSED = os.getenv(key="ADSB_FUSED", default="false").lower() == "true"
 ACTIVE_FLIGHTS_COLUMNS = ActiveFlightsColumns()
 S3_STS = S3Sts(
     REGION=os.getenv(key="S3_REGION", default=None),
@@ -77,3 +136,59 @@ S3_ROLES_ANYWHERE = S3RolesAnywhere(
     PRIVATE_KEY_PATH=os.getenv(key="S3_PRIVATE_KEY_PATH", default=None),
 )
 S3_SERVICE_NAME = os.getenv(key="S3_SERVICE_NAME", default="sts")
+S3_CLIENT = S3Client(
+    MAX_POOL_CONNECTIONS=int(os.getenv(key="S3_MAX_POOL_CONNECTIONS", default="16")),
+    MAX_ATTEMPTS=int(os.getenv(key="S3_MAX_ATTEMPTS", default="5")),
+    CREDENTIALS_CHECK_SECONDS=int(
+        os.getenv(key="S3_CREDENTIALS_CHECK_SECONDS", default="60")
+    ),
+    CREDENTIALS_CACHE_DIR=os.getenv(
+        key="S3_CREDENTIALS_CACHE_DIR",
+        default=os.path.join(tempfile.gettempdir(), "s3-credentials"),
+    ),
+    RANGE_BUFFER_SIZE=int(
+        os.getenv(key="S3_RANGE_BUFFER_SIZE", default=str(256 * 1024))
+    ),
+)
+S3_CACHE = S3Cache(
+    DIR=os.getenv(key="S3_CACHE_DIR", default=None),
+    MAX_BYTES=int(os.getenv(key="S3_CACHE_MAX_BYTES", default=str(1 << 30))),
+)
+STATE_STORE = StateStore(
+    BACKEND=os.getenv(key="STATE_BACKEND", default="s3"),
+    ARROW_DIR=os.getenv(key="STATE_ARROW_DIR", default=tempfile.gettempdir()),
+    CHECKPOINT_SECONDS=int(
+        os.getenv(key="STATE_CHECKPOINT_SECONDS", default=str(15 * 60))
+    ),
+    ARROW_QUEUE=os.getenv(key="STATE_ARROW_QUEUE", default=""),
+    REDIS_URL=os.getenv(key="STATE_REDIS_URL", default="redis://localhost:6379/1"),
+)
+METRICS = Metrics(
+    ENABLED=os.getenv(key="METRICS_ENABLED", default="false").lower() == "true",
+    EXPORTERS=tuple(
+        exporter.strip()
+        for exporter in os.getenv(key="METRICS_EXPORTERS", default="log").split(",")
+        if exporter.strip()
+    ),
+    TRACE_MEMORY=os.getenv(key="METRICS_TRACE_MEMORY", default="false").lower()
+    == "true",
+    PREFIX=os.getenv(key="METRICS_PREFIX", default="aircraft_utilization"),
+    TEXTFILE_DIR=os.getenv(
+        key="METRICS_TEXTFILE_DIR",
+        default=os.path.join(tempfile.gettempdir(), "metrics"),
+    ),
+    STATSD_HOST=os.getenv(key="METRICS_STATSD_HOST", default="localhost"),
+    STATSD_PORT=int(os.getenv(key="METRICS_STATSD_PORT", default="8125")),
+)
+PROFILE_MODES = ("deterministic", "sampling")
+PROFILING = Profiling(
+    ENABLED=os.getenv(key="PROFILE_TASKS", default="false").lower() == "true",
+    DIR=os.getenv(
+        key="PROFILE_DIR", default=os.path.join(tempfile.gettempdir(), "profiles")
+    ),
+    UPLOAD=os.getenv(key="PROFILE_UPLOAD", default="false").lower() == "true",
+    S3_PREFIX=os.getenv(key="PROFILE_S3_PREFIX", default="profiles"),
+    MODE=os.getenv(key="PROFILE_MODE", default="deterministic"),
+    SAMPLE_SECONDS=float(os.getenv(key="PROFILE_SAMPLE_SECONDS", default="0.005")),
+    TOP_FUNCTIONS=int(os.getenv(key="PROFILE_TOP_FUNCTIONS", default="15")),
+)
@@ -0,0 +1,74 @@
+import logging
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from plugins.common.constants import SOURCE_COLUMNS
+
+
+ICAO24_DTYPE = np.uint32
+ICAO24_WIDTH = 6
+
+_PATTERN = f"^[0-9a-fA-F]{{{ICAO24_WIDTH}}}$"
+_SHIFTS = np.arange(4 * (ICAO24_WIDTH - 1), -1, -4, dtype=ICAO24_DTYPE)
+_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_NIBBLES = np.zeros(256, dtype=ICAO24_DTYPE)
+_NIBBLES[_DIGITS] = np.arange(16, dtype=ICAO24_DTYPE)
+_NIBBLES[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(
+    10, 16, dtype=ICAO24_DTYPE
+)
+
+_logger = logging.getLogger(__name__)
+
+
+def encode_icao24(
+    values: Union[pd.Series, pa.Array, pa.ChunkedArray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(values, pd.Series):
+        values = pa.array(values, type=pa.string(), from_pandas=True)
+    elif isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if len(values) == 0:
+        return np.empty(0, dtype=ICAO24_DTYPE), np.empty(0, dtype=bool)
+    valid = pc.fill_null(pc.match_substring_regex(values, _PATTERN), False)
+    padded = pc.if_else(valid, values, "0" * ICAO24_WIDTH)
+    offsets = np.frombuffer(padded.buffers()[1], dtype=np.int32)
+    offsets = offsets[padded.offset : padded.offset + len(padded) + 1]
+    hex_digits = np.frombuffer(padded.buffers()[2], dtype=np.uint8)
+    hex_digits = hex_digits[offsets[0] : offsets[-1]].reshape(-1, ICAO24_WIDTH)
+    codes = np.bitwise_or.reduce(_NIBBLES[hex_digits] << _SHIFTS, axis=1)
+    return codes.astype(ICAO24_DTYPE), valid.to_numpy(zero_copy_only=False)
+
+
+def decode_icao24(codes: Union[pd.Series, np.ndarray]) -> np.ndarray:
+    codes = np.asarray(codes, dtype=ICAO24_DTYPE)
+    hex_digits = _DIGITS[(codes[:, None] >> _SHIFTS) & 0xF]
+    return hex_digits.view(f"S{ICAO24_WIDTH}").ravel().astype(str).astype(object)
+
+
+def with_icao24_codes(
+    df: pd.DataFrame, column: str = SOURCE_COLUMNS.ICAO24
+) -> pd.DataFrame:
+    if column not in df.columns or df[column].dtype == ICAO24_DTYPE:
+        return df
+    if df.empty:
+        return df.astype({column: ICAO24_DTYPE})
+    codes, valid = encode_icao24(values=df[column])
+    if not valid.all():
+        _logger.warning(f"Dropping {(~valid).sum()} rows with malformed {column}")
+    df = df.loc[valid].copy()
+    df[column] = codes[valid]
+    return df.reset_index(drop=True)
+
+
+def with_icao24_hex(
+    df: pd.DataFrame, column: str = SOURCE_COLUMNS.ICAO24
+) -> pd.DataFrame:
+    if column not in df.columns or df[column].dtype != ICAO24_DTYPE:
+        return df
+    df = df.copy()
+    df[column] = decode_icao24(codes=df[column])
+    return df
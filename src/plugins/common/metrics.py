@@ -0,0 +1,282 @@
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from functools import wraps
+import inspect
+import json
+import logging
+import os
+import re
+import socket
+import tempfile
+from time import perf_counter, process_time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple, TypeVar
+
+import pandas as pd
+import pyarrow as pa
+
+from plugins.common.constants import METRICS
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_NAME_PATTERN = re.compile(r"[^a-zA-Z0-9_]")
+_FIELDS = (
+    ("calls", "Number of calls"),
+    ("wall_seconds", "Wall time in seconds"),
+    ("cpu_seconds", "CPU time in seconds"),
+    ("rows_in", "Rows passed in"),
+    ("rows_out", "Rows returned"),
+    ("bytes", "Bytes transferred"),
+    ("peak_bytes", "Peak traced memory in bytes"),
+    ("errors", "Errors handled without failing the stage"),
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class StageMetrics(NamedTuple):
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes: int = 0
+    peak_bytes: int = 0
+    errors: int = 0
+
+    def merge(self, other: "StageMetrics") -> "StageMetrics":
+        return StageMetrics(
+            calls=self.calls + other.calls,
+            wall_seconds=self.wall_seconds + other.wall_seconds,
+            cpu_seconds=self.cpu_seconds + other.cpu_seconds,
+            rows_in=self.rows_in + other.rows_in,
+            rows_out=self.rows_out + other.rows_out,
+            bytes=self.bytes + other.bytes,
+            peak_bytes=max(self.peak_bytes, other.peak_bytes),
+            errors=self.errors + other.errors,
+        )
+
+
+class _Span:
+    def __init__(self, name: str, rows_in: int, traced_bytes: int) -> None:
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = 0
+        self.bytes = 0
+        self.base_bytes = traced_bytes
+        self.peak_bytes = 0
+        self.errors = 0
+        self.wall = perf_counter()
+        self.cpu = process_time()
+
+    def finish(self) -> StageMetrics:
+        return StageMetrics(
+            calls=1,
+            wall_seconds=perf_counter() - self.wall,
+            cpu_seconds=process_time() - self.cpu,
+            rows_in=self.rows_in,
+            rows_out=self.rows_out,
+            bytes=self.bytes,
+            peak_bytes=self.peak_bytes,
+            errors=self.errors,
+        )
+
+
+class _Run:
+    def __init__(self, name: str, traced: bool) -> None:
+        self.name = name
+        self.traced = traced
+        self.spans: List[_Span] = []
+        self.stages: Dict[str, StageMetrics] = {}
+
+
+_run: ContextVar[Any] = ContextVar("metrics_run", default=None)
+
+
+def count_rows(value: Any) -> int:
+    if isinstance(value, (pd.DataFrame, pd.Series, pa.Table, pa.RecordBatch)):
+        return len(value)
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return sum(count_rows(item) for item in value)
+    if isinstance(value, list):
+        return sum(count_rows(item) for item in value)
+    return 0
+
+
+def record_bytes(count: int) -> None:
+    run = _run.get()
+    if run is None:
+        return
+    for span in run.spans:
+        span.bytes += count
+
+
+def record_error() -> None:
+    run = _run.get()
+    if run is None:
+        return
+    for span in run.spans:
+        span.errors += 1
+
+
+def _update_peaks(run: _Run) -> None:
+    if not run.traced:
+        return
+    peak = tracemalloc.get_traced_memory()[1]
+    for span in run.spans:
+        span.peak_bytes = max(span.peak_bytes, peak - span.base_bytes)
+    tracemalloc.reset_peak()
+
+
+def _open_span(name: str, args: Tuple, kwargs: Dict) -> Tuple[_Run, _Span, Any]:
+    run, token = _run.get(), None
+    if run is None:
+        traced = METRICS.TRACE_MEMORY and not tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.start()
+        run = _Run(name=name, traced=traced)
+        token = _run.set(run)
+    _update_peaks(run=run)
+    rows_in = sum(count_rows(value) for value in (*args, *kwargs.values()))
+    traced_bytes = tracemalloc.get_traced_memory()[0] if run.traced else 0
+    span = _Span(name=name, rows_in=rows_in, traced_bytes=traced_bytes)
+    run.spans.append(span)
+    return run, span, token
+
+
+def _close_span(run: _Run, span: _Span, token: Any) -> None:
+    _update_peaks(run=run)
+    run.spans.remove(span)
+    metrics = span.finish()
+    previous = run.stages.get(span.name)
+    run.stages[span.name] = metrics if previous is None else previous.merge(metrics)
+    if token is None:
+        return
+    _run.reset(token)
+    if run.traced:
+        tracemalloc.stop()
+    export(run=run.name, stages=run.stages)
+
+
+def _iterate(name: str, args: Tuple, kwargs: Dict, iterator: Iterator) -> Iterator:
+    while True:
+        run, span, token = _open_span(name=name, args=args, kwargs=kwargs)
+        args, kwargs = (), {}
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        else:
+            span.rows_out = count_rows(item)
+        finally:
+            _close_span(run=run, span=span, token=token)
+        yield item
+
+
+def instrumented(stage: str) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not METRICS.ENABLED:
+                return func(self, *args, **kwargs)
+            name = f"{type(self).__name__}.{stage}"
+            if inspect.isgeneratorfunction(func):
+                return _iterate(
+                    name=name,
+                    args=args,
+                    kwargs=kwargs,
+                    iterator=func(self, *args, **kwargs),
+                )
+            run, span, token = _open_span(name=name, args=args, kwargs=kwargs)
+            try:
+                result = func(self, *args, **kwargs)
+                span.rows_out = count_rows(result)
+                return result
+            finally:
+                _close_span(run=run, span=span, token=token)
+
+        return wrapper
+
+    return decorator
+
+
+def _metric_name(field: str) -> str:
+    return _NAME_PATTERN.sub("_", f"{METRICS.PREFIX}_{field}")
+
+
+def _prometheus_text(run: str, stages: Dict[str, StageMetrics]) -> str:
+    lines = []
+    for field, description in _FIELDS:
+        name = _metric_name(field=f"stage_{field}")
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        for stage, metrics in stages.items():
+            lines.append(
+                f'{name}{{run="{run}",stage="{stage}"}} {getattr(metrics, field)}'
+            )
+    name = _metric_name(field="last_run_timestamp_seconds")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f'{name}{{run="{run}"}} {datetime.now(tz=UTC).timestamp()}')
+    return "\n".join(lines) + "\n"
+
+
+def _export_prometheus(run: str, stages: Dict[str, StageMetrics]) -> None:
+    directory = METRICS.TEXTFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    filename = _NAME_PATTERN.sub("_", f"{METRICS.PREFIX}_{run}").lower()
+    file, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file, "w") as out:
+        out.write(_prometheus_text(run=run, stages=stages))
+    os.replace(temp_path, os.path.join(directory, f"{filename}.prom"))
+
+
+def _statsd_lines(run: str, stages: Dict[str, StageMetrics]) -> List[str]:
+    lines = []
+    for stage, metrics in stages.items():
+        prefix = f"{METRICS.PREFIX}.{run}.{stage}"
+        lines.append(f"{prefix}.wall_seconds:{metrics.wall_seconds * 1000:.3f}|ms")
+        lines.append(f"{prefix}.cpu_seconds:{metrics.cpu_seconds * 1000:.3f}|ms")
+        for field in ("calls", "rows_in", "rows_out", "bytes", "peak_bytes", "errors"):
+            lines.append(f"{prefix}.{field}:{getattr(metrics, field)}|g")
+    return lines
+
+
+def _export_statsd(run: str, stages: Dict[str, StageMetrics]) -> None:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        address = (METRICS.STATSD_HOST, METRICS.STATSD_PORT)
+        for line in _statsd_lines(run=run, stages=stages):
+            sock.sendto(line.encode(), address)
+
+
+def _export_log(run: str, stages: Dict[str, StageMetrics]) -> None:
+    _logger.info(
+        json.dumps(
+            {
+                "run": run,
+                "stages": {
+                    stage: metrics._asdict() for stage, metrics in stages.items()
+                },
+            },
+            separators=(",", ":"),
+        )
+    )
+
+
+_EXPORTERS: Dict[str, Callable[[str, Dict[str, StageMetrics]], None]] = {
+    "log": _export_log,
+    "prometheus": _export_prometheus,
+    "statsd": _export_statsd,
+}
+
+
+def export(run: str, stages: Dict[str, StageMetrics]) -> None:
+    for exporter in METRICS.EXPORTERS:
+        export_to = _EXPORTERS.get(exporter)
+        if export_to is None:
+            _logger.warning(f"Unknown metrics exporter {exporter}")
+            continue
+        try:
+            export_to(run, stages)
+        except OSError as e:
+            _logger.warning(f"Failed to export metrics to {exporter}: {e}")
@@ -0,0 +1,193 @@
+from collections import Counter, defaultdict
+import cProfile
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+from types import FrameType, TracebackType
+from typing import Dict, List, Tuple, Type, Union
+
+from plugins.common.constants import PROFILE_MODES, PROFILING
+from plugins.common.s3 import S3BucketConnector
+
+
+_KEY_PATTERN = re.compile(r"[^A-Za-z0-9._=-]")
+_STATS_MIN_SHARE = 1e-4
+
+
+def profile_key(*parts: str) -> str:
+    return "/".join(_KEY_PATTERN.sub("_", part) for part in parts)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}"
+
+
+def collapse_stack(frame: Union[FrameType, None]) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame=frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _stats_name(function: Tuple[str, int, str]) -> str:
+    filename, _, name = function
+    name = name.replace(" ", "_").replace(";", "_")
+    if filename == "~":
+        return name
+    return f"{os.path.splitext(os.path.basename(filename))[0]}:{name}"
+
+
+def collapse_stats(stats: Dict) -> Counter:
+    callees: Dict = defaultdict(dict)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][function] = edge
+    roots = [function for function, stat in stats.items() if not stat[4]]
+    min_seconds = sum(stats[root][3] for root in roots) * _STATS_MIN_SHARE
+    stacks: Counter = Counter()
+    pending = [((root,), stats[root][2], 1.0) for root in roots]
+    while pending:
+        path, own, share = pending.pop()
+        microseconds = round(own * 1e6)
+        if microseconds > 0:
+            stack = ";".join(_stats_name(function=name) for name in path)
+            stacks[stack] += microseconds
+        for callee, (_, _, edge_own, edge_cumulative) in callees[path[-1]].items():
+            cumulative = share * edge_cumulative
+            if callee in path or cumulative <= min_seconds:
+                continue
+            pending.append(
+                ((*path, callee), share * edge_own, cumulative / stats[callee][3])
+            )
+    return stacks
+
+
+class TaskProfiler:
+    def __init__(
+        self,
+        key: str,
+        directory: str = PROFILING.DIR,
+        s3_bucket: Union[S3BucketConnector, None] = None,
+        mode: str = PROFILING.MODE,
+        sample_seconds: float = PROFILING.SAMPLE_SECONDS,
+        top_functions: int = PROFILING.TOP_FUNCTIONS,
+    ) -> None:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.key = key
+        self.directory = directory
+        self.s3_bucket = s3_bucket
+        self.mode = mode
+        self.sample_seconds = sample_seconds
+        self.top_functions = top_functions
+        self.stacks: Counter = Counter()
+        self._profile = cProfile.Profile()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample, name="task-profiler-sampler", daemon=True
+        )
+        self._thread_id = threading.get_ident()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def sampling(self) -> bool:
+        return self.mode == "sampling"
+
+    def __enter__(self) -> "TaskProfiler":
+        self._logger.info(f"Profiling {self.key} ({self.mode})")
+        self._thread_id = threading.get_ident()
+        if self.sampling:
+            self._sampler.start()
+        else:
+            self._profile.enable()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Union[Type[BaseException], None],
+        exc: Union[BaseException, None],
+        traceback: Union[TracebackType, None],
+    ) -> None:
+        if self.sampling:
+            self._stop.set()
+            self._sampler.join()
+        else:
+            self._profile.disable()
+        try:
+            self.write()
+            self.log_hot_functions()
+        except Exception as e:
+            self._logger.warning(f"Failed to write profile {self.key}: {e}")
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_seconds):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame=frame)] += 1
+
+    def paths(self) -> List[str]:
+        extensions = ["collapsed"] if self.sampling else ["pstats", "collapsed"]
+        return [
+            f"{os.path.join(self.directory, self.key)}.{extension}"
+            for extension in extensions
+        ]
+
+    def collapsed_stacks(self) -> Counter:
+        if self.sampling:
+            return self.stacks
+        return collapse_stats(stats=pstats.Stats(self._profile).stats)
+
+    def write(self) -> List[str]:
+        paths = self.paths()
+        os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+        for path in paths:
+            if path.endswith(".pstats"):
+                self._profile.dump_stats(path)
+            else:
+                with open(path, "w") as file:
+                    for stack, count in sorted(self.collapsed_stacks().items()):
+                        file.write(f"{stack} {count}\n")
+            self._logger.info(f"Wrote profile to {path}")
+            if self.s3_bucket is not None:
+                self.s3_bucket.upload_file(
+                    path=path,
+                    key=f"{PROFILING.S3_PREFIX}/{self.key}{os.path.splitext(path)[1]}",
+                )
+        return paths
+
+    def _sampled_functions(self) -> List[str]:
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [
+            f"{count} samples {function}"
+            for function, count in leaves.most_common(self.top_functions)
+        ]
+
+    def hot_functions(self) -> List[str]:
+        if self.sampling:
+            return self._sampled_functions()
+        stats = pstats.Stats(self._profile).stats
+        hottest = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+        return [
+            f"{own:.3f}s own {cumulative:.3f}s cumulative {calls} calls "
+            f"{function} ({filename}:{line})"
+            for (filename, line, function), (
+                _,
+                calls,
+                own,
+                cumulative,
+                _,
+            ) in hottest[: self.top_functions]
+        ]
+
+    def log_hot_functions(self) -> None:
+        self._logger.info(
+            "\n".join([f"Hot functions for {self.key}:", *self.hot_functions()])
+        )
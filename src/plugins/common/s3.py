@@ -1,15 +1,29 @@
+from datetime import UTC, datetime
 from functools import singledispatchmethod
-from io import BytesIO
+import hashlib
+from io import BufferedReader, BytesIO, RawIOBase
+import json
 import logging
-from typing import Union
+import os
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
 
 import boto3
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, RefreshableCredentials
 from botocore.exceptions import ClientError
+from botocore.session import get_session as get_botocore_session
+from botocore.utils import parse_timestamp
 from iam_rolesanywhere_session import IAMRolesAnywhereSession
 import pandas as pd
 from pandas.core.api import DataFrame
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from plugins.common.cache import S3DiskCache
 from plugins.common.constants import (
+    S3_CACHE,
+    S3_CLIENT,
     S3_ROLES_ANYWHERE,
     S3_SERVICE_NAME,
     S3_STS,
@@ -17,17 +31,153 @@ from plugins.common.constants import (
     S3Sts,
     all_fields_present,
 )
-from plugins.common.exceptions import InvalidCredentials
+from plugins.common.exceptions import InvalidCredentials, InvalidSource
+from plugins.common.metrics import instrumented, record_bytes
+from plugins.common.schema import conform_table, frame_to_table, table_to_frame
 
 
-class S3BucketConnector:
+S3_DELETE_BATCH_SIZE = 1000
+S3_CREDENTIALS_MIN_TTL_SECONDS = 15 * 60
+
+
+class _CredentialsFile:
     def __init__(self, credentials: Union[S3Sts, S3RolesAnywhere]) -> None:
         self._logger = logging.getLogger(__name__)
+        self.directory = S3_CLIENT.CREDENTIALS_CACHE_DIR
+        digest = hashlib.sha256(repr(credentials).encode()).hexdigest()
+        self.path = os.path.join(self.directory, f"{digest}.json")
+
+    def load(self) -> Union[dict, None]:
+        try:
+            with open(self.path) as file:
+                metadata = json.load(file)
+            expiry = parse_timestamp(metadata["expiry_time"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if (
+            expiry - datetime.now(tz=UTC)
+        ).total_seconds() <= S3_CREDENTIALS_MIN_TTL_SECONDS:
+            return None
+        return metadata
+
+    def save(self, metadata: dict) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(metadata, file)
+        os.replace(temp_path, self.path)
+
+    def fetch(self, refresh: Callable[[], dict]) -> dict:
+        if not self.directory:
+            return refresh()
+        metadata = self.load()
+        if metadata is not None:
+            return metadata
+        metadata = refresh()
+        try:
+            self.save(metadata=metadata)
+        except OSError as e:
+            self._logger.warning(f"Failed to cache S3 credentials: {e}")
+        return metadata
+
+
+class _CachedCredentialProvider(CredentialProvider):
+    METHOD = "cached-role-credentials"
+
+    def __init__(self, credentials: RefreshableCredentials) -> None:
+        self._credentials = credentials
+
+    def load(self) -> RefreshableCredentials:
+        return self._credentials
+
+
+class _CredentialsRefresher(threading.Thread):
+    def __init__(self, credentials: RefreshableCredentials) -> None:
+        super().__init__(name="s3-credentials-refresher", daemon=True)
+        self._credentials = credentials
+        self._stopped = threading.Event()
+        self._logger = logging.getLogger(__name__)
+
+    def run(self) -> None:
+        while not self._stopped.wait(timeout=S3_CLIENT.CREDENTIALS_CHECK_SECONDS):
+            try:
+                self._credentials.get_frozen_credentials()
+            except Exception as e:
+                self._logger.warning(f"Failed to refresh S3 credentials: {e}")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class _S3RangeReader(RawIOBase):
+    def __init__(
+        self, client: Any, bucket: str, key: str, size: int, etag: str
+    ) -> None:
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._size = size
+        self._etag = etag
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            self._position = offset
+        elif whence == os.SEEK_CUR:
+            self._position += offset
+        elif whence == os.SEEK_END:
+            self._position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def readinto(self, buffer: Any) -> int:
+        end = min(self._position + len(buffer), self._size)
+        if end <= self._position:
+            return 0
+        data = (
+            self._client.get_object(
+                Bucket=self._bucket,
+                Key=self._key,
+                Range=f"bytes={self._position}-{end - 1}",
+                IfMatch=self._etag,
+            )
+            .get("Body")
+            .read()
+        )
+        buffer[: len(data)] = data
+        record_bytes(count=len(data))
+        self._position += len(data)
+        return len(data)
+
+
+class S3BucketConnector:
+    _clients: Dict[Union[S3Sts, S3RolesAnywhere], Any] = {}
+    _refreshers: Dict[Union[S3Sts, S3RolesAnywhere], _CredentialsRefresher] = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(
+        self,
+        credentials: Union[S3Sts, S3RolesAnywhere],
+        cache: Union[S3DiskCache, None] = None,
+    ) -> None:
+        self._logger = logging.getLogger(__name__)
+        self.cache = cache
 
         self._bucket_name = credentials.BUCKET
         self._endpoint_url = f"https://{credentials.REGION}.amazonaws.com"
-        self._session = self._get_session(credentials)
-        self._s3 = self._session.client("s3")
+        self._s3 = self._get_client(credentials)
 
     @staticmethod
     def get_credentials() -> Union[S3Sts, S3RolesAnywhere]:
@@ -38,27 +188,91 @@ class S3BucketConnector:
         else:
             raise NotImplementedError(f"Unknown service name: {S3_SERVICE_NAME}")
 
+    @staticmethod
+    def get_cache() -> Union[S3DiskCache, None]:
+        if not S3_CACHE.DIR:
+            return None
+        return S3DiskCache(directory=S3_CACHE.DIR, max_bytes=S3_CACHE.MAX_BYTES)
+
+    @classmethod
+    def clear_clients(cls) -> None:
+        with cls._clients_lock:
+            cls._clients.clear()
+            refreshers = list(cls._refreshers.values())
+            cls._refreshers.clear()
+        for refresher in refreshers:
+            refresher.stop()
+
+    @classmethod
+    def _get_client(cls, credentials: Union[S3Sts, S3RolesAnywhere]) -> Any:
+        with cls._clients_lock:
+            client = cls._clients.get(credentials)
+            if client is None:
+                session = cls._get_session(credentials)
+                client = session.client(
+                    "s3",
+                    config=Config(
+                        max_pool_connections=S3_CLIENT.MAX_POOL_CONNECTIONS,
+                        retries={
+                            "mode": "adaptive",
+                            "max_attempts": S3_CLIENT.MAX_ATTEMPTS,
+                        },
+                        tcp_keepalive=True,
+                    ),
+                )
+                session_credentials = session.get_credentials()
+                if isinstance(session_credentials, RefreshableCredentials):
+                    refresher = _CredentialsRefresher(credentials=session_credentials)
+                    refresher.start()
+                    cls._refreshers[credentials] = refresher
+                cls._clients[credentials] = client
+            return client
+
+    @staticmethod
+    def _assume_role(credentials: S3Sts) -> dict:
+        role_credentials = boto3.client("sts").assume_role(
+            RoleArn=credentials.ROLE_ARN,
+            RoleSessionName=credentials.ROLE_SESSION,
+        )["Credentials"]
+        return {
+            "access_key": role_credentials["AccessKeyId"],
+            "secret_key": role_credentials["SecretAccessKey"],
+            "token": role_credentials["SessionToken"],
+            "expiry_time": role_credentials["Expiration"].isoformat(),
+        }
+
     @singledispatchmethod
     @staticmethod
     def _get_session(credentials: Union[S3Sts, S3RolesAnywhere]) -> boto3.Session:
         raise NotImplementedError("Unknown service name")
 
+    @staticmethod
+    def _refreshable_session(
+        credentials: Union[S3Sts, S3RolesAnywhere], refresh: Callable[[], dict]
+    ) -> boto3.Session:
+        credentials_file = _CredentialsFile(credentials=credentials)
+        refreshable_credentials = RefreshableCredentials.create_from_metadata(
+            metadata=credentials_file.fetch(refresh=refresh),
+            refresh_using=lambda: credentials_file.fetch(refresh=refresh),
+            method=_CachedCredentialProvider.METHOD,
+        )
+        botocore_session = get_botocore_session()
+        botocore_session.get_component("credential_provider").insert_before(
+            "env", _CachedCredentialProvider(credentials=refreshable_credentials)
+        )
+        return boto3.Session(
+            botocore_session=botocore_session, region_name=credentials.REGION
+        )
+
     @_get_session.register
     @staticmethod
     def _(credentials: S3Sts) -> boto3.Session:
         if not all_fields_present(credentials):
             raise InvalidCredentials("S3 sts credentials are not valid")
 
-        role_credentials = boto3.client("sts").assume_role(
-            RoleArn=credentials.ROLE_ARN,
-            RoleSessionName=credentials.ROLE_SESSION,
-        )["Credentials"]
-
-        return boto3.Session(
-            aws_access_key_id=role_credentials["AccessKeyId"],
-            aws_secret_access_key=role_credentials["SecretAccessKey"],
-            aws_session_token=role_credentials["SessionToken"],
-            region_name=credentials.REGION,
+        return S3BucketConnector._refreshable_session(
+            credentials=credentials,
+            refresh=lambda: S3BucketConnector._assume_role(credentials),
         )
 
     @_get_session.register
@@ -75,7 +289,10 @@ class S3BucketConnector:
             private_key=credentials.PRIVATE_KEY_PATH,
             region=credentials.REGION,
         )
-        return roles_anywhere_session.get_session()
+        return S3BucketConnector._refreshable_session(
+            credentials=credentials,
+            refresh=roles_anywhere_session.get_refreshable_credentials()._refresh_using,
+        )
 
     @staticmethod
     def _get_code_from_client_error(err: ClientError) -> str:
@@ -85,8 +302,7 @@ class S3BucketConnector:
         code = error_resp.get("Code")
         return code if code else ""
 
-    def read_parquet(self, filename: str) -> pd.DataFrame:
-        key = filename + ".parquet"
+    def _read_object(self, key: str) -> Union[bytes, None]:
         file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
         self._logger.info(f"Reading file {file}")
         try:
@@ -98,20 +314,224 @@ class S3BucketConnector:
         except ClientError as e:
             if self._get_code_from_client_error(e) == "NoSuchKey":
                 self._logger.info(f"File {file} not found")
-                return pd.DataFrame()
+                return None
             else:
                 raise
-        out_buffer = BytesIO(data)
-        df = pd.read_parquet(out_buffer)
-        return df
+        record_bytes(count=len(data))
+        return data
+
+    def _read_cached_object(self, key: str) -> Union[bytes, None]:
+        if self.cache is None:
+            return self._read_object(key=key)
+        file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
+        cached = self.cache.get(bucket=self._bucket_name, key=key)
+        kwargs = {"Bucket": self._bucket_name, "Key": key}
+        if cached is not None:
+            kwargs["IfNoneMatch"] = cached.etag
+        try:
+            response = self._s3.get_object(**kwargs)
+        except ClientError as e:
+            code = self._get_code_from_client_error(e)
+            if code == "304" and cached is not None:
+                self._logger.info(f"Reading file {file} from cache")
+                self.cache.record(hit=True)
+                self.cache.touch(bucket=self._bucket_name, key=key)
+                return cached.data
+            if code == "NoSuchKey":
+                self._logger.info(f"File {file} not found")
+                return None
+            raise
+        self._logger.info(f"Reading file {file}")
+        self.cache.record(hit=False)
+        data = response.get("Body").read()
+        record_bytes(count=len(data))
+        self.cache.put(
+            bucket=self._bucket_name, key=key, etag=response["ETag"], data=data
+        )
+        return data
+
+    def _head_object(self, key: str) -> Union[dict, None]:
+        file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
+        try:
+            return self._s3.head_object(Bucket=self._bucket_name, Key=key)
+        except ClientError as e:
+            if self._get_code_from_client_error(e) in ("404", "NoSuchKey"):
+                self._logger.info(f"File {file} not found")
+                return None
+            else:
+                raise
+
+    def _open_ranged_object(self, key: str) -> Union[_S3RangeReader, None]:
+        file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
+        self._logger.info(f"Reading file {file} with ranged requests")
+        head = self._head_object(key=key)
+        if head is None:
+            return None
+        return _S3RangeReader(
+            client=self._s3,
+            bucket=self._bucket_name,
+            key=key,
+            size=head["ContentLength"],
+            etag=head["ETag"],
+        )
+
+    @instrumented(stage="read_json")
+    def read_json(self, filename: str) -> dict:
+        data = self._read_object(key=filename + ".json")
+        if data is None:
+            return {}
+        return json.loads(data)
+
+    @instrumented(stage="upload_json")
+    def upload_json(self, data: dict, filename: str) -> None:
+        key = filename + ".json"
+        file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
+        self._logger.info(f"Writing file {file}")
+        body = json.dumps(data).encode()
+        self._s3.put_object(Body=body, Bucket=self._bucket_name, Key=key)
+        record_bytes(count=len(body))
+
+    def list_keys(self, prefix: str) -> List[str]:
+        paginator = self._s3.get_paginator("list_objects_v2")
+        return [
+            item["Key"]
+            for page in paginator.paginate(Bucket=self._bucket_name, Prefix=prefix)
+            for item in page.get("Contents", [])
+        ]
+
+    def delete_keys(self, keys: Sequence[str]) -> None:
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            batch = keys[start : start + S3_DELETE_BATCH_SIZE]
+            self._logger.info(f"Deleting {len(batch)} files from {self._bucket_name}")
+            self._s3.delete_objects(
+                Bucket=self._bucket_name,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+
+    def get_parquet_etag(self, filename: str) -> Union[str, None]:
+        head = self._head_object(key=filename + ".parquet")
+        if head is None:
+            return None
+        return head["ETag"]
 
-    def upload_to_parquet(self, df: DataFrame, filename: str) -> None:
+    @instrumented(stage="read_parquet_table")
+    def read_parquet_table(
+        self,
+        filename: str,
+        cached: bool = False,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[List[Tuple[str, str, Any]], None] = None,
+        schema: Union[pa.Schema, None] = None,
+    ) -> Union[pa.Table, None]:
+        key = filename + ".parquet"
+        if cached:
+            data = self._read_cached_object(key=key)
+            source = None if data is None else BytesIO(data)
+        elif columns is None and filters is None:
+            data = self._read_object(key=key)
+            source = None if data is None else BytesIO(data)
+        else:
+            reader = self._open_ranged_object(key=key)
+            source = (
+                None
+                if reader is None
+                else BufferedReader(reader, buffer_size=S3_CLIENT.RANGE_BUFFER_SIZE)
+            )
+        if source is None:
+            return None
+        try:
+            table = pq.read_table(
+                source,
+                columns=None if columns is None else list(columns),
+                filters=filters,
+            )
+        except pa.ArrowInvalid as e:
+            raise InvalidSource(f"File {key} cannot be read: {e}") from e
+        if schema is None:
+            return table
+        return conform_table(table=table, schema=schema, columns=columns)
+
+    def read_parquet(
+        self,
+        filename: str,
+        cached: bool = False,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[List[Tuple[str, str, Any]], None] = None,
+        schema: Union[pa.Schema, None] = None,
+    ) -> pd.DataFrame:
+        table = self.read_parquet_table(
+            filename=filename,
+            cached=cached,
+            columns=columns,
+            filters=filters,
+            schema=schema,
+        )
+        if table is None:
+            return pd.DataFrame()
+        if schema is None:
+            return table.to_pandas()
+        return table_to_frame(table=table)
+
+    @instrumented(stage="upload_file")
+    def upload_file(self, path: str, key: str) -> None:
+        file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
+        self._logger.info(f"Writing file {file} from {path}")
+        self._s3.upload_file(Filename=path, Bucket=self._bucket_name, Key=key)
+        record_bytes(count=os.path.getsize(path))
+
+    def upload_parquet_file(self, path: str, filename: str) -> None:
+        self.upload_file(path=path, key=filename + ".parquet")
+
+    @instrumented(stage="upload_parquet_table")
+    def upload_parquet_table(
+        self,
+        table: pa.Table,
+        filename: str,
+        compression: str = "snappy",
+        compression_level: Union[int, None] = None,
+    ) -> None:
+        key = filename + ".parquet"
+        file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
+        self._logger.info(f"Writing file {file}")
+
+        out_buffer = BytesIO()
+        pq.write_table(
+            table,
+            out_buffer,
+            compression=compression,
+            compression_level=compression_level,
+        )
+        self._s3.put_object(
+            Body=out_buffer.getvalue(), Bucket=self._bucket_name, Key=key
+        )
+        record_bytes(count=out_buffer.tell())
+
+    @instrumented(stage="upload_to_parquet")
+    def upload_to_parquet(
+        self,
+        df: DataFrame,
+        filename: str,
+        schema: Union[pa.Schema, None] = None,
+    ) -> None:
         key = filename + ".parquet"
         file = f"{self._endpoint_url}/{self._bucket_name}/{key}"
         self._logger.info(f"Writing file {file}")
 
         out_buffer = BytesIO()
-        df.to_parquet(out_buffer, index=False)
+        if schema is None:
+            df.to_parquet(out_buffer, index=False)
+        else:
+            pq.write_table(frame_to_table(df=df, schema=schema), out_buffer)
         self._s3.put_object(
             Body=out_buffer.getvalue(), Bucket=self._bucket_name, Key=key
         )
+        record_bytes(count=out_buffer.tell())
+
+
+def _reset_clients_after_fork() -> None:
+    S3BucketConnector._clients = {}
+    S3BucketConnector._refreshers = {}
+    S3BucketConnector._clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
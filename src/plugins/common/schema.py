@@ -0,0 +1,99 @@
+import logging
+from typing import Sequence, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from plugins.common.constants import SOURCE_COLUMNS
+from plugins.common.exceptions import InvalidSource
+from plugins.common.icao24 import encode_icao24
+
+
+_PANDAS_TYPES = {pa.int32(): pd.Int32Dtype()}
+_DATE_FORMAT = "%Y-%m-%d"
+
+_logger = logging.getLogger(__name__)
+
+
+def _compatible(field: pa.Field, target: pa.Field) -> bool:
+    if pa.types.is_dictionary(field.type) and pa.types.is_dictionary(target.type):
+        return field.type.value_type.equals(target.type.value_type)
+    return field.type.equals(target.type)
+
+
+def parse_dates(
+    values: Union[pa.Array, pa.ChunkedArray], type: pa.DataType = pa.date32()
+) -> Union[pa.Array, pa.ChunkedArray]:
+    timestamps = pc.strptime(values, format=_DATE_FORMAT, unit="s", error_is_null=True)
+    return timestamps.cast(type)
+
+
+def _encode_icao24_column(table: pa.Table, field: pa.Field) -> pa.Table:
+    index = table.schema.get_field_index(field.name)
+    codes, valid = encode_icao24(values=table.column(index))
+    if not valid.all():
+        _logger.warning(f"Dropping {(~valid).sum()} rows with malformed {field.name}")
+    table = table.filter(pa.array(valid))
+    return table.set_column(index, field, pa.array(codes[valid], type=field.type))
+
+
+def conform_table(
+    table: pa.Table,
+    schema: pa.Schema,
+    columns: Union[Sequence[str], None] = None,
+) -> pa.Table:
+    names = list(schema.names if columns is None else columns)
+    missing = [name for name in names if name not in table.schema.names]
+    if missing:
+        raise InvalidSource(f"Table lacks required columns: {missing}")
+    try:
+        target = pa.schema([schema.field(name) for name in names])
+    except KeyError as e:
+        raise InvalidSource(f"Columns {names} are not in schema") from e
+    table = table.select(names)
+    mismatched = [
+        target.field(name)
+        for name in names
+        if not _compatible(field=table.schema.field(name), target=target.field(name))
+    ]
+    if not mismatched:
+        return table
+    _logger.info(f"Casting columns {[field.name for field in mismatched]} to schema")
+    try:
+        for field in mismatched:
+            if field.name == SOURCE_COLUMNS.ICAO24 and pa.types.is_string(
+                table.schema.field(field.name).type
+            ):
+                table = _encode_icao24_column(table=table, field=field)
+                continue
+            index = table.schema.get_field_index(field.name)
+            column = table.column(index)
+            if pa.types.is_dictionary(field.type):
+                column = column.cast(field.type.value_type).dictionary_encode()
+            elif pa.types.is_date(field.type) and pa.types.is_string(column.type):
+                column = parse_dates(values=column, type=field.type)
+            table = table.set_column(index, field, column.cast(field.type))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise InvalidSource(f"Table does not match schema: {e}") from e
+    return table
+
+
+def frame_to_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    missing = [name for name in schema.names if name not in df.columns]
+    if missing:
+        raise InvalidSource(f"Dataframe lacks required columns: {missing}")
+    try:
+        return pa.Table.from_pandas(
+            df[schema.names], schema=schema, preserve_index=False
+        )
+    except (ValueError, TypeError, pa.ArrowNotImplementedError) as e:
+        raise InvalidSource(f"Dataframe does not match schema: {e}") from e
+
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    return table.to_pandas(types_mapper=_PANDAS_TYPES.get, date_as_object=False)
+
+
+def conform_frame(df: pd.DataFrame, schema: pa.Schema) -> pd.DataFrame:
+    return table_to_frame(table=frame_to_table(df=df, schema=schema))
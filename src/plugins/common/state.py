@@ -0,0 +1,374 @@
+from abc import ABC, abstractmethod
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import redis
+
+from plugins.common.constants import (
+    ADSB_FUSED,
+    SOURCE_COLUMNS,
+    SOURCE_SCHEMA,
+    STATE_STORE,
+)
+from plugins.common.exceptions import InvalidSource
+from plugins.common.s3 import S3BucketConnector
+from plugins.common.schema import (
+    conform_frame,
+    conform_table,
+    frame_to_table,
+    table_to_frame,
+)
+
+
+Filters = List[Tuple[str, str, Any]]
+
+
+def _select(
+    table: pa.Table,
+    schema: pa.Schema,
+    columns: Union[Sequence[str], None],
+    filters: Union[Filters, None],
+) -> pd.DataFrame:
+    if columns is not None:
+        names = {*columns, *(column for column, _, _ in filters or [])}
+        table = table.select([name for name in table.schema.names if name in names])
+    try:
+        if filters is not None:
+            table = table.filter(pq.filters_to_expression(filters))
+    except (KeyError, pa.ArrowInvalid) as e:
+        raise InvalidSource(f"State cannot be read: {e}") from e
+    return table_to_frame(
+        table=conform_table(table=table, schema=schema, columns=columns)
+    )
+
+
+class StateStore(ABC):
+    schema: pa.Schema = SOURCE_SCHEMA
+
+    @abstractmethod
+    def read(
+        self,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[Filters, None] = None,
+    ) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def write(self, df: pd.DataFrame) -> None:
+        pass
+
+
+class S3ParquetStateStore(StateStore):
+    def __init__(self, s3_bucket: S3BucketConnector, filename: str) -> None:
+        self._s3_bucket = s3_bucket
+        self.filename = filename
+
+    def read(
+        self,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[Filters, None] = None,
+    ) -> pd.DataFrame:
+        return self._s3_bucket.read_parquet(
+            filename=self.filename,
+            columns=columns,
+            filters=filters,
+            schema=self.schema,
+        )
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._s3_bucket.upload_to_parquet(
+            df=df, filename=self.filename, schema=self.schema
+        )
+
+
+class ArrowStateStore(StateStore):
+    def __init__(
+        self,
+        s3_bucket: S3BucketConnector,
+        filename: str,
+        directory: str,
+        checkpoint_seconds: int,
+    ) -> None:
+        self._s3_bucket = s3_bucket
+        self.filename = filename
+        self.path = os.path.join(directory, f"{filename}.arrow")
+        self.checkpoint_path = f"{self.path}.checkpoint"
+        self.etag_path = f"{self.path}.etag"
+        self.checkpoint_seconds = checkpoint_seconds
+        self._logger = logging.getLogger(__name__)
+        os.makedirs(directory, exist_ok=True)
+
+    def _local_etag(self) -> Union[str, None]:
+        try:
+            with open(self.etag_path) as file:
+                return file.read() or None
+        except FileNotFoundError:
+            return None
+
+    def _record_etag(self, etag: Union[str, None]) -> None:
+        with open(self.etag_path, "w") as file:
+            file.write(etag or "")
+
+    def _restore(self, etag: str) -> None:
+        self._logger.info(f"Restoring state {self.path} from S3 checkpoint {etag}")
+        df = self._s3_bucket.read_parquet(filename=self.filename, schema=self.schema)
+        if df.empty and df.columns.empty:
+            return
+        self._write_local(df=df)
+        self._touch_checkpoint()
+        self._record_etag(etag=etag)
+
+    def read(
+        self,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[Filters, None] = None,
+    ) -> pd.DataFrame:
+        etag = self._s3_bucket.get_parquet_etag(filename=self.filename)
+        if etag is not None and (
+            not os.path.exists(self.path) or etag != self._local_etag()
+        ):
+            self._restore(etag=etag)
+        if not os.path.exists(self.path):
+            return pd.DataFrame()
+        with pa.memory_map(self.path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            return _select(
+                table=table, schema=self.schema, columns=columns, filters=filters
+            )
+
+    def _write_local(self, df: pd.DataFrame) -> None:
+        table = frame_to_table(df=df, schema=self.schema)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path), suffix=".tmp"
+        )
+        os.close(descriptor)
+        try:
+            with pa.OSFile(temp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _touch_checkpoint(self) -> None:
+        with open(self.checkpoint_path, "a"):
+            pass
+        os.utime(self.checkpoint_path)
+
+    def _checkpoint_due(self) -> bool:
+        try:
+            checkpointed_at = os.path.getmtime(self.checkpoint_path)
+        except FileNotFoundError:
+            return True
+        return time.time() - checkpointed_at >= self.checkpoint_seconds
+
+    def checkpoint(self, df: pd.DataFrame) -> None:
+        self._logger.info(f"Checkpointing state {self.path} to S3")
+        self._s3_bucket.upload_to_parquet(
+            df=df, filename=self.filename, schema=self.schema
+        )
+        self._touch_checkpoint()
+        self._record_etag(etag=self._s3_bucket.get_parquet_etag(filename=self.filename))
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._write_local(df=df)
+        if self._checkpoint_due():
+            self.checkpoint(df=df)
+
+
+def _encode_value(value: Any) -> str:
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return "null"
+    if isinstance(value, np.generic):
+        value = value.item()
+    return json.dumps(value)
+
+
+def _score(value: str) -> int:
+    return json.loads(value) or 0
+
+
+class RedisStateStore(StateStore):
+    def __init__(
+        self,
+        client: redis.Redis,
+        prefix: str,
+        key_column: str = SOURCE_COLUMNS.ICAO24,
+        score_column: str = SOURCE_COLUMNS.FLIGHT_LAST_CONTACT,
+    ) -> None:
+        self._client = client
+        self.prefix = prefix
+        self.key_column = key_column
+        self.score_column = score_column
+        self.index_key = f"{prefix}:aircraft"
+        self.schema_key = f"{prefix}:schema"
+        self._schema: Union[str, None] = None
+        self._records: Union[Dict[str, Dict[str, str]], None] = None
+        self._stale_limit: Any = None
+
+    def _aircraft_key(self, key: str) -> str:
+        return f"{self.prefix}:aircraft:{key}"
+
+    def _live_keys(self, filters: Union[Filters, None]) -> List[str]:
+        self._stale_limit = next(
+            (
+                value
+                for column, operator, value in filters or []
+                if column == self.score_column and operator == ">"
+            ),
+            None,
+        )
+        if self._stale_limit is None:
+            keys = self._client.zrange(self.index_key, 0, -1)
+        else:
+            keys = self._client.zrangebyscore(
+                self.index_key, f"({self._stale_limit}", "+inf"
+            )
+        return [key.decode() for key in keys]
+
+    def read(
+        self,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[Filters, None] = None,
+    ) -> pd.DataFrame:
+        schema = self._client.get(self.schema_key)
+        if schema is None:
+            return pd.DataFrame()
+        self._schema = schema.decode()
+        schema = json.loads(self._schema)
+        keys = self._live_keys(filters=filters)
+        pipeline = self._client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(self._aircraft_key(key=key))
+        self._records = {
+            key: {field.decode(): value.decode() for field, value in aircraft.items()}
+            for key, aircraft in zip(keys, pipeline.execute())
+            if aircraft
+        }
+        df = pd.DataFrame.from_records(
+            [
+                {field: json.loads(value) for field, value in record.items()}
+                for record in self._records.values()
+            ],
+            columns=schema["columns"],
+        )
+        df = df.astype(schema["dtypes"]).sort_values(self.key_column, ignore_index=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        return _select(
+            table=table, schema=self.schema, columns=columns, filters=filters
+        )
+
+    def _stale_keys(self, keys: Dict[str, Any]) -> List[str]:
+        if self._records is None:
+            candidates = [
+                key.decode() for key in self._client.zrange(self.index_key, 0, -1)
+            ]
+        else:
+            candidates = list(self._records)
+            if self._stale_limit is not None:
+                candidates += [
+                    key.decode()
+                    for key in self._client.zrangebyscore(
+                        self.index_key, "-inf", self._stale_limit
+                    )
+                ]
+        return sorted({key for key in candidates if key not in keys})
+
+    def write(self, df: pd.DataFrame) -> None:
+        df = conform_frame(df=df, schema=self.schema)
+        columns = df.columns.tolist()
+        schema = json.dumps(
+            {
+                "columns": columns,
+                "dtypes": {column: str(dtype) for column, dtype in df.dtypes.items()},
+            }
+        )
+        records = {
+            key: {
+                column: _encode_value(value) for column, value in zip(columns, record)
+            }
+            for key, record in zip(
+                df[self.key_column].astype(str).tolist(),
+                df.itertuples(index=False, name=None),
+            )
+        }
+        stale_keys = self._stale_keys(keys=records)
+        replaced = schema != self._schema
+        previous = {} if replaced or self._records is None else self._records
+        changed = {
+            key: record
+            for key, record in records.items()
+            if previous.get(key) != record
+        }
+        pipeline = self._client.pipeline(transaction=True)
+        if stale_keys:
+            pipeline.delete(*[self._aircraft_key(key=key) for key in stale_keys])
+            pipeline.zrem(self.index_key, *stale_keys)
+        for key, record in changed.items():
+            if replaced:
+                pipeline.delete(self._aircraft_key(key=key))
+            pipeline.hset(self._aircraft_key(key=key), mapping=record)
+        if changed:
+            pipeline.zadd(
+                self.index_key,
+                {
+                    key: _score(value=record[self.score_column])
+                    for key, record in changed.items()
+                },
+            )
+        if replaced:
+            pipeline.set(self.schema_key, schema)
+        pipeline.execute()
+        self._schema, self._records, self._stale_limit = schema, records, None
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self, table: Union[pa.Table, None] = None) -> None:
+        self.table = table
+
+    def read(
+        self,
+        columns: Union[Sequence[str], None] = None,
+        filters: Union[Filters, None] = None,
+    ) -> pd.DataFrame:
+        if self.table is None:
+            return pd.DataFrame()
+        return _select(
+            table=self.table, schema=self.schema, columns=columns, filters=filters
+        )
+
+    def write(self, df: pd.DataFrame) -> None:
+        self.table = frame_to_table(df=df, schema=self.schema)
+
+
+def get_state_store(s3_bucket: S3BucketConnector, filename: str) -> StateStore:
+    if STATE_STORE.BACKEND == "s3":
+        return S3ParquetStateStore(s3_bucket=s3_bucket, filename=filename)
+    elif STATE_STORE.BACKEND == "arrow":
+        if not (ADSB_FUSED and STATE_STORE.ARROW_QUEUE):
+            raise ValueError(
+                "Arrow state backend requires ADSB_FUSED and STATE_ARROW_QUEUE "
+                "to pin the ADS-B task to one worker"
+            )
+        return ArrowStateStore(
+            s3_bucket=s3_bucket,
+            filename=filename,
+            directory=STATE_STORE.ARROW_DIR,
+            checkpoint_seconds=STATE_STORE.CHECKPOINT_SECONDS,
+        )
+    elif STATE_STORE.BACKEND == "redis":
+        return RedisStateStore(
+            client=redis.Redis.from_url(STATE_STORE.REDIS_URL), prefix=filename
+        )
+    else:
+        raise NotImplementedError(f"Unknown state backend: {STATE_STORE.BACKEND}")
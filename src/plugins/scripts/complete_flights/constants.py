@@ -1,6 +1,9 @@
 import os
+import tempfile
 from typing import NamedTuple, Union
 
+import pyarrow as pa
+
 
 def to_int_or_none(value: str) -> Union[int, None]:
     try:
@@ -9,6 +12,16 @@ def to_int_or_none(value: str) -> Union[int, None]:
         return None
 
 
+def to_bool_or_none(value: str) -> Union[bool, None]:
+    if not value:
+        return None
+    return value.lower() == "true"
+
+
+def to_write_concern_w(value: str) -> Union[int, str]:
+    return int(value) if value.isdigit() else value
+
+
 class CompleteFlightsColumns(NamedTuple):
     ICAO24: str = "icao24"
     FLIGHT_DURATION_MINUTES: str = "flight_duration_minutes"
@@ -41,10 +54,52 @@ class Mongodb(NamedTuple):
     DB: Union[str, None]
 
 
+class MongodbClient(NamedTuple):
+    MAX_POOL_SIZE: int
+    COMPRESSORS: str
+    MAX_IDLE_TIME_MS: int
+    CONNECT_TIMEOUT_MS: int
+    BOOTSTRAP_DIR: str
+    BOOTSTRAP_TTL_SECONDS: int
+
+
+class MongodbWrite(NamedTuple):
+    W: Union[int, str]
+    JOURNAL: Union[bool, None]
+    BATCH_BYTES: int
+    BATCH_DOCUMENTS: int
+
+
 COMPLETE_FLIGHTS_COLUMNS = CompleteFlightsColumns()
 FLIGHT_STATUSES = FlightStatuses()
 FLIGHT_TRAJECTORIES = FlightTrajectories()
 FLIGHT_STATUS_COLUMN = "flight_status"
+LANDING_MAX_VELOCITY = 10
+FLIGHTS_COLLECTION = "flights"
+METAFILE_SCHEMA = pa.schema(
+    [
+        pa.field(COMPLETE_FLIGHTS_COLUMNS.ICAO24, pa.uint32(), nullable=False),
+        pa.field(COMPLETE_FLIGHTS_COLUMNS.REGISTRATION, pa.string()),
+        pa.field(
+            COMPLETE_FLIGHTS_COLUMNS.MODEL, pa.dictionary(pa.int32(), pa.string())
+        ),
+        pa.field(
+            COMPLETE_FLIGHTS_COLUMNS.MANUFACTURER_ICAO,
+            pa.dictionary(pa.int32(), pa.string()),
+        ),
+        pa.field(
+            COMPLETE_FLIGHTS_COLUMNS.OWNER, pa.dictionary(pa.int32(), pa.string())
+        ),
+        pa.field(
+            COMPLETE_FLIGHTS_COLUMNS.OPERATOR, pa.dictionary(pa.int32(), pa.string())
+        ),
+        pa.field(COMPLETE_FLIGHTS_COLUMNS.BUILT, pa.date32()),
+    ]
+)
+
+METADATA_INDEX_DIR = os.getenv(
+    key="METADATA_INDEX_DIR", default=os.path.join(tempfile.gettempdir(), "metadata")
+)
 
 MONGODB = Mongodb(
     HOST=os.getenv(key="MONGODB_HOST", default=None),
@@ -53,3 +108,26 @@ MONGODB = Mongodb(
     PASSWORD=os.getenv(key="MONGODB_PASSWORD", default=None),
     DB=os.getenv(key="MONGODB_DB", default=None),
 )
+MONGODB_WRITE = MongodbWrite(
+    W=to_write_concern_w(os.getenv(key="MONGODB_WRITE_W", default="1")),
+    JOURNAL=to_bool_or_none(os.getenv(key="MONGODB_WRITE_JOURNAL", default="")),
+    BATCH_BYTES=int(os.getenv(key="MONGODB_BATCH_BYTES", default=str(8 << 20))),
+    BATCH_DOCUMENTS=int(os.getenv(key="MONGODB_BATCH_DOCUMENTS", default="100000")),
+)
+MONGODB_CLIENT = MongodbClient(
+    MAX_POOL_SIZE=int(os.getenv(key="MONGODB_MAX_POOL_SIZE", default="10")),
+    COMPRESSORS=os.getenv(key="MONGODB_COMPRESSORS", default="zstd,zlib"),
+    MAX_IDLE_TIME_MS=int(
+        os.getenv(key="MONGODB_MAX_IDLE_TIME_MS", default=str(10 * 60 * 1000))
+    ),
+    CONNECT_TIMEOUT_MS=int(
+        os.getenv(key="MONGODB_CONNECT_TIMEOUT_MS", default="10000")
+    ),
+    BOOTSTRAP_DIR=os.getenv(
+        key="MONGODB_BOOTSTRAP_DIR",
+        default=os.path.join(tempfile.gettempdir(), "mongodb-bootstrap"),
+    ),
+    BOOTSTRAP_TTL_SECONDS=int(
+        os.getenv(key="MONGODB_BOOTSTRAP_TTL_SECONDS", default=str(24 * 60 * 60))
+    ),
+)
@@ -1,17 +1,30 @@
 from datetime import datetime
+import hashlib
 import logging
-from typing import Optional, TypedDict
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, TypedDict
 
+from bson.raw_bson import RawBSONDocument
 import pandas as pd
 from plugins.common.constants import all_fields_present
 from plugins.common.exceptions import InvalidCredentials
+from plugins.common.metrics import instrumented, record_bytes
 from plugins.scripts.complete_flights.constants import (
     COMPLETE_FLIGHTS_COLUMNS,
+    FLIGHTS_COLLECTION,
+    MONGODB_CLIENT,
+    MONGODB_WRITE,
     Mongodb as MongoCredentials,
+    MongodbWrite,
 )
+from plugins.scripts.complete_flights.encoders import encode_flights
 import pymongo
 from pymongo.collection import Collection
+from pymongo.database import Database
 from pymongo.errors import CollectionInvalid
+from pymongo.write_concern import WriteConcern
 
 
 class Flights(TypedDict):
@@ -27,23 +40,87 @@ class Flights(TypedDict):
 
 
 class AircraftUtilizationClient:
-    def __init__(self, credentials: MongoCredentials) -> None:
+    _clients: Dict[MongoCredentials, pymongo.MongoClient] = {}
+    _collections: Dict[Tuple[MongoCredentials, str], Collection] = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(
+        self,
+        credentials: MongoCredentials,
+        write: MongodbWrite = MONGODB_WRITE,
+        collection: str = FLIGHTS_COLLECTION,
+    ) -> None:
         if not all_fields_present(credentials):
             raise InvalidCredentials("MongoDB credentials are not valid")
-        client: pymongo.MongoClient = pymongo.MongoClient(
-            host=credentials.HOST,
-            port=credentials.PORT,
-            username=credentials.USERNAME,
-            password=credentials.PASSWORD,
-        )
-        self._db = client[credentials.DB]
+        self._credentials = credentials
+        self.collection = collection
+        self._db: Database = self._get_client(credentials)[credentials.DB]
+        self._write = write
         self._logger = logging.getLogger(__name__)
 
-    def _flights_collection(self) -> Collection[Flights]:
+    @classmethod
+    def clear_clients(cls) -> None:
+        with cls._clients_lock:
+            for client in cls._clients.values():
+                client.close()
+            cls._clients.clear()
+            cls._collections.clear()
+
+    @classmethod
+    def _get_client(cls, credentials: MongoCredentials) -> pymongo.MongoClient:
+        with cls._clients_lock:
+            key = credentials._replace(DB=None)
+            client = cls._clients.get(key)
+            if client is None:
+                client = pymongo.MongoClient(
+                    host=credentials.HOST,
+                    port=credentials.PORT,
+                    username=credentials.USERNAME,
+                    password=credentials.PASSWORD,
+                    maxPoolSize=MONGODB_CLIENT.MAX_POOL_SIZE,
+                    compressors=MONGODB_CLIENT.COMPRESSORS,
+                    maxIdleTimeMS=MONGODB_CLIENT.MAX_IDLE_TIME_MS,
+                    connectTimeoutMS=MONGODB_CLIENT.CONNECT_TIMEOUT_MS,
+                )
+                cls._clients[key] = client
+            return client
+
+    def _bootstrap_marker(self) -> str:
+        key = (
+            self._credentials.HOST,
+            self._credentials.PORT,
+            self._credentials.DB,
+            self.collection,
+        )
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(MONGODB_CLIENT.BOOTSTRAP_DIR, digest)
+
+    def _is_bootstrapped(self) -> bool:
+        if not MONGODB_CLIENT.BOOTSTRAP_DIR:
+            return False
+        try:
+            age = time.time() - os.path.getmtime(self._bootstrap_marker())
+        except OSError:
+            return False
+        return age < MONGODB_CLIENT.BOOTSTRAP_TTL_SECONDS
+
+    def _mark_bootstrapped(self) -> None:
+        if not MONGODB_CLIENT.BOOTSTRAP_DIR:
+            return
+        try:
+            os.makedirs(MONGODB_CLIENT.BOOTSTRAP_DIR, exist_ok=True)
+            with open(self._bootstrap_marker(), "w"):
+                pass
+        except OSError as e:
+            self._logger.warning(f"Failed to mark {self.collection} bootstrapped: {e}")
+
+    def _create_flights_collection(self) -> Collection[Flights]:
         FLIGHTS_EXPIRATION_SECONDS = 60 * 60 * 24 * 365
+        if self._db.list_collection_names(filter={"name": self.collection}):
+            return self._db[self.collection]
         try:
             flights = self._db.create_collection(
-                name="flights",
+                name=self.collection,
                 timeseries={
                     "timeField": COMPLETE_FLIGHTS_COLUMNS.LANDED_AT,
                     "metaField": COMPLETE_FLIGHTS_COLUMNS.ICAO24,
@@ -53,27 +130,56 @@ class AircraftUtilizationClient:
             )
         except CollectionInvalid as e:
             self._logger.debug(e)
-            flights = self._db["flights"]
+            flights = self._db[self.collection]
         return flights
 
+    def _flights_collection(self) -> Collection[Flights]:
+        key = (self._credentials, self.collection)
+        with self._clients_lock:
+            flights = self._collections.get(key)
+            if flights is None:
+                if self._is_bootstrapped():
+                    flights = self._db[self.collection]
+                else:
+                    flights = self._create_flights_collection()
+                    self._mark_bootstrapped()
+                self._collections[key] = flights
+            return flights
+
+    def _batches(self, documents: List[bytes]) -> Iterator[List[RawBSONDocument]]:
+        batch: List[RawBSONDocument] = []
+        batch_bytes = 0
+        for document in documents:
+            if batch and (
+                batch_bytes + len(document) > self._write.BATCH_BYTES
+                or len(batch) >= self._write.BATCH_DOCUMENTS
+            ):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(RawBSONDocument(document))
+            batch_bytes += len(document)
+        if batch:
+            yield batch
+
+    @instrumented(stage="write_flights")
     def write_flights(self, df: pd.DataFrame) -> None:
-        flights = self._flights_collection()
-        columns = COMPLETE_FLIGHTS_COLUMNS
-        documents = [
-            Flights(
-                icao24=r[columns.ICAO24],
-                landed_at=r[columns.LANDED_AT],
-                duration_minutes=r[columns.FLIGHT_DURATION_MINUTES],
-                registration=r[columns.REGISTRATION],
-                model=r[columns.MODEL],
-                manufacturer_icao=r[columns.MANUFACTURER_ICAO],
-                owner=r[columns.OWNER],
-                operator=r[columns.OPERATOR],
-                built=r[columns.BUILT],
-            )
-            for r in df.to_dict("records")
-        ]
-        if documents:
-            flights.insert_many(documents=documents)
-        else:
+        documents = encode_flights(df=df)
+        if not documents:
             self._logger.info("Empty document. Nothing to write")
+            return
+        flights = self._flights_collection().with_options(
+            write_concern=WriteConcern(w=self._write.W, j=self._write.JOURNAL)
+        )
+        for batch in self._batches(documents=documents):
+            flights.insert_many(documents=batch, ordered=False)
+        record_bytes(count=sum(len(document) for document in documents))
+
+
+def _reset_clients_after_fork() -> None:
+    AircraftUtilizationClient._clients = {}
+    AircraftUtilizationClient._collections = {}
+    AircraftUtilizationClient._clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
@@ -0,0 +1,51 @@
+import struct
+from typing import Dict, List
+
+import bson
+import numpy as np
+import pandas as pd
+from plugins.common.icao24 import with_icao24_hex
+from plugins.scripts.complete_flights.constants import COMPLETE_FLIGHTS_COLUMNS
+
+
+FLIGHTS_FIELDS: Dict[str, str] = {
+    COMPLETE_FLIGHTS_COLUMNS.ICAO24: "icao24",
+    COMPLETE_FLIGHTS_COLUMNS.LANDED_AT: "landed_at",
+    COMPLETE_FLIGHTS_COLUMNS.FLIGHT_DURATION_MINUTES: "duration_minutes",
+    COMPLETE_FLIGHTS_COLUMNS.REGISTRATION: "registration",
+    COMPLETE_FLIGHTS_COLUMNS.MODEL: "model",
+    COMPLETE_FLIGHTS_COLUMNS.MANUFACTURER_ICAO: "manufacturer_icao",
+    COMPLETE_FLIGHTS_COLUMNS.OWNER: "owner",
+    COMPLETE_FLIGHTS_COLUMNS.OPERATOR: "operator",
+    COMPLETE_FLIGHTS_COLUMNS.BUILT: "built",
+}
+
+_DOCUMENT_OVERHEAD = 5
+
+
+def _encode_element(field: str, value: object) -> bytes:
+    return bson.encode({field: value})[4:-1]
+
+
+def _encode_column(field: str, column: pd.Series) -> np.ndarray:
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    elements = np.empty(len(uniques) + 1, dtype=object)
+    for index, value in enumerate(uniques.tolist()):
+        elements[index] = _encode_element(field=field, value=value)
+    elements[-1] = _encode_element(field=field, value=None)
+    return elements[codes]
+
+
+def encode_flights(df: pd.DataFrame) -> List[bytes]:
+    df = with_icao24_hex(df=df, column=COMPLETE_FLIGHTS_COLUMNS.ICAO24)
+    columns = [
+        _encode_column(field=field, column=df[column])
+        for column, field in FLIGHTS_FIELDS.items()
+    ]
+    documents = []
+    for elements in zip(*columns):
+        body = b"".join(elements)
+        documents.append(
+            struct.pack("<i", len(body) + _DOCUMENT_OVERHEAD) + body + b"\x00"
+        )
+    return documents
@@ -0,0 +1,153 @@
+from hashlib import sha256
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from plugins.common.icao24 import ICAO24_DTYPE
+from plugins.common.s3 import S3BucketConnector
+from plugins.common.schema import frame_to_table, table_to_frame
+from plugins.scripts.complete_flights.constants import (
+    COMPLETE_FLIGHTS_COLUMNS,
+    METAFILE_SCHEMA,
+)
+
+
+_VERSION_LENGTH = 16
+
+
+class MetadataIndex:
+    _indexes: Dict[str, "MetadataIndex"] = {}
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, table: pa.Table, path: Union[str, None] = None) -> None:
+        self.path = path
+        keys = table.column(COMPLETE_FLIGHTS_COLUMNS.ICAO24)
+        keys = keys.chunk(0) if keys.num_chunks == 1 else keys.combine_chunks()
+        self._keys = keys.to_numpy(zero_copy_only=True)
+        self._table = table.drop_columns([COMPLETE_FLIGHTS_COLUMNS.ICAO24])
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _sorted(table: pa.Table) -> pa.Table:
+        table = table.sort_by(COMPLETE_FLIGHTS_COLUMNS.ICAO24)
+        return table.combine_chunks()
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "MetadataIndex":
+        return cls(table=cls._sorted(table=table))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "MetadataIndex":
+        return cls.from_table(table=frame_to_table(df=df, schema=METAFILE_SCHEMA))
+
+    @classmethod
+    def build(cls, table: pa.Table, path: str) -> None:
+        table = cls._sorted(table=table)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=".tmp"
+        )
+        os.close(descriptor)
+        try:
+            with pa.OSFile(temp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @classmethod
+    def open(cls, path: str) -> "MetadataIndex":
+        source = pa.memory_map(path)
+        return cls(table=pa.ipc.open_file(source).read_all(), path=path)
+
+    @staticmethod
+    def _index_path(directory: str, filename: str, etag: str) -> str:
+        version = sha256(etag.encode()).hexdigest()[:_VERSION_LENGTH]
+        return os.path.join(directory, f"{filename}-{version}.arrow")
+
+    @classmethod
+    def clear_indexes(cls) -> None:
+        with cls._indexes_lock:
+            cls._indexes.clear()
+
+    @staticmethod
+    def _remove_stale(directory: str, filename: str, path: str) -> None:
+        name_length = len(os.path.basename(path))
+        for entry in os.scandir(directory):
+            if (
+                entry.path != path
+                and len(entry.name) == name_length
+                and entry.name.startswith(f"{filename}-")
+                and entry.name.endswith(".arrow")
+            ):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def load(
+        cls, s3_bucket: S3BucketConnector, filename: str, directory: str
+    ) -> "MetadataIndex":
+        logger = logging.getLogger(__name__)
+        etag = s3_bucket.get_parquet_etag(filename=filename)
+        if etag is None:
+            logger.warning(f"Metadata {filename} not found. Skipping enrichment")
+            return cls.from_table(table=METAFILE_SCHEMA.empty_table())
+        path = cls._index_path(directory=directory, filename=filename, etag=etag)
+        key = os.path.join(directory, filename)
+        with cls._indexes_lock:
+            index = cls._indexes.get(key)
+            if index is not None and index.path == path:
+                return index
+            if not os.path.exists(path):
+                logger.info(f"Building metadata index {path}")
+                os.makedirs(directory, exist_ok=True)
+                table = s3_bucket.read_parquet_table(
+                    filename=filename, cached=True, schema=METAFILE_SCHEMA
+                )
+                cls.build(table=table, path=path)
+                cls._remove_stale(directory=directory, filename=filename, path=path)
+            index = cls.open(path=path)
+            cls._indexes[key] = index
+            return index
+
+    def lookup(self, codes: np.ndarray) -> pd.DataFrame:
+        codes = np.asarray(codes, dtype=ICAO24_DTYPE)
+        if len(self._keys):
+            positions = np.searchsorted(self._keys, codes)
+            positions = np.minimum(positions, len(self._keys) - 1)
+            found = self._keys[positions] == codes
+        else:
+            positions = np.zeros(len(codes), dtype=np.int64)
+            found = np.zeros(len(codes), dtype=bool)
+        rows = self._table.take(pa.array(positions, mask=~found, type=pa.int64()))
+        rows = pa.Table.from_arrays(
+            [
+                (
+                    column.cast(field.type.value_type)
+                    if pa.types.is_dictionary(field.type)
+                    else column
+                )
+                for column, field in zip(rows.columns, rows.schema)
+            ],
+            names=rows.column_names,
+        )
+        return table_to_frame(table=rows)
+
+
+def _reset_indexes_after_fork() -> None:
+    MetadataIndex._indexes_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_indexes_after_fork)
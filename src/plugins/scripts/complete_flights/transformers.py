@@ -1,18 +1,24 @@
 import logging
-import math
-from typing import NamedTuple
+from typing import NamedTuple, Union
 
 import numpy as np
 import pandas as pd
+from pandas.api.types import is_integer_dtype
 from plugins.common.constants import SOURCE_COLUMNS
+from plugins.common.icao24 import with_icao24_codes
+from plugins.common.metrics import instrumented
 from plugins.common.s3 import S3BucketConnector
+from plugins.common.state import S3ParquetStateStore, StateStore
 from plugins.scripts.complete_flights.constants import (
     COMPLETE_FLIGHTS_COLUMNS,
     FLIGHT_STATUSES,
     FLIGHT_STATUS_COLUMN,
     FLIGHT_TRAJECTORIES,
+    LANDING_MAX_VELOCITY,
+    METADATA_INDEX_DIR,
 )
 from plugins.scripts.complete_flights.db import AircraftUtilizationClient
+from plugins.scripts.complete_flights.metadata import MetadataIndex
 
 
 class TransformedFlights(NamedTuple):
@@ -27,11 +33,17 @@ class CompleteFlightsETL:
         db_client: AircraftUtilizationClient,
         source_filename: str,
         meta_filename: str,
+        state_store: Union[StateStore, None] = None,
+        index_dir: str = METADATA_INDEX_DIR,
     ) -> None:
         self.s3_bucket = s3_bucket
         self.db_client = db_client
         self.source_filename = source_filename
         self.meta_filename = meta_filename
+        self.state_store = state_store or S3ParquetStateStore(
+            s3_bucket=s3_bucket, filename=source_filename
+        )
+        self.index_dir = index_dir
         self._logger = logging.getLogger(__name__)
 
     def _is_takeoff(self, row: pd.Series) -> bool:
@@ -51,7 +63,7 @@ class CompleteFlightsETL:
             and (
                 (
                     row[SOURCE_COLUMNS.FLIGHT_TRAJECTORY] == FLIGHT_TRAJECTORIES.DESCEND
-                    and (row[SOURCE_COLUMNS.VELOCITY] < 10)
+                    and (row[SOURCE_COLUMNS.VELOCITY] < LANDING_MAX_VELOCITY)
                 )
                 or (
                     row[SOURCE_COLUMNS.VELOCITY] == 0
@@ -70,6 +82,38 @@ class CompleteFlightsETL:
         else:
             return FLIGHT_STATUSES.OTHER
 
+    def _takeoff_mask(self, source: pd.DataFrame) -> pd.Series:
+        is_first_contact = (
+            source[SOURCE_COLUMNS.IS_FIRST_CONTACT].eq(True).fillna(False)
+        )
+        climbing = source[SOURCE_COLUMNS.VERTICAL_RATE].gt(0).fillna(False)
+        return (is_first_contact & climbing).astype(bool)
+
+    def _landing_mask(self, source: pd.DataFrame) -> pd.Series:
+        last_contact = source[SOURCE_COLUMNS.LAST_CONTACT]
+        vertical_rate = source[SOURCE_COLUMNS.VERTICAL_RATE]
+        velocity = source[SOURCE_COLUMNS.VELOCITY]
+        has_last_contact = last_contact.ne(0).fillna(True)
+        level = vertical_rate.eq(0).fillna(True) | vertical_rate.isna()
+        descending = (
+            source[SOURCE_COLUMNS.FLIGHT_TRAJECTORY]
+            .eq(FLIGHT_TRAJECTORIES.DESCEND)
+            .fillna(False)
+        )
+        slow = velocity.lt(LANDING_MAX_VELOCITY).fillna(False)
+        stopped = velocity.eq(0).fillna(True) | velocity.isna()
+        return (has_last_contact & level & ((descending & slow) | stopped)).astype(bool)
+
+    def _determine_flight_statuses(self, source: pd.DataFrame) -> pd.Series:
+        takeoff_mask = self._takeoff_mask(source=source)
+        landing_mask = self._landing_mask(source=source)
+        statuses = np.select(
+            [takeoff_mask.to_numpy(), landing_mask.to_numpy()],
+            [FLIGHT_STATUSES.TAKEOFF, FLIGHT_STATUSES.LANDING],
+            default=FLIGHT_STATUSES.OTHER,
+        )
+        return pd.Series(statuses, index=source.index, dtype=object)
+
     def _determine_flight_trajectory(self, row: pd.Series) -> str:
         if row[SOURCE_COLUMNS.VERTICAL_RATE] > 0:
             return FLIGHT_TRAJECTORIES.CLIMB
@@ -80,9 +124,34 @@ class CompleteFlightsETL:
         else:
             return FLIGHT_TRAJECTORIES.OTHER
 
+    def _determine_flight_trajectories(self, active: pd.DataFrame) -> pd.Series:
+        vertical_rate = active[SOURCE_COLUMNS.VERTICAL_RATE]
+        climb_mask = vertical_rate.gt(0).fillna(False).astype(bool)
+        descend_mask = vertical_rate.lt(0).fillna(False).astype(bool) | (
+            active[SOURCE_COLUMNS.FLIGHT_TRAJECTORY]
+            .eq(FLIGHT_TRAJECTORIES.DESCEND)
+            .fillna(False)
+            .astype(bool)
+        )
+        trajectories = np.select(
+            [climb_mask.to_numpy(), descend_mask.to_numpy()],
+            [FLIGHT_TRAJECTORIES.CLIMB, FLIGHT_TRAJECTORIES.DESCEND],
+            default=FLIGHT_TRAJECTORIES.OTHER,
+        )
+        return pd.Series(trajectories, index=active.index, dtype=object)
+
+    def _flight_duration_minutes(self, complete: pd.DataFrame) -> pd.Series:
+        duration_seconds = (
+            complete[SOURCE_COLUMNS.LAST_CONTACT] - complete[SOURCE_COLUMNS.TAKEOFF_AT]
+        )
+        if is_integer_dtype(duration_seconds.dtype):
+            return -(-duration_seconds // 60)
+        return np.ceil(duration_seconds / 60).astype(pd.Int32Dtype())
+
+    @instrumented(stage="extract")
     def _extract(self) -> pd.DataFrame:
         self._logger.info("Extracting source report")
-        source = self.s3_bucket.read_parquet(filename=self.source_filename)
+        source = with_icao24_codes(df=self.state_store.read())
 
         return source
 
@@ -93,8 +162,8 @@ class CompleteFlightsETL:
             takeoff_mask, SOURCE_COLUMNS.FLIGHT_LAST_CONTACT
         ]
 
-        active[SOURCE_COLUMNS.FLIGHT_TRAJECTORY] = active.apply(
-            self._determine_flight_trajectory, axis=1
+        active[SOURCE_COLUMNS.FLIGHT_TRAJECTORY] = self._determine_flight_trajectories(
+            active=active
         )
         active.drop(
             [
@@ -106,22 +175,16 @@ class CompleteFlightsETL:
         return active
 
     def _add_metadata(
-        self, complete: pd.DataFrame, metadata: pd.DataFrame
+        self, complete: pd.DataFrame, metadata: MetadataIndex
     ) -> pd.DataFrame:
         self._logger.info("Adding metadata to complete flights")
-        columns = COMPLETE_FLIGHTS_COLUMNS
-        complete = complete.merge(right=metadata, on=columns.ICAO24, how="left")
-        complete = complete.replace({np.nan: None})
-
-        built_not_null = complete[columns.BUILT].isnull() == False
-        complete.loc[built_not_null, columns.BUILT] = pd.to_datetime(
-            complete.loc[built_not_null, columns.BUILT],
-            format="%Y-%m-%d",
+        aircraft = metadata.lookup(
+            codes=complete[COMPLETE_FLIGHTS_COLUMNS.ICAO24].to_numpy()
         )
-        return complete
+        return pd.concat([complete.reset_index(drop=True), aircraft], axis=1)
 
     def _transform_complete(
-        self, complete: pd.DataFrame, metadata: pd.DataFrame
+        self, complete: pd.DataFrame, metadata: MetadataIndex
     ) -> pd.DataFrame:
         valid_mask = complete[SOURCE_COLUMNS.TAKEOFF_AT] != 0
         complete = complete.loc[
@@ -132,14 +195,8 @@ class CompleteFlightsETL:
                 SOURCE_COLUMNS.LAST_CONTACT,
             ],
         ]
-
-        def get_flight_duration_minutes(row: pd.Series) -> int:
-            return math.ceil(
-                (row[SOURCE_COLUMNS.LAST_CONTACT] - row[SOURCE_COLUMNS.TAKEOFF_AT]) / 60
-            )
-
-        complete[COMPLETE_FLIGHTS_COLUMNS.FLIGHT_DURATION_MINUTES] = complete.apply(
-            get_flight_duration_minutes, axis=1, result_type="reduce"
+        complete[COMPLETE_FLIGHTS_COLUMNS.FLIGHT_DURATION_MINUTES] = (
+            self._flight_duration_minutes(complete=complete)
         )
         complete[COMPLETE_FLIGHTS_COLUMNS.LANDED_AT] = pd.to_datetime(
             complete[SOURCE_COLUMNS.LAST_CONTACT], unit="s", utc=True
@@ -152,13 +209,12 @@ class CompleteFlightsETL:
         complete = self._add_metadata(complete=complete, metadata=metadata)
         return complete
 
+    @instrumented(stage="transform")
     def _transform(
-        self, source: pd.DataFrame, metadata: pd.DataFrame
+        self, source: pd.DataFrame, metadata: MetadataIndex
     ) -> TransformedFlights:
         self._logger.info("Performing report transformation")
-        source[FLIGHT_STATUS_COLUMN] = source.apply(
-            self._determine_flight_status, axis=1
-        )
+        source[FLIGHT_STATUS_COLUMN] = self._determine_flight_statuses(source=source)
 
         active_mask = source[FLIGHT_STATUS_COLUMN] != FLIGHT_STATUSES.LANDING
         complete_mask = source[FLIGHT_STATUS_COLUMN] == FLIGHT_STATUSES.LANDING
@@ -170,18 +226,25 @@ class CompleteFlightsETL:
 
         return TransformedFlights(active=active, complete=complete)
 
+    @instrumented(stage="load")
     def _load(self, flights: TransformedFlights) -> None:
         self._logger.info("Uploading reports")
-        self.s3_bucket.upload_to_parquet(
-            df=flights.active, filename=self.source_filename
-        )
+        self.state_store.write(df=flights.active)
         self.db_client.write_flights(df=flights.complete)
 
-    def etl(self) -> None:
-        source = self._extract()
+    @instrumented(stage="etl")
+    def etl(self, source: Union[pd.DataFrame, None] = None) -> None:
+        if source is None:
+            source = self._extract()
+        elif source.empty:
+            self.state_store.write(df=source)
         if source.empty:
             self._logger.warning("Empty source report")
             return
-        metadata = self.s3_bucket.read_parquet(filename=self.meta_filename)
+        metadata = MetadataIndex.load(
+            s3_bucket=self.s3_bucket,
+            filename=self.meta_filename,
+            directory=self.index_dir,
+        )
         flights = self._transform(source=source, metadata=metadata)
         self._load(flights=flights)
@@ -0,0 +1,149 @@
+from datetime import UTC, date, datetime
+import logging
+import os
+from typing import Any, List, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from plugins.common.icao24 import with_icao24_codes
+from plugins.common.metrics import instrumented
+from plugins.common.s3 import S3BucketConnector
+from plugins.common.schema import frame_to_table
+from plugins.scripts.opensky.constants import (
+    ARCHIVE_SCHEMA,
+    SNAPSHOT_TIME,
+    STATES_ARCHIVE,
+    STATES_COLUMNS,
+)
+from plugins.scripts.opensky.decoders import StatesSnapshot
+
+
+ARCHIVE_COLUMNS = tuple(name for name in ARCHIVE_SCHEMA.names if name != SNAPSHOT_TIME)
+PARQUET_SUFFIX = ".parquet"
+
+
+class SnapshotArchive:
+    def __init__(
+        self,
+        s3_bucket: S3BucketConnector,
+        prefix: str = STATES_ARCHIVE.PREFIX,
+        row_group_size: int = STATES_ARCHIVE.ROW_GROUP_SIZE,
+        compression_level: int = STATES_ARCHIVE.COMPRESSION_LEVEL,
+        spool_dir: str = STATES_ARCHIVE.SPOOL_DIR,
+    ) -> None:
+        self.s3_bucket = s3_bucket
+        self.prefix = prefix
+        self.row_group_size = row_group_size
+        self.compression_level = compression_level
+        self.spool_dir = spool_dir
+        self._logger = logging.getLogger(__name__)
+
+    def _partition(self, day: date, hour: Union[int, None] = None) -> str:
+        partition = f"{self.prefix}/date={day.isoformat()}"
+        if hour is None:
+            return partition
+        return f"{partition}/hour={hour:02d}"
+
+    def snapshot_filename(self, time: int) -> str:
+        moment = datetime.fromtimestamp(time, tz=UTC)
+        return f"{self._partition(day=moment.date(), hour=moment.hour)}/{time}"
+
+    def daily_filename(self, day: date) -> str:
+        return f"{self._partition(day=day)}/{day.isoformat()}"
+
+    def _snapshot_filenames(self, day: date) -> List[str]:
+        keys = self.s3_bucket.list_keys(prefix=f"{self._partition(day=day)}/hour=")
+        return sorted(
+            key[: -len(PARQUET_SUFFIX)] for key in keys if key.endswith(PARQUET_SUFFIX)
+        )
+
+    def snapshot_table(self, snapshot: StatesSnapshot) -> pa.Table:
+        states = with_icao24_codes(df=snapshot.states, column=STATES_COLUMNS.ICAO24)
+        table = frame_to_table(
+            df=states.assign(**{SNAPSHOT_TIME: snapshot.time}), schema=ARCHIVE_SCHEMA
+        )
+        return table.sort_by(STATES_COLUMNS.ICAO24).replace_schema_metadata(None)
+
+    @instrumented(stage="write")
+    def write(self, snapshot: StatesSnapshot) -> None:
+        self.s3_bucket.upload_parquet_table(
+            table=self.snapshot_table(snapshot=snapshot),
+            filename=self.snapshot_filename(time=snapshot.time),
+            compression="zstd",
+        )
+
+    def _read_day(
+        self,
+        day: date,
+        columns: Union[List[str], None] = None,
+        filters: Union[List[Tuple[str, str, Any]], None] = None,
+    ) -> Tuple[pa.Table, List[str]]:
+        filenames = self._snapshot_filenames(day=day)
+        times = [int(filename.rsplit("/", 1)[1]) for filename in filenames]
+        daily_filters = list(filters or [])
+        if times:
+            daily_filters.append((SNAPSHOT_TIME, "not in", times))
+        tables = [
+            self.s3_bucket.read_parquet_table(
+                filename=self.daily_filename(day=day),
+                columns=columns,
+                filters=daily_filters or None,
+                schema=ARCHIVE_SCHEMA,
+            )
+        ]
+        for filename in filenames:
+            tables.append(
+                self.s3_bucket.read_parquet_table(
+                    filename=filename,
+                    columns=columns,
+                    filters=filters,
+                    schema=ARCHIVE_SCHEMA,
+                )
+            )
+        tables = [table for table in tables if table is not None]
+        if not tables:
+            schema = pa.schema(
+                [ARCHIVE_SCHEMA.field(name) for name in columns or ARCHIVE_SCHEMA.names]
+            )
+            return schema.empty_table(), filenames
+        return pa.concat_tables(tables), filenames
+
+    @instrumented(stage="read_day")
+    def read_day(
+        self,
+        day: date,
+        columns: Union[List[str], None] = None,
+        filters: Union[List[Tuple[str, str, Any]], None] = None,
+    ) -> pa.Table:
+        return self._read_day(day=day, columns=columns, filters=filters)[0]
+
+    @instrumented(stage="compact")
+    def compact(self, day: date) -> None:
+        table, filenames = self._read_day(day=day)
+        if not filenames:
+            self._logger.info(f"No snapshots to compact for {day.isoformat()}")
+            return
+        self._logger.info(
+            f"Compacting {len(filenames)} snapshots for {day.isoformat()}"
+        )
+        table = table.sort_by(
+            [(SNAPSHOT_TIME, "ascending"), (STATES_COLUMNS.ICAO24, "ascending")]
+        )
+        path = os.path.join(self.spool_dir, f"states-archive-{day.isoformat()}.parquet")
+        try:
+            pq.write_table(
+                table,
+                path,
+                row_group_size=self.row_group_size,
+                compression="zstd",
+                compression_level=self.compression_level,
+            )
+            self.s3_bucket.upload_parquet_file(
+                path=path, filename=self.daily_filename(day=day)
+            )
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        self.s3_bucket.delete_keys(
+            keys=[filename + PARQUET_SUFFIX for filename in filenames]
+        )
@@ -1,41 +1,270 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from hashlib import sha256
 import logging
-from typing import Union
+import os
+import random
+import time
+from typing import List, NamedTuple, Sequence, Set, Union
 import pandas as pd
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
 
 from plugins.common.exceptions import InvalidCredentials, InvalidResponseError
+from plugins.common.metrics import instrumented, record_bytes
+from plugins.scripts.opensky.constants import (
+    OPENSKY_BASE_URL,
+    OPENSKY_HTTP,
+    OpenSkyHttp,
+)
+from plugins.scripts.opensky.decoders import (
+    StatesSnapshot,
+    decode_snapshot,
+    decode_states,
+)
+
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+RETRY_STATUS_CODES = frozenset(
+    {
+        requests.codes.internal_server_error,
+        requests.codes.bad_gateway,
+        requests.codes.service_unavailable,
+        requests.codes.gateway_timeout,
+    }
+)
+
+
+class DatabaseVersion(NamedTuple):
+    etag: Union[str, None] = None
+    last_modified: Union[str, None] = None
+    content_hash: Union[str, None] = None
+
+
+class AircraftDatabase(NamedTuple):
+    path: Union[str, None]
+    version: DatabaseVersion
 
 
 class OpenSkyClient:
-    def __init__(self, auth: Union[str, None]) -> None:
+    def __init__(
+        self,
+        auth: Union[str, None],
+        http: OpenSkyHttp = OPENSKY_HTTP,
+        base_url: str = OPENSKY_BASE_URL,
+    ) -> None:
         if not isinstance(auth, str):
             raise InvalidCredentials("Opensky credentials are not valid")
         self._auth = auth
-        base_url = "http://opensky-network.org"
+        self._http = http
         self._api_url = f"{base_url}/api"
         self._metadata_url = f"{base_url}/datasets/metadata"
+        self._session = self._create_session(http=http)
         self._logger = logging.getLogger(__name__)
 
-    def get_states(self) -> dict:
+    @staticmethod
+    def _create_session(http: OpenSkyHttp) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=http.POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(
+            {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        )
+        return session
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        return random.uniform(0, self._http.BACKOFF_SECONDS * 2**attempt)
+
+    def _send(self, url: str, headers: dict, stream: bool = False) -> requests.Response:
+        return self._session.get(
+            url=url,
+            headers=headers,
+            stream=stream,
+            timeout=(
+                self._http.CONNECT_TIMEOUT_SECONDS,
+                self._http.READ_TIMEOUT_SECONDS,
+            ),
+        )
+
+    def _send_hedged(self, url: str, headers: dict) -> requests.Response:
+        if self._http.HEDGE_AFTER_SECONDS is None:
+            return self._send(url=url, headers=headers)
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            pending: Set[Future] = {executor.submit(self._send, url, headers)}
+            done, pending = wait(pending, timeout=self._http.HEDGE_AFTER_SECONDS)
+            if not done:
+                self._logger.info(f"Sending hedged request to {url}")
+                pending.add(executor.submit(self._send, url, headers))
+            errors: List[BaseException] = []
+            while done or pending:
+                for future in done:
+                    error = future.exception()
+                    if error is None:
+                        return future.result()
+                    errors.append(error)
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            raise errors[-1]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get(self, url: str, headers: dict, stream: bool = False) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                if stream:
+                    response = self._send(url=url, headers=headers, stream=True)
+                else:
+                    response = self._send_hedged(url=url, headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self._http.RETRIES:
+                    raise
+                self._logger.warning(f"Request to {url} failed: {e}")
+            else:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt >= self._http.RETRIES
+                ):
+                    return response
+                self._logger.warning(
+                    f"Request to {url} failed, status code: {response.status_code}"
+                )
+            time.sleep(self._backoff_seconds(attempt=attempt))
+            attempt += 1
+
+    @staticmethod
+    def _transferred_bytes(response: requests.Response) -> int:
+        content_length = response.headers.get("Content-Length", "")
+        if content_length.isdigit():
+            return int(content_length)
+        return response.raw.tell()
+
+    def _fetch_states(self) -> requests.Response:
         url = f"{self._api_url}/states/all"
         headers = {"Authorization": f"Basic {self._auth}"}
 
         self._logger.info("Fetching aircraft states")
-        response = requests.get(url=url, headers=headers, timeout=5)
+        response = self._get(url=url, headers=headers)
 
         rate_limit_remaining = response.headers.get("X-Rate-Limit-Remaining")
         self._logger.info(f"Rate limit remaining: {rate_limit_remaining}")
 
         if response.status_code == requests.codes.ok:
-            return response.json()
+            record_bytes(count=self._transferred_bytes(response=response))
+            return response
 
         raise InvalidResponseError(
             f"Failed to fetch states, status code: {response.status_code}"
         )
 
-    def get_aircraft_database(self) -> pd.DataFrame:
+    def get_states(self) -> dict:
+        return self._fetch_states().json()
+
+    @instrumented(stage="get_states_frame")
+    def get_states_frame(self, columns: Sequence[str]) -> pd.DataFrame:
+        response = self._fetch_states()
+        return decode_states(payload=response.content, columns=columns)
+
+    @instrumented(stage="get_states_snapshot")
+    def get_states_snapshot(self, columns: Sequence[str]) -> StatesSnapshot:
+        response = self._fetch_states()
+        return decode_snapshot(payload=response.content, columns=columns)
+
+    @staticmethod
+    def _file_hash(path: str) -> str:
+        digest = sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _read_partial_etag(self, partial_path: str) -> Union[str, None]:
+        etag_path = f"{partial_path}.etag"
+        if not (os.path.exists(partial_path) and os.path.exists(etag_path)):
+            return None
+        with open(etag_path) as file:
+            return file.read() or None
+
+    def _start_partial(self, partial_path: str, etag: Union[str, None]) -> None:
+        with open(f"{partial_path}.etag", "w") as file:
+            file.write(etag or "")
+        open(partial_path, "wb").close()
+
+    def _remove_partial(self, partial_path: str) -> None:
+        for path in (partial_path, f"{partial_path}.etag"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @instrumented(stage="get_aircraft_database")
+    def get_aircraft_database(
+        self, version: DatabaseVersion, path: str
+    ) -> AircraftDatabase:
         url = f"{self._metadata_url}/aircraftDatabase.csv"
+        conditional_headers = {"Accept-Encoding": "identity"}
+        if version.etag:
+            conditional_headers["If-None-Match"] = version.etag
+        if version.last_modified:
+            conditional_headers["If-Modified-Since"] = version.last_modified
+        partial_path = f"{path}.part"
+
         self._logger.info("Fetching aircraft database")
-        df = pd.read_csv(url)
-        return df
+        attempt = 0
+        while True:
+            headers = dict(conditional_headers)
+            partial_etag = self._read_partial_etag(partial_path=partial_path)
+            offset = os.path.getsize(partial_path) if partial_etag else 0
+            if offset:
+                self._logger.info(f"Resuming aircraft database download at {offset}")
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = partial_etag
+
+            response = self._get(url=url, headers=headers, stream=True)
+            with response:
+                if response.status_code == requests.codes.not_modified:
+                    self._remove_partial(partial_path=partial_path)
+                    return AircraftDatabase(path=None, version=version)
+                if response.status_code == requests.codes.requested_range:
+                    self._remove_partial(partial_path=partial_path)
+                    continue
+                if response.status_code == requests.codes.ok:
+                    self._start_partial(
+                        partial_path=partial_path, etag=response.headers.get("ETag")
+                    )
+                elif response.status_code != requests.codes.partial_content:
+                    raise InvalidResponseError(
+                        "Failed to fetch aircraft database, "
+                        f"status code: {response.status_code}"
+                    )
+                try:
+                    with open(partial_path, "ab") as file:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            file.write(chunk)
+                            record_bytes(count=len(chunk))
+                except (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    ChunkedEncodingError,
+                ) as e:
+                    if attempt >= self._http.RETRIES:
+                        raise
+                    self._logger.warning(f"Aircraft database download failed: {e}")
+                    time.sleep(self._backoff_seconds(attempt=attempt))
+                    attempt += 1
+                    continue
+
+            os.replace(partial_path, path)
+            self._remove_partial(partial_path=partial_path)
+            return AircraftDatabase(
+                path=path,
+                version=DatabaseVersion(
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    content_hash=self._file_hash(path=path),
+                ),
+            )
@@ -1,5 +1,15 @@
 import os
-from typing import NamedTuple
+import tempfile
+from typing import NamedTuple, Union
+
+import pyarrow as pa
+
+
+def to_float_or_none(value: str) -> Union[float, None]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
 
 
 class StatesColumns(NamedTuple):
@@ -22,5 +32,77 @@ class StatesColumns(NamedTuple):
     POSITION_SOURCE: str = "position_source"
 
 
+class OpenSkyHttp(NamedTuple):
+    CONNECT_TIMEOUT_SECONDS: float
+    READ_TIMEOUT_SECONDS: float
+    RETRIES: int
+    BACKOFF_SECONDS: float
+    HEDGE_AFTER_SECONDS: Union[float, None]
+    POOL_SIZE: int
+
+
+class StatesArchive(NamedTuple):
+    ENABLED: bool
+    PREFIX: str
+    ROW_GROUP_SIZE: int
+    COMPRESSION_LEVEL: int
+    SPOOL_DIR: str
+
+
 STATES_COLUMNS = StatesColumns()
+SNAPSHOT_TIME = "time"
+ARCHIVE_SCHEMA = pa.schema(
+    [
+        pa.field(SNAPSHOT_TIME, pa.int32(), nullable=False),
+        pa.field(STATES_COLUMNS.ICAO24, pa.uint32(), nullable=False),
+        pa.field(STATES_COLUMNS.CALLSIGN, pa.string()),
+        pa.field(STATES_COLUMNS.ORIGIN_COUNTRY, pa.string()),
+        pa.field(STATES_COLUMNS.TIME_POSITION, pa.int32()),
+        pa.field(STATES_COLUMNS.LAST_CONTACT, pa.int32()),
+        pa.field(STATES_COLUMNS.LONGITUDE, pa.float32()),
+        pa.field(STATES_COLUMNS.LATITUDE, pa.float32()),
+        pa.field(STATES_COLUMNS.BARO_ALTITUDE, pa.float32()),
+        pa.field(STATES_COLUMNS.ON_GROUND, pa.bool_()),
+        pa.field(STATES_COLUMNS.VELOCITY, pa.float32()),
+        pa.field(STATES_COLUMNS.TRUE_TRACK, pa.float32()),
+        pa.field(STATES_COLUMNS.VERTICAL_RATE, pa.float32()),
+        pa.field(STATES_COLUMNS.GEO_ALTITUDE, pa.float32()),
+        pa.field(STATES_COLUMNS.SQUAWK, pa.string()),
+        pa.field(STATES_COLUMNS.SPI, pa.bool_()),
+        pa.field(STATES_COLUMNS.POSITION_SOURCE, pa.int8()),
+    ]
+)
 OPENSKY_AUTH = os.getenv(key="OPENSKY_AUTH", default=None)
+OPENSKY_BASE_URL = os.getenv(
+    key="OPENSKY_BASE_URL", default="http://opensky-network.org"
+)
+OPENSKY_HTTP = OpenSkyHttp(
+    CONNECT_TIMEOUT_SECONDS=float(
+        os.getenv(key="OPENSKY_CONNECT_TIMEOUT_SECONDS", default="3.05")
+    ),
+    READ_TIMEOUT_SECONDS=float(
+        os.getenv(key="OPENSKY_READ_TIMEOUT_SECONDS", default="10")
+    ),
+    RETRIES=int(os.getenv(key="OPENSKY_RETRIES", default="2")),
+    BACKOFF_SECONDS=float(os.getenv(key="OPENSKY_BACKOFF_SECONDS", default="0.5")),
+    HEDGE_AFTER_SECONDS=to_float_or_none(
+        os.getenv(key="OPENSKY_HEDGE_AFTER_SECONDS", default="")
+    ),
+    POOL_SIZE=int(os.getenv(key="OPENSKY_POOL_SIZE", default="4")),
+)
+METADATA_SPOOL_DIR = os.getenv(key="METADATA_SPOOL_DIR", default=tempfile.gettempdir())
+METADATA_BLOCK_SIZE = int(os.getenv(key="METADATA_BLOCK_SIZE", default=str(4 << 20)))
+METADATA_ROW_GROUP_SIZE = int(
+    os.getenv(key="METADATA_ROW_GROUP_SIZE", default=str(128 * 1024))
+)
+STATES_ARCHIVE = StatesArchive(
+    ENABLED=os.getenv(key="STATES_ARCHIVE_ENABLED", default="false").lower() == "true",
+    PREFIX=os.getenv(key="STATES_ARCHIVE_PREFIX", default="states-archive"),
+    ROW_GROUP_SIZE=int(
+        os.getenv(key="STATES_ARCHIVE_ROW_GROUP_SIZE", default=str(1 << 20))
+    ),
+    COMPRESSION_LEVEL=int(
+        os.getenv(key="STATES_ARCHIVE_COMPRESSION_LEVEL", default="9")
+    ),
+    SPOOL_DIR=os.getenv(key="STATES_ARCHIVE_SPOOL_DIR", default=tempfile.gettempdir()),
+)
@@ -0,0 +1,162 @@
+import json
+from json.scanner import make_scanner
+from operator import itemgetter
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from plugins.common.exceptions import InvalidResponseError
+from plugins.scripts.opensky.constants import STATES_COLUMNS
+
+
+STATES_DTYPES: Dict[str, Any] = {
+    STATES_COLUMNS.TIME_POSITION: np.float64,
+    STATES_COLUMNS.LAST_CONTACT: np.int64,
+    STATES_COLUMNS.LONGITUDE: np.float64,
+    STATES_COLUMNS.LATITUDE: np.float64,
+    STATES_COLUMNS.BARO_ALTITUDE: np.float64,
+    STATES_COLUMNS.VELOCITY: np.float64,
+    STATES_COLUMNS.TRUE_TRACK: np.float64,
+    STATES_COLUMNS.VERTICAL_RATE: np.float64,
+    STATES_COLUMNS.GEO_ALTITUDE: np.float64,
+}
+STATES_FILLS: Dict[str, Any] = {STATES_COLUMNS.LAST_CONTACT: 0}
+
+
+class StatesSnapshot(NamedTuple):
+    time: int
+    states: pd.DataFrame
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_WHITESPACE_CHARS = frozenset(" \t\n\r")
+_DECODER = json.JSONDecoder()
+_SCAN = make_scanner(_DECODER)
+
+
+class _Cursor:
+    def __init__(self, document: str) -> None:
+        self.document = document
+        self.position = 0
+
+    def skip_whitespace(self) -> str:
+        match = _WHITESPACE.match(self.document, self.position)
+        if match:
+            self.position = match.end()
+        return self.document[self.position : self.position + 1]
+
+    def expect(self, token: str) -> None:
+        if self.skip_whitespace() != token:
+            raise InvalidResponseError(
+                f"Expected '{token}' at position {self.position} of states response"
+            )
+        self.position += 1
+
+    def value(self) -> Any:
+        self.skip_whitespace()
+        value, self.position = _DECODER.raw_decode(self.document, self.position)
+        return value
+
+
+def _row_getter(indices: List[int]) -> Callable[[list], Tuple[Any, ...]]:
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda row: (row[index],)
+    return itemgetter(*indices)
+
+
+def _projected_rows(
+    cursor: _Cursor, getter: Callable[[list], Tuple[Any, ...]]
+) -> List[Tuple[Any, ...]]:
+    rows: List[Tuple[Any, ...]] = []
+    if cursor.skip_whitespace() == "n":
+        if cursor.value() is not None:
+            raise InvalidResponseError("States must be a list")
+        return rows
+    cursor.expect("[")
+    if cursor.skip_whitespace() == "]":
+        cursor.position += 1
+        return rows
+
+    document = cursor.document
+    position = cursor.position
+    width = len(STATES_COLUMNS)
+    append = rows.append
+    while True:
+        try:
+            row, position = _SCAN(document, position)
+        except StopIteration as e:
+            raise json.JSONDecodeError("Expecting value", document, e.value)
+        if row.__class__ is not list or len(row) != width:
+            raise InvalidResponseError(
+                f"State must be a list of {width} values, got: {row!r}"
+            )
+        append(getter(row))
+        if document[position : position + 1] == ",":
+            position += 1
+            if document[position : position + 1] in _WHITESPACE_CHARS:
+                cursor.position = position
+                cursor.skip_whitespace()
+                position = cursor.position
+            continue
+        cursor.position = position
+        cursor.expect("]")
+        return rows
+
+
+def _to_frame(rows: List[Tuple[Any, ...]], columns: Sequence[str]) -> pd.DataFrame:
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    data = {}
+    for column, column_values in zip(columns, values):
+        dtype = STATES_DTYPES.get(column, object)
+        if column in STATES_FILLS and None in column_values:
+            fill = STATES_FILLS[column]
+            column_values = [fill if v is None else v for v in column_values]
+        try:
+            data[column] = np.array(column_values, dtype=dtype)
+        except (TypeError, ValueError) as e:
+            raise InvalidResponseError(f"Invalid {column} value: {e}")
+    return pd.DataFrame(data=data, columns=list(columns))
+
+
+def _decode(payload: bytes, columns: Sequence[str]) -> Tuple[Any, pd.DataFrame]:
+    unknown = [column for column in columns if column not in STATES_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown states columns: {unknown}")
+    getter = _row_getter([STATES_COLUMNS.index(column) for column in columns])
+
+    try:
+        cursor = _Cursor(document=payload.decode("utf-8"))
+        cursor.expect("{")
+        time, rows = None, None
+        if cursor.skip_whitespace() != "}":
+            while True:
+                key = cursor.value()
+                cursor.expect(":")
+                if key == "states":
+                    rows = _projected_rows(cursor=cursor, getter=getter)
+                elif key == "time":
+                    time = cursor.value()
+                else:
+                    cursor.value()
+                if cursor.skip_whitespace() == "}":
+                    break
+                cursor.expect(",")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise InvalidResponseError(e)
+
+    if rows is None:
+        raise InvalidResponseError("Response lacks states")
+    return time, _to_frame(rows=rows, columns=columns)
+
+
+def decode_states(payload: bytes, columns: Sequence[str]) -> pd.DataFrame:
+    return _decode(payload=payload, columns=columns)[1]
+
+
+def decode_snapshot(payload: bytes, columns: Sequence[str]) -> StatesSnapshot:
+    time, states = _decode(payload=payload, columns=columns)
+    if time.__class__ is not int:
+        raise InvalidResponseError(f"Invalid snapshot time: {time!r}")
+    return StatesSnapshot(time=time, states=states)
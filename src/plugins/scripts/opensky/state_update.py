@@ -0,0 +1,116 @@
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+from plugins.common.constants import SOURCE_COLUMNS
+from plugins.common.icao24 import ICAO24_DTYPE
+
+
+Rows = Tuple[np.ndarray, np.ndarray]
+
+
+def _sorted_keys(df: pd.DataFrame) -> Tuple[np.ndarray, Union[np.ndarray, None]]:
+    keys = df[SOURCE_COLUMNS.ICAO24].to_numpy(dtype=ICAO24_DTYPE)
+    if keys.size < 2 or (keys[1:] >= keys[:-1]).all():
+        return keys, None
+    order = np.argsort(keys, kind="stable")
+    return keys[order], order
+
+
+def _merge_positions(
+    left: np.ndarray, right: np.ndarray
+) -> Tuple[np.ndarray, Rows, Rows]:
+    keys = np.concatenate((left, right))
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    first = np.ones(keys.size, dtype=bool)
+    np.not_equal(keys[1:], keys[:-1], out=first[1:])
+    positions = np.cumsum(first)
+    positions -= 1
+    from_left = order < left.size
+    right_rows = order[~from_left]
+    right_rows -= left.size
+    return (
+        keys[first],
+        (positions[from_left], order[from_left]),
+        (positions[~from_left], right_rows),
+    )
+
+
+def _source_rows(rows: Rows, order: Union[np.ndarray, None]) -> Rows:
+    positions, source_rows = rows
+    return (positions, source_rows if order is None else order[source_rows])
+
+
+def _take(values: np.ndarray, rows: Rows, out: np.ndarray) -> np.ndarray:
+    positions, source_rows = rows
+    out[positions] = values[source_rows]
+    return out
+
+
+def _integers(values: np.ndarray) -> pd.arrays.IntegerArray:
+    return pd.arrays.IntegerArray(values, np.zeros(values.size, dtype=bool))
+
+
+def merge_states(states: pd.DataFrame, active_flights: pd.DataFrame) -> pd.DataFrame:
+    state_keys, state_order = _sorted_keys(df=states)
+    flight_keys, flight_order = _sorted_keys(df=active_flights)
+    keys, state_rows, flight_rows = _merge_positions(left=state_keys, right=flight_keys)
+    state_rows = _source_rows(rows=state_rows, order=state_order)
+    flight_rows = _source_rows(rows=flight_rows, order=flight_order)
+
+    last_contact = _take(
+        values=states[SOURCE_COLUMNS.LAST_CONTACT].to_numpy(dtype=np.int32, na_value=0),
+        rows=state_rows,
+        out=np.zeros(keys.size, dtype=np.int32),
+    )
+    velocity, vertical_rate = (
+        _take(
+            values=states[column].to_numpy(dtype=np.float32, na_value=0),
+            rows=state_rows,
+            out=np.zeros(keys.size, dtype=np.float32),
+        )
+        for column in (SOURCE_COLUMNS.VELOCITY, SOURCE_COLUMNS.VERTICAL_RATE)
+    )
+    takeoff_at, flight_last_contact = (
+        _take(
+            values=active_flights[column].to_numpy(dtype=np.int32, na_value=0),
+            rows=flight_rows,
+            out=np.zeros(keys.size, dtype=np.int32),
+        )
+        for column in (SOURCE_COLUMNS.TAKEOFF_AT, SOURCE_COLUMNS.FLIGHT_LAST_CONTACT)
+    )
+    np.copyto(flight_last_contact, last_contact, where=last_contact != 0)
+
+    trajectory = active_flights[SOURCE_COLUMNS.FLIGHT_TRAJECTORY]
+    trajectory = (
+        trajectory.array
+        if isinstance(trajectory.dtype, pd.CategoricalDtype)
+        else pd.Categorical(trajectory)
+    )
+    trajectory_codes = _take(
+        values=trajectory.codes,
+        rows=flight_rows,
+        out=np.full(keys.size, -1, dtype=trajectory.codes.dtype),
+    )
+    is_first_contact = _take(
+        values=pd.isna(active_flights[SOURCE_COLUMNS.IS_FIRST_CONTACT]).to_numpy(),
+        rows=flight_rows,
+        out=np.ones(keys.size, dtype=bool),
+    )
+
+    return pd.DataFrame(
+        data={
+            SOURCE_COLUMNS.ICAO24: keys,
+            SOURCE_COLUMNS.LAST_CONTACT: _integers(values=last_contact),
+            SOURCE_COLUMNS.VELOCITY: velocity,
+            SOURCE_COLUMNS.VERTICAL_RATE: vertical_rate,
+            SOURCE_COLUMNS.TAKEOFF_AT: _integers(values=takeoff_at),
+            SOURCE_COLUMNS.FLIGHT_LAST_CONTACT: _integers(values=flight_last_contact),
+            SOURCE_COLUMNS.FLIGHT_TRAJECTORY: pd.Categorical.from_codes(
+                codes=trajectory_codes, dtype=trajectory.dtype
+            ),
+            SOURCE_COLUMNS.IS_FIRST_CONTACT: is_first_contact,
+        },
+        copy=False,
+    )
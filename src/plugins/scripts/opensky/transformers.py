@@ -1,18 +1,36 @@
 from datetime import UTC, datetime, timedelta
 import logging
-from typing import NamedTuple
+import os
+from typing import Iterable, Iterator, List, NamedTuple, Union
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+import pyarrow.parquet as pq
 from plugins.common.constants import (
     ACTIVE_FLIGHTS_COLUMNS,
     META_COLUMNS,
-    SOURCE_COLUMNS,
 )
-from plugins.common.exceptions import InvalidResponseError, InvalidSource
+from plugins.common.icao24 import encode_icao24, with_icao24_codes
+from plugins.common.metrics import instrumented, record_error
 from plugins.common.s3 import S3BucketConnector
-from plugins.scripts.complete_flights.constants import COMPLETE_FLIGHTS_COLUMNS
-from plugins.scripts.opensky.client import OpenSkyClient
-from plugins.scripts.opensky.constants import STATES_COLUMNS
+from plugins.common.schema import parse_dates
+from plugins.common.state import S3ParquetStateStore, StateStore
+from plugins.scripts.complete_flights.constants import (
+    COMPLETE_FLIGHTS_COLUMNS,
+    METAFILE_SCHEMA,
+)
+from plugins.scripts.opensky.archive import ARCHIVE_COLUMNS, SnapshotArchive
+from plugins.scripts.opensky.client import DatabaseVersion, OpenSkyClient
+from plugins.scripts.opensky.constants import (
+    METADATA_BLOCK_SIZE,
+    METADATA_ROW_GROUP_SIZE,
+    METADATA_SPOOL_DIR,
+    STATES_COLUMNS,
+)
+from plugins.scripts.opensky.decoders import StatesSnapshot
+from plugins.scripts.opensky.state_update import merge_states
 
 
 class SourceReports(NamedTuple):
@@ -28,127 +46,111 @@ class ActiveFlightsETL:
         s3_bucket: S3BucketConnector,
         opensky_client: OpenSkyClient,
         source_filename: str,
+        state_store: Union[StateStore, None] = None,
+        archive: Union[SnapshotArchive, None] = None,
     ) -> None:
         self.s3_bucket = s3_bucket
         self.opensky_client = opensky_client
         self.source_filename = source_filename
+        self.state_store = state_store or S3ParquetStateStore(
+            s3_bucket=s3_bucket, filename=source_filename
+        )
+        self.archive = archive
+        self._pending_snapshot: Union[StatesSnapshot, None] = None
         self._logger = logging.getLogger(__name__)
 
     def _extract_opensky_states(self) -> pd.DataFrame:
-        states_response = self.opensky_client.get_states()
-        try:
-            states = states_response["states"]
-        except KeyError as e:
-            raise InvalidResponseError(e)
-
-        try:
-            states = pd.DataFrame(data=states, columns=STATES_COLUMNS)
-        except ValueError as e:
-            raise InvalidResponseError(e)
-
-        states = states[
-            [
-                STATES_COLUMNS.ICAO24,
-                STATES_COLUMNS.LAST_CONTACT,
-                STATES_COLUMNS.VELOCITY,
-                STATES_COLUMNS.VERTICAL_RATE,
-            ]
+        columns = [
+            STATES_COLUMNS.ICAO24,
+            STATES_COLUMNS.LAST_CONTACT,
+            STATES_COLUMNS.VELOCITY,
+            STATES_COLUMNS.VERTICAL_RATE,
         ]
+        if self.archive is None:
+            states = self.opensky_client.get_states_frame(columns=columns)
+            return with_icao24_codes(df=states, column=STATES_COLUMNS.ICAO24)
+        snapshot = self.opensky_client.get_states_snapshot(columns=ARCHIVE_COLUMNS)
+        states = with_icao24_codes(df=snapshot.states, column=STATES_COLUMNS.ICAO24)
+        self._pending_snapshot = snapshot._replace(states=states)
+        return states[columns]
 
-        return states
+    def _inactivity_limit(self) -> int:
+        return round(
+            (
+                datetime.now(tz=UTC)
+                - timedelta(minutes=self.__class__.INACTIVITY_MAX_MINUTES)
+            ).timestamp()
+        )
 
     def _extract_latest_source(self) -> pd.DataFrame:
-        latest_source = self.s3_bucket.read_parquet(filename=self.source_filename)
+        latest_source = self.state_store.read(
+            columns=tuple(ACTIVE_FLIGHTS_COLUMNS),
+            filters=[
+                (
+                    ACTIVE_FLIGHTS_COLUMNS.FLIGHT_LAST_CONTACT,
+                    ">",
+                    self._inactivity_limit(),
+                )
+            ],
+        )
         if latest_source.empty:
-            latest_source = pd.DataFrame(columns=tuple(SOURCE_COLUMNS))
-        elif not pd.Series(tuple(SOURCE_COLUMNS)).isin(latest_source.columns).all():
-            raise InvalidSource("Latest source dataframe lacks required columns")
-        return latest_source
+            latest_source = pd.DataFrame(columns=tuple(ACTIVE_FLIGHTS_COLUMNS))
+        return with_icao24_codes(df=latest_source)
 
     def _active_flights_from_source(self, source: pd.DataFrame) -> pd.DataFrame:
         active_flights = source[list(ACTIVE_FLIGHTS_COLUMNS)]
         return active_flights
 
-    def _update_flight_last_contact(self, source: pd.DataFrame) -> pd.DataFrame:
-        valid_last_contact_mask = source[SOURCE_COLUMNS.LAST_CONTACT] != 0
-        source.loc[valid_last_contact_mask, SOURCE_COLUMNS.FLIGHT_LAST_CONTACT] = (
-            source[SOURCE_COLUMNS.LAST_CONTACT]
-        )
-        return source
-
-    def _define_first_contact(self, source: pd.DataFrame) -> pd.DataFrame:
-        source[[SOURCE_COLUMNS.IS_FIRST_CONTACT]] = source[
-            [SOURCE_COLUMNS.IS_FIRST_CONTACT]
-        ].replace(to_replace=[pd.NA, True], value=[True, False])
-        return source
-
     def _remove_inactive(self, active_flights: pd.DataFrame) -> pd.DataFrame:
-        inactivity_limit = round(
-            (
-                datetime.now(tz=UTC)
-                - timedelta(minutes=self.__class__.INACTIVITY_MAX_MINUTES)
-            ).timestamp()
-        )
         active_mask = (
             active_flights[ACTIVE_FLIGHTS_COLUMNS.FLIGHT_LAST_CONTACT]
-            > inactivity_limit
+            > self._inactivity_limit()
         )
         active = active_flights.loc[active_mask]
         return active
 
+    @instrumented(stage="extract")
     def _extract(self) -> SourceReports:
         self._logger.info("Extracting Opensky states")
         states = self._extract_opensky_states()
         latest_source = self._extract_latest_source()
         return SourceReports(states=states, latest_source=latest_source)
 
+    @instrumented(stage="transform")
     def _transform(self, source_reports: SourceReports) -> pd.DataFrame:
         self._logger.info("Performing Opensky states transformation")
         active_flights = self._active_flights_from_source(
             source=source_reports.latest_source
         )
         active_flights = self._remove_inactive(active_flights=active_flights)
-        source = source_reports.states.merge(
-            active_flights, how="outer", on=SOURCE_COLUMNS.ICAO24
-        )
-        source[
-            [
-                SOURCE_COLUMNS.LAST_CONTACT,
-                SOURCE_COLUMNS.VELOCITY,
-                SOURCE_COLUMNS.VERTICAL_RATE,
-                SOURCE_COLUMNS.TAKEOFF_AT,
-                SOURCE_COLUMNS.FLIGHT_LAST_CONTACT,
-            ]
-        ] = source[
-            [
-                SOURCE_COLUMNS.LAST_CONTACT,
-                SOURCE_COLUMNS.VELOCITY,
-                SOURCE_COLUMNS.VERTICAL_RATE,
-                SOURCE_COLUMNS.TAKEOFF_AT,
-                SOURCE_COLUMNS.FLIGHT_LAST_CONTACT,
-            ]
-        ].fillna(
-            0
-        )
-        source = source.astype(
-            {
-                SOURCE_COLUMNS.LAST_CONTACT: pd.Int32Dtype(),
-                SOURCE_COLUMNS.TAKEOFF_AT: pd.Int32Dtype(),
-                SOURCE_COLUMNS.FLIGHT_LAST_CONTACT: pd.Int32Dtype(),
-            }
-        )
-        source = self._define_first_contact(source=source)
-        source = self._update_flight_last_contact(source=source)
-        return source
+        return merge_states(states=source_reports.states, active_flights=active_flights)
 
+    @instrumented(stage="load")
     def _load(self, source: pd.DataFrame) -> None:
         self._logger.info("Uploading source report")
-        self.s3_bucket.upload_to_parquet(df=source, filename=self.source_filename)
+        self.state_store.write(df=source)
 
-    def etl(self) -> None:
+    @instrumented(stage="archive")
+    def archive_snapshot(self) -> None:
+        snapshot, self._pending_snapshot = self._pending_snapshot, None
+        if snapshot is None:
+            return
+        try:
+            self.archive.write(snapshot=snapshot)
+        except Exception as e:
+            record_error()
+            self._logger.warning(
+                f"Failed to archive states snapshot {snapshot.time}: {e}"
+            )
+
+    @instrumented(stage="etl")
+    def etl(self, load: bool = True) -> pd.DataFrame:
         source_reports = self._extract()
         source = self._transform(source_reports=source_reports)
-        self._load(source=source)
+        if load:
+            self._load(source=source)
+            self.archive_snapshot()
+        return source
 
 
 class MetadataETL:
@@ -157,42 +159,161 @@ class MetadataETL:
         s3_bucket: S3BucketConnector,
         opensky_client: OpenSkyClient,
         meta_filename: str,
+        spool_dir: str = METADATA_SPOOL_DIR,
     ) -> None:
         self._s3_bucket = s3_bucket
         self._opensky_client = opensky_client
         self.meta_filename = meta_filename
+        self.version_filename = f"{meta_filename}-version"
+        self.spool_dir = spool_dir
         self._logger = logging.getLogger(__name__)
 
-    def _extract(self) -> pd.DataFrame:
+    def _extract_version(self) -> DatabaseVersion:
+        if self._s3_bucket.get_parquet_etag(filename=self.meta_filename) is None:
+            self._logger.warning("Metafile missing. Rebuilding from full database")
+            return DatabaseVersion()
+        stored_version = self._s3_bucket.read_json(filename=self.version_filename)
+        return DatabaseVersion(
+            **{field: stored_version.get(field) for field in DatabaseVersion._fields}
+        )
+
+    @instrumented(stage="extract")
+    def _extract(self, path: str) -> pa_csv.CSVStreamingReader:
         self._logger.info("Extracting metadata")
-        source_metadata = self._opensky_client.get_aircraft_database()
-        return source_metadata
+        source_columns = [
+            META_COLUMNS.ICAO24,
+            META_COLUMNS.REGISTRATION,
+            META_COLUMNS.MODEL,
+            META_COLUMNS.MANUFACTURER_ICAO,
+            META_COLUMNS.OWNER,
+            META_COLUMNS.OPERATOR,
+            META_COLUMNS.BUILT,
+        ]
+        return pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(
+                use_threads=True, block_size=METADATA_BLOCK_SIZE
+            ),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=source_columns,
+                column_types={column: pa.string() for column in source_columns},
+                strings_can_be_null=True,
+            ),
+        )
 
-    def _transform(self, source_metadata: pd.DataFrame) -> pd.DataFrame:
-        self._logger.info("Performing Opensky metadata transformation")
-        source_columns = META_COLUMNS
+    def _transform_batch(self, batch: pa.RecordBatch) -> pa.RecordBatch:
         columns = COMPLETE_FLIGHTS_COLUMNS
-        metadata = source_metadata[
-            [
-                META_COLUMNS.ICAO24,
-                META_COLUMNS.REGISTRATION,
-                META_COLUMNS.MODEL,
-                META_COLUMNS.MANUFACTURER_ICAO,
-                META_COLUMNS.OWNER,
-                META_COLUMNS.OPERATOR,
-                META_COLUMNS.BUILT,
-            ]
-        ]
-        metadata = metadata.rename(
-            columns={source_columns.MANUFACTURER_ICAO: columns.MANUFACTURER_ICAO},
+        renamed = {META_COLUMNS.MANUFACTURER_ICAO: columns.MANUFACTURER_ICAO}
+        batch = pa.RecordBatch.from_arrays(
+            batch.columns,
+            names=[renamed.get(name, name) for name in batch.schema.names],
         )
-        return metadata
+        codes, valid = encode_icao24(values=batch.column(columns.ICAO24))
+        batch = batch.filter(pa.array(valid))
+        arrays = {name: batch.column(name) for name in METAFILE_SCHEMA.names}
+        arrays[columns.ICAO24] = pa.array(codes[valid], type=pa.uint32())
+        arrays[columns.BUILT] = parse_dates(values=arrays[columns.BUILT])
+        return pa.RecordBatch.from_arrays(
+            list(arrays.values()), names=list(arrays.keys())
+        )
+
+    def _deduplicate(self, metadata: pa.Table) -> pa.Table:
+        codes = metadata.column(COMPLETE_FLIGHTS_COLUMNS.ICAO24).to_numpy()
+        order = np.argsort(codes, kind="stable")
+        _, first = np.unique(codes[order], return_index=True)
+        if len(first) < len(codes):
+            self._logger.warning(
+                f"Dropped {len(codes) - len(first)} aircraft with duplicate icao24"
+            )
+        return metadata.take(pa.array(order[first]))
+
+    def _encode_dictionaries(self, metadata: pa.Table) -> pa.Table:
+        arrays = [
+            (
+                metadata.column(field.name).dictionary_encode().cast(field.type)
+                if pa.types.is_dictionary(field.type)
+                else metadata.column(field.name)
+            )
+            for field in METAFILE_SCHEMA
+        ]
+        return pa.Table.from_arrays(arrays, schema=METAFILE_SCHEMA)
+
+    @instrumented(stage="transform")
+    def _transform(
+        self, source_metadata: Iterable[pa.RecordBatch]
+    ) -> Iterator[pa.RecordBatch]:
+        self._logger.info("Performing Opensky metadata transformation")
+        batches = []
+        malformed = 0
+        for batch in source_metadata:
+            transformed = self._transform_batch(batch=batch)
+            malformed += batch.num_rows - transformed.num_rows
+            batches.append(transformed)
+        if malformed:
+            self._logger.warning(f"Dropped {malformed} aircraft with malformed icao24")
+        if not batches:
+            return
+        metadata = self._deduplicate(metadata=pa.Table.from_batches(batches))
+        metadata = self._encode_dictionaries(metadata=metadata)
+        yield from metadata.to_batches(max_chunksize=METADATA_ROW_GROUP_SIZE)
 
-    def _load(self, metadata: pd.DataFrame) -> None:
+    @instrumented(stage="load")
+    def _load(self, metadata: Iterable[pa.RecordBatch], path: str) -> None:
         self._logger.info("Uploading metadata")
-        self._s3_bucket.upload_to_parquet(df=metadata, filename=self.meta_filename)
+        writer: Union[pq.ParquetWriter, None] = None
+        row_group: List[pa.RecordBatch] = []
+        row_group_rows = 0
+        try:
+            for batch in metadata:
+                if writer is None:
+                    writer = pq.ParquetWriter(path, schema=batch.schema)
+                row_group.append(batch)
+                row_group_rows += batch.num_rows
+                if row_group_rows >= METADATA_ROW_GROUP_SIZE:
+                    writer.write_table(
+                        pa.Table.from_batches(row_group),
+                        row_group_size=METADATA_ROW_GROUP_SIZE,
+                    )
+                    row_group, row_group_rows = [], 0
+            if writer is not None and row_group:
+                writer.write_table(
+                    pa.Table.from_batches(row_group),
+                    row_group_size=METADATA_ROW_GROUP_SIZE,
+                )
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            self._logger.warning("Empty metadata. Nothing to upload")
+            return
+        self._s3_bucket.upload_parquet_file(path=path, filename=self.meta_filename)
+
+    def _load_version(self, version: DatabaseVersion) -> None:
+        self._s3_bucket.upload_json(
+            data=version._asdict(), filename=self.version_filename
+        )
 
+    @instrumented(stage="etl")
     def etl(self) -> None:
-        source_metadata = self._extract()
-        metadata = self._transform(source_metadata=source_metadata)
-        self._load(metadata=metadata)
+        stored_version = self._extract_version()
+        database_path = os.path.join(self.spool_dir, "aircraftDatabase.csv")
+        metadata_path = os.path.join(self.spool_dir, f"{self.meta_filename}.parquet")
+        database = self._opensky_client.get_aircraft_database(
+            version=stored_version, path=database_path
+        )
+        if database.path is None:
+            self._logger.info("Aircraft database not modified")
+            return
+        try:
+            if database.version.content_hash != stored_version.content_hash:
+                source_metadata = self._extract(path=database.path)
+                metadata = self._transform(source_metadata=source_metadata)
+                self._load(metadata=metadata, path=metadata_path)
+            else:
+                self._logger.info("Aircraft database content unchanged")
+            self._load_version(version=database.version)
+        finally:
+            for path in (database.path, metadata_path):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,17 @@
+import os
+from typing import NamedTuple
+
+
+class Replay(NamedTuple):
+    WORKERS: int
+    CHUNK_HOURS: int
+    COLLECTION: str
+    PREFIX: str
+
+
+REPLAY = Replay(
+    WORKERS=int(os.getenv(key="REPLAY_WORKERS", default=str(os.cpu_count() or 1))),
+    CHUNK_HOURS=int(os.getenv(key="REPLAY_CHUNK_HOURS", default="24")),
+    COLLECTION=os.getenv(key="REPLAY_COLLECTION", default="flights_replay"),
+    PREFIX=os.getenv(key="REPLAY_PREFIX", default="replay"),
+)
@@ -0,0 +1,371 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import UTC, datetime, timedelta
+from itertools import repeat
+import logging
+from time import perf_counter
+from typing import Iterator, List, NamedTuple, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from plugins.common.constants import (
+    SOURCE_COLUMNS,
+    SOURCE_SCHEMA,
+    S3RolesAnywhere,
+    S3Sts,
+)
+from plugins.common.icao24 import ICAO24_DTYPE
+from plugins.common.metrics import instrumented
+from plugins.common.s3 import S3BucketConnector
+from plugins.common.state import MemoryStateStore
+from plugins.scripts.complete_flights.constants import (
+    COMPLETE_FLIGHTS_COLUMNS,
+    METADATA_INDEX_DIR,
+    MONGODB,
+)
+from plugins.scripts.complete_flights.db import AircraftUtilizationClient
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
+from plugins.scripts.opensky.archive import SnapshotArchive
+from plugins.scripts.opensky.constants import (
+    SNAPSHOT_TIME,
+    STATES_ARCHIVE,
+    STATES_COLUMNS,
+)
+from plugins.scripts.opensky.transformers import ActiveFlightsETL, SourceReports
+from plugins.scripts.replay.constants import REPLAY
+
+
+REPLAY_COLUMNS = [
+    SNAPSHOT_TIME,
+    STATES_COLUMNS.ICAO24,
+    STATES_COLUMNS.LAST_CONTACT,
+    STATES_COLUMNS.VELOCITY,
+    STATES_COLUMNS.VERTICAL_RATE,
+]
+REPLAY_SOURCE_FILENAME = "replay-source"
+
+
+def to_timestamp(value: str) -> int:
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return round(moment.timestamp())
+
+
+class ReplaySettings(NamedTuple):
+    credentials: Union[S3Sts, S3RolesAnywhere]
+    meta_filename: str
+    archive_prefix: str = STATES_ARCHIVE.PREFIX
+    index_dir: str = METADATA_INDEX_DIR
+    overlap_seconds: int = ActiveFlightsETL.INACTIVITY_MAX_MINUTES * 60
+
+
+class ReplayChunk(NamedTuple):
+    start: int
+    end: int
+
+
+class ChunkReplay(NamedTuple):
+    chunk: ReplayChunk
+    flights: pd.DataFrame
+    seed: pa.Table
+    state: pa.Table
+    snapshots: int
+
+
+class _ReplayActiveFlightsETL(ActiveFlightsETL):
+    now = 0
+
+    def _inactivity_limit(self) -> int:
+        return self.now - self.__class__.INACTIVITY_MAX_MINUTES * 60
+
+
+def _state(store: MemoryStateStore) -> pa.Table:
+    return SOURCE_SCHEMA.empty_table() if store.table is None else store.table
+
+
+def _without(table: pa.Table, aircraft: np.ndarray) -> pa.Table:
+    value_set = pa.array(aircraft, type=pa.uint32())
+    return table.filter(
+        pc.invert(pc.is_in(table.column(SOURCE_COLUMNS.ICAO24), value_set=value_set))
+    )
+
+
+def _only(table: pa.Table, aircraft: np.ndarray) -> pa.Table:
+    value_set = pa.array(aircraft, type=pa.uint32())
+    return table.filter(
+        pc.is_in(table.column(SOURCE_COLUMNS.ICAO24), value_set=value_set)
+    )
+
+
+def _state_frame(table: pa.Table) -> pd.DataFrame:
+    return table.to_pandas().astype({SOURCE_COLUMNS.FLIGHT_TRAJECTORY: object})
+
+
+def diverged_aircraft(expected: pa.Table, actual: pa.Table) -> np.ndarray:
+    states = pd.concat(
+        [_state_frame(table=expected), _state_frame(table=actual)],
+        ignore_index=True,
+    )
+    diverged = states.drop_duplicates(keep=False)
+    return np.unique(diverged[SOURCE_COLUMNS.ICAO24].to_numpy(dtype=ICAO24_DTYPE))
+
+
+def sort_flights(flights: pd.DataFrame) -> pd.DataFrame:
+    if flights.empty:
+        return flights
+    return flights.sort_values(
+        [COMPLETE_FLIGHTS_COLUMNS.LANDED_AT, COMPLETE_FLIGHTS_COLUMNS.ICAO24],
+        kind="stable",
+        ignore_index=True,
+    )
+
+
+class Replayer:
+    def __init__(self, settings: ReplaySettings) -> None:
+        self.settings = settings
+        self.s3_bucket = S3BucketConnector(credentials=settings.credentials)
+        self.archive = SnapshotArchive(
+            s3_bucket=self.s3_bucket, prefix=settings.archive_prefix
+        )
+        self.state_store = MemoryStateStore()
+        self.active_etl = _ReplayActiveFlightsETL(
+            s3_bucket=self.s3_bucket,
+            opensky_client=None,
+            source_filename=REPLAY_SOURCE_FILENAME,
+            state_store=self.state_store,
+        )
+        self.complete_etl = CompleteFlightsETL(
+            s3_bucket=self.s3_bucket,
+            db_client=None,
+            source_filename=REPLAY_SOURCE_FILENAME,
+            meta_filename=settings.meta_filename,
+            state_store=self.state_store,
+            index_dir=settings.index_dir,
+        )
+        self._logger = logging.getLogger(__name__)
+
+    def _read(self, start: int, end: int) -> pa.Table:
+        day = datetime.fromtimestamp(start, tz=UTC).date()
+        last_day = datetime.fromtimestamp(end - 1, tz=UTC).date()
+        tables = []
+        while day <= last_day:
+            tables.append(
+                self.archive.read_day(
+                    day=day,
+                    columns=REPLAY_COLUMNS,
+                    filters=[(SNAPSHOT_TIME, ">=", start), (SNAPSHOT_TIME, "<", end)],
+                )
+            )
+            day += timedelta(days=1)
+        return pa.concat_tables(tables).sort_by(
+            [(SNAPSHOT_TIME, "ascending"), (STATES_COLUMNS.ICAO24, "ascending")]
+        )
+
+    def _snapshots(
+        self, table: pa.Table, aircraft: Union[np.ndarray, None]
+    ) -> Iterator[Tuple[int, pd.DataFrame]]:
+        times = table.column(SNAPSHOT_TIME).to_numpy()
+        snapshot_times = np.unique(times)
+        if aircraft is not None:
+            table = _only(table=table, aircraft=aircraft)
+            times = table.column(SNAPSHOT_TIME).to_numpy()
+        starts = np.searchsorted(times, snapshot_times, side="left")
+        ends = np.searchsorted(times, snapshot_times, side="right")
+        states = table.drop_columns([SNAPSHOT_TIME]).to_pandas()
+        for time, start, end in zip(snapshot_times.tolist(), starts, ends):
+            yield time, states.iloc[start:end].reset_index(drop=True)
+
+    def _cycle(
+        self, time: int, states: pd.DataFrame, metadata: MetadataIndex
+    ) -> Union[pd.DataFrame, None]:
+        self.active_etl.now = time
+        latest_source = self.active_etl._extract_latest_source()
+        source = self.active_etl._transform(
+            source_reports=SourceReports(states=states, latest_source=latest_source)
+        )
+        if source.empty:
+            self.state_store.write(df=source)
+            return None
+        flights = self.complete_etl._transform(source=source, metadata=metadata)
+        self.state_store.write(df=flights.active)
+        return flights.complete
+
+    @instrumented(stage="replay_chunk")
+    def replay(
+        self,
+        chunk: ReplayChunk,
+        seed: Union[pa.Table, None] = None,
+        aircraft: Union[np.ndarray, None] = None,
+    ) -> ChunkReplay:
+        start = chunk.start
+        if seed is None:
+            start -= self.settings.overlap_seconds
+        self.state_store.table = seed
+        metadata = MetadataIndex.load(
+            s3_bucket=self.s3_bucket,
+            filename=self.settings.meta_filename,
+            directory=self.settings.index_dir,
+        )
+        table = self._read(start=start, end=chunk.end)
+        chunk_seed, flights, snapshots = None, [], 0
+        for time, states in self._snapshots(table=table, aircraft=aircraft):
+            if time >= chunk.start and chunk_seed is None:
+                chunk_seed = _state(store=self.state_store)
+            complete = self._cycle(time=time, states=states, metadata=metadata)
+            if time < chunk.start:
+                continue
+            snapshots += 1
+            if complete is not None and not complete.empty:
+                flights.append(complete)
+        return ChunkReplay(
+            chunk=chunk,
+            flights=(
+                pd.concat(flights, ignore_index=True) if flights else pd.DataFrame()
+            ),
+            seed=_state(store=self.state_store) if chunk_seed is None else chunk_seed,
+            state=_state(store=self.state_store),
+            snapshots=snapshots,
+        )
+
+
+def _replay_chunk(settings: ReplaySettings, chunk: ReplayChunk) -> ChunkReplay:
+    return Replayer(settings=settings).replay(chunk=chunk)
+
+
+class ReplaySink(ABC):
+    @abstractmethod
+    def write(self, flights: pd.DataFrame, chunk: ReplayChunk) -> None:
+        pass
+
+
+class MongoReplaySink(ReplaySink):
+    def __init__(self, db_client: AircraftUtilizationClient) -> None:
+        self.db_client = db_client
+
+    def write(self, flights: pd.DataFrame, chunk: ReplayChunk) -> None:
+        self.db_client.write_flights(df=flights)
+
+
+class ParquetReplaySink(ReplaySink):
+    def __init__(self, s3_bucket: S3BucketConnector, prefix: str) -> None:
+        self.s3_bucket = s3_bucket
+        self.prefix = prefix
+
+    def filename(self, chunk: ReplayChunk) -> str:
+        start = datetime.fromtimestamp(chunk.start, tz=UTC)
+        return f"{self.prefix}/{start.strftime('%Y%m%dT%H%M%S')}"
+
+    def write(self, flights: pd.DataFrame, chunk: ReplayChunk) -> None:
+        self.s3_bucket.upload_to_parquet(df=flights, filename=self.filename(chunk))
+
+
+def get_replay_sink(name: str, target: str, s3_bucket: S3BucketConnector) -> ReplaySink:
+    if name == "mongo":
+        return MongoReplaySink(
+            db_client=AircraftUtilizationClient(credentials=MONGODB, collection=target)
+        )
+    elif name == "parquet":
+        return ParquetReplaySink(s3_bucket=s3_bucket, prefix=target)
+    else:
+        raise NotImplementedError(f"Unknown replay sink: {name}")
+
+
+class ReplayEngine:
+    def __init__(
+        self,
+        settings: ReplaySettings,
+        sink: ReplaySink,
+        workers: int = REPLAY.WORKERS,
+        chunk_seconds: int = REPLAY.CHUNK_HOURS * 60 * 60,
+    ) -> None:
+        self.settings = settings
+        self.sink = sink
+        self.workers = workers
+        self.chunk_seconds = chunk_seconds
+        self._logger = logging.getLogger(__name__)
+
+    def chunks(self, start: int, end: int) -> List[ReplayChunk]:
+        return [
+            ReplayChunk(
+                start=chunk_start, end=min(chunk_start + self.chunk_seconds, end)
+            )
+            for chunk_start in range(start, end, self.chunk_seconds)
+        ]
+
+    def _sequential(self, chunks: List[ReplayChunk]) -> Iterator[ChunkReplay]:
+        replayer = Replayer(settings=self.settings)
+        seed = None
+        for chunk in chunks:
+            result = replayer.replay(chunk=chunk, seed=seed)
+            seed = result.state
+            yield result
+
+    def _parallel(self, chunks: List[ReplayChunk]) -> Iterator[ChunkReplay]:
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(_replay_chunk, repeat(self.settings), chunks)
+
+    def _reconcile(self, result: ChunkReplay, expected: pa.Table) -> ChunkReplay:
+        aircraft = diverged_aircraft(expected=expected, actual=result.seed)
+        if not aircraft.size:
+            return result
+        self._logger.info(
+            f"Replaying {aircraft.size} aircraft with diverged state "
+            f"at {result.chunk.start}"
+        )
+        fixed = Replayer(settings=self.settings).replay(
+            chunk=result.chunk,
+            seed=_only(table=expected, aircraft=aircraft),
+            aircraft=aircraft,
+        )
+        flights = [fixed.flights]
+        if not result.flights.empty:
+            flights.insert(
+                0,
+                result.flights.loc[
+                    ~result.flights[COMPLETE_FLIGHTS_COLUMNS.ICAO24].isin(aircraft)
+                ],
+            )
+        flights = [frame for frame in flights if not frame.empty]
+        return result._replace(
+            flights=(
+                pd.concat(flights, ignore_index=True) if flights else pd.DataFrame()
+            ),
+            seed=expected,
+            state=pa.concat_tables(
+                [_without(table=result.state, aircraft=aircraft), fixed.state]
+            ).unify_dictionaries(),
+        )
+
+    @instrumented(stage="replay")
+    def replay(self, start: int, end: int) -> int:
+        chunks = self.chunks(start=start, end=end)
+        self._logger.info(
+            f"Replaying {len(chunks)} chunks from {start} to {end} "
+            f"with {self.workers} workers"
+        )
+        started = perf_counter()
+        results = (
+            self._parallel(chunks=chunks)
+            if self.workers > 1 and len(chunks) > 1
+            else self._sequential(chunks=chunks)
+        )
+        state, snapshots, total = None, 0, 0
+        for result in results:
+            if state is not None:
+                result = self._reconcile(result=result, expected=state)
+            state = result.state
+            flights = sort_flights(flights=result.flights)
+            if not flights.empty:
+                self.sink.write(flights=flights, chunk=result.chunk)
+            snapshots += result.snapshots
+            total += len(flights)
+        seconds = perf_counter() - started
+        self._logger.info(
+            f"Replayed {snapshots} snapshots into {total} flights in {seconds:.1f}s "
+            f"({snapshots / max(seconds, 1e-9):.1f} snapshots/s)"
+        )
+        return total
@@ -0,0 +1,203 @@
+import logging
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from plugins.common.icao24 import ICAO24_DTYPE
+from plugins.common.metrics import instrumented
+from plugins.scripts.complete_flights.constants import (
+    COMPLETE_FLIGHTS_COLUMNS,
+    LANDING_MAX_VELOCITY,
+)
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.opensky.constants import SNAPSHOT_TIME, STATES_COLUMNS
+from plugins.scripts.opensky.transformers import ActiveFlightsETL
+from plugins.scripts.replay.engine import sort_flights
+
+
+def _column(table: pa.Table, name: str, dtype: type) -> np.ndarray:
+    return table.column(name).to_numpy().astype(dtype, copy=False)
+
+
+def _filled(table: pa.Table, name: str, dtype: type) -> np.ndarray:
+    column = table.column(name)
+    if column.null_count:
+        column = column.fill_null(0)
+    return column.to_numpy().astype(dtype, copy=False)
+
+
+def _sort_order(icao24: np.ndarray, time: np.ndarray) -> np.ndarray:
+    keys = icao24.astype(np.uint64) << np.uint64(32)
+    keys |= time.astype(np.uint64)
+    return np.argsort(keys)
+
+
+def _group_starts(icao24: np.ndarray) -> np.ndarray:
+    starts = np.ones(icao24.size, dtype=bool)
+    np.not_equal(icao24[1:], icao24[:-1], out=starts[1:])
+    return starts
+
+
+def _longest_group(group_starts: np.ndarray) -> int:
+    starts = np.flatnonzero(group_starts)
+    if not starts.size:
+        return 0
+    return int(np.diff(np.append(starts, group_starts.size)).max())
+
+
+def _last_index(mask: np.ndarray) -> np.ndarray:
+    return np.maximum.accumulate(np.where(mask, np.arange(mask.size), -1))
+
+
+def _gap_breaks(
+    time: np.ndarray,
+    last_contact: np.ndarray,
+    contact_rows: np.ndarray,
+    group_starts: np.ndarray,
+    inactivity_seconds: int,
+) -> np.ndarray:
+    group_first = _last_index(mask=group_starts)
+    flight_last_contact = np.where(
+        contact_rows >= group_first, last_contact[contact_rows], 0
+    )
+    breaks = group_starts.copy()
+    breaks[1:] |= flight_last_contact[:-1] <= time[1:] - inactivity_seconds
+    return breaks
+
+
+def _propagate_breaks(breaks: np.ndarray, contact_rows: np.ndarray) -> np.ndarray:
+    counts = np.cumsum(breaks)
+    previous = contact_rows[:-1]
+    before = np.where(previous >= 0, counts[np.maximum(previous, 0)], 0)
+    propagated = breaks.copy()
+    propagated[1:] |= counts[:-1] > before
+    return propagated
+
+
+def _landings(
+    breaks: np.ndarray,
+    last_contact: np.ndarray,
+    velocity: np.ndarray,
+    vertical_rate: np.ndarray,
+) -> np.ndarray:
+    level = (last_contact != 0) & (vertical_rate == 0)
+    landings = level & (velocity == 0)
+    openers = breaks | (vertical_rate != 0)
+    runs = np.cumsum(openers) - 1
+    descending = vertical_rate[openers] < 0
+    candidates = np.flatnonzero(
+        level & (velocity < LANDING_MAX_VELOCITY) & ~openers & descending[runs]
+    )
+    if candidates.size:
+        candidate_runs = runs[candidates]
+        first = np.ones(candidates.size, dtype=bool)
+        np.not_equal(candidate_runs[1:], candidate_runs[:-1], out=first[1:])
+        landings[candidates[first]] = True
+    return landings
+
+
+def _sessions(
+    time: np.ndarray,
+    last_contact: np.ndarray,
+    velocity: np.ndarray,
+    vertical_rate: np.ndarray,
+    group_starts: np.ndarray,
+    inactivity_seconds: int,
+) -> np.ndarray:
+    contact_rows = _last_index(mask=last_contact != 0)
+    gap_breaks = _propagate_breaks(
+        breaks=_gap_breaks(
+            time=time,
+            last_contact=last_contact,
+            contact_rows=contact_rows,
+            group_starts=group_starts,
+            inactivity_seconds=inactivity_seconds,
+        ),
+        contact_rows=contact_rows,
+    )
+    breaks = gap_breaks
+    max_iterations = _longest_group(group_starts=group_starts) + 1
+    for _ in range(max_iterations):
+        landings = _landings(
+            breaks=breaks,
+            last_contact=last_contact,
+            velocity=velocity,
+            vertical_rate=vertical_rate,
+        )
+        resolved = gap_breaks.copy()
+        resolved[1:] |= landings[:-1]
+        resolved = _propagate_breaks(breaks=resolved, contact_rows=contact_rows)
+        if np.array_equal(resolved, breaks):
+            return breaks
+        breaks = resolved
+    raise RuntimeError(
+        f"Flight sessions did not converge in {max_iterations} iterations"
+    )
+
+
+class FlightSessionizer:
+    def __init__(
+        self, inactivity_seconds: int = ActiveFlightsETL.INACTIVITY_MAX_MINUTES * 60
+    ) -> None:
+        self.inactivity_seconds = inactivity_seconds
+        self._logger = logging.getLogger(__name__)
+
+    @instrumented(stage="sessionize")
+    def sessionize(
+        self, table: pa.Table, metadata: Union[MetadataIndex, None] = None
+    ) -> pd.DataFrame:
+        icao24 = _column(table=table, name=STATES_COLUMNS.ICAO24, dtype=ICAO24_DTYPE)
+        time = _column(table=table, name=SNAPSHOT_TIME, dtype=np.int64)
+        order = _sort_order(icao24=icao24, time=time)
+        icao24, time = icao24[order], time[order]
+        last_contact = _filled(
+            table=table, name=STATES_COLUMNS.LAST_CONTACT, dtype=np.int64
+        )[order]
+        velocity, vertical_rate = (
+            _filled(table=table, name=column, dtype=np.float32)[order]
+            for column in (STATES_COLUMNS.VELOCITY, STATES_COLUMNS.VERTICAL_RATE)
+        )
+        breaks = _sessions(
+            time=time,
+            last_contact=last_contact,
+            velocity=velocity,
+            vertical_rate=vertical_rate,
+            group_starts=_group_starts(icao24=icao24),
+            inactivity_seconds=self.inactivity_seconds,
+        )
+        landings = _landings(
+            breaks=breaks,
+            last_contact=last_contact,
+            velocity=velocity,
+            vertical_rate=vertical_rate,
+        )
+        starts = np.flatnonzero(breaks)
+        ends = np.append(starts[1:], icao24.size)[: starts.size] - 1
+        takeoff_at = np.where(vertical_rate[starts] > 0, last_contact[starts], 0)
+        complete = landings[ends] & (takeoff_at != 0)
+        ends, takeoff_at = ends[complete], takeoff_at[complete]
+        landed_at = pd.array(last_contact[ends], dtype=pd.Int32Dtype())
+        flights = pd.DataFrame(
+            data={
+                COMPLETE_FLIGHTS_COLUMNS.ICAO24: icao24[ends],
+                COMPLETE_FLIGHTS_COLUMNS.FLIGHT_DURATION_MINUTES: pd.array(
+                    -(-(last_contact[ends] - takeoff_at) // 60),
+                    dtype=pd.Int32Dtype(),
+                ),
+                COMPLETE_FLIGHTS_COLUMNS.LANDED_AT: pd.to_datetime(
+                    landed_at, unit="s", utc=True
+                ),
+            }
+        )
+        flights = sort_flights(flights=flights)
+        self._logger.info(
+            f"Sessionized {table.num_rows} states into {len(flights)} flights "
+            f"over {starts.size} sessions"
+        )
+        if metadata is None:
+            return flights
+        aircraft = metadata.lookup(
+            codes=flights[COMPLETE_FLIGHTS_COLUMNS.ICAO24].to_numpy()
+        )
+        return pd.concat([flights, aircraft], axis=1)
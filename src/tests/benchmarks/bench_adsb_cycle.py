@@ -0,0 +1,108 @@
+from datetime import UTC, datetime
+
+import boto3
+from moto import mock_aws
+import pandas as pd
+from plugins.common.constants import S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
+from plugins.scripts.opensky.client import OpenSkyClient
+from plugins.scripts.opensky.decoders import decode_states
+from plugins.scripts.opensky.transformers import ActiveFlightsETL
+from tests.benchmarks.common import (
+    AircraftUtilizationStub,
+    best_of,
+    random_source,
+    random_states_payload,
+    report,
+)
+
+
+ROWS = (1_000, 5_000, 20_000)
+CREDENTIALS = S3Sts(
+    REGION="us-east-2",
+    ROLE_ARN="arn:aws:iam::123456789012:role/Benchmark",
+    BUCKET="benchmark-bucket",
+    ROLE_SESSION="Benchmark",
+)
+SOURCE_FILENAME = "benchmark-source"
+META_FILENAME = "benchmark-meta"
+
+
+def _opensky_client(payload: bytes) -> OpenSkyClient:
+    client = OpenSkyClient(auth="benchmark")
+    client.get_states_frame = lambda columns: decode_states(
+        payload=payload, columns=columns
+    )
+    return client
+
+
+def _active(payload: bytes) -> ActiveFlightsETL:
+    return ActiveFlightsETL(
+        s3_bucket=S3BucketConnector(credentials=CREDENTIALS),
+        opensky_client=_opensky_client(payload=payload),
+        source_filename=SOURCE_FILENAME,
+    )
+
+
+def _complete() -> CompleteFlightsETL:
+    return CompleteFlightsETL(
+        s3_bucket=S3BucketConnector(credentials=CREDENTIALS),
+        db_client=AircraftUtilizationStub(),
+        source_filename=SOURCE_FILENAME,
+        meta_filename=META_FILENAME,
+    )
+
+
+def _two_task_cycle(payload: bytes) -> None:
+    S3BucketConnector.clear_clients()
+    _active(payload=payload).etl()
+    S3BucketConnector.clear_clients()
+    _complete().etl()
+
+
+def _fused_cycle(payload: bytes) -> None:
+    S3BucketConnector.clear_clients()
+    _complete().etl(source=_active(payload=payload).etl(load=False))
+
+
+def main() -> None:
+    with mock_aws():
+        boto3.client("s3", region_name=CREDENTIALS.REGION).create_bucket(
+            Bucket=CREDENTIALS.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": CREDENTIALS.REGION},
+        )
+        connector = S3BucketConnector(credentials=CREDENTIALS)
+        shift = round(datetime.now(tz=UTC).timestamp()) - 1712338230
+        for rows in ROWS:
+            source = random_source(rows=rows)
+            for column in ("last_contact", "takeoff_at", "flight_last_contact"):
+                source[column] = source[column].where(
+                    source[column] == 0, source[column] + shift
+                )
+            metadata = pd.DataFrame(
+                data={
+                    "icao24": source["icao24"],
+                    "registration": "UR-PSA",
+                    "model": "737-8",
+                    "manufacturer_icao": "BOEING",
+                    "owner": "UIA",
+                    "operator": "UIA",
+                    "built": "2018-01-01",
+                }
+            )
+            connector.upload_to_parquet(df=metadata, filename=META_FILENAME)
+            payload = random_states_payload(rows=rows)
+
+            def run(cycle) -> None:
+                connector.upload_to_parquet(df=source, filename=SOURCE_FILENAME)
+                cycle(payload=payload)
+
+            report(
+                "adsb cycle (two tasks)", rows, best_of(lambda: run(_two_task_cycle))
+            )
+            report("adsb cycle (fused)", rows, best_of(lambda: run(_fused_cycle)))
+
+
+if __name__ == "__main__":
+    main()
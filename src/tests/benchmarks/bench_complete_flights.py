@@ -0,0 +1,59 @@
+import math
+import sys
+
+import pandas as pd
+from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
+from tests.benchmarks.common import (
+    AircraftUtilizationStub,
+    S3BucketStub,
+    best_of,
+    random_source,
+    report,
+)
+
+
+ROWS = (10_000, 100_000, 1_000_000)
+ROW_WISE_MAX_ROWS = 100_000
+
+
+def _row_wise_duration_minutes(source: pd.DataFrame) -> pd.Series:
+    return source.apply(
+        lambda row: math.ceil((row["last_contact"] - row["takeoff_at"]) / 60),
+        axis=1,
+        result_type="reduce",
+    )
+
+
+def main() -> None:
+    transformer = CompleteFlightsETL(
+        s3_bucket=S3BucketStub(),
+        db_client=AircraftUtilizationStub(),
+        source_filename="benchmark-source",
+        meta_filename="benchmark-meta",
+    )
+    for rows in ROWS:
+        source = random_source(rows=rows)
+        columnar = best_of(lambda: transformer._determine_flight_statuses(source))
+        report("flight status (columnar)", rows, columnar)
+        columnar = best_of(lambda: transformer._determine_flight_trajectories(source))
+        report("flight trajectory (columnar)", rows, columnar)
+        columnar = best_of(lambda: transformer._flight_duration_minutes(source))
+        report("flight duration (columnar)", rows, columnar)
+        if rows > ROW_WISE_MAX_ROWS and "--all" not in sys.argv:
+            continue
+        row_wise = best_of(
+            lambda: source.apply(transformer._determine_flight_status, axis=1),
+            repeat=1,
+        )
+        report("flight status (row-wise)", rows, row_wise)
+        row_wise = best_of(
+            lambda: source.apply(transformer._determine_flight_trajectory, axis=1),
+            repeat=1,
+        )
+        report("flight trajectory (row-wise)", rows, row_wise)
+        row_wise = best_of(lambda: _row_wise_duration_minutes(source), repeat=1)
+        report("flight duration (row-wise)", rows, row_wise)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+import pandas as pd
+from plugins.common.icao24 import with_icao24_codes
+from tests.benchmarks.common import best_of, random_source, report
+
+
+ROWS = (10_000, 100_000, 1_000_000)
+
+
+def _states(source: pd.DataFrame, seed: int = 1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    states = source[["icao24", "last_contact"]].sample(frac=1.0, random_state=rng)
+    return states.reset_index(drop=True)
+
+
+def _parquet_size(df: pd.DataFrame) -> int:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.tell()
+
+
+def main() -> None:
+    for rows in ROWS:
+        hex_source = random_source(rows=rows)
+        hex_states = _states(source=hex_source)
+        code_source = with_icao24_codes(df=hex_source)
+        code_states = with_icao24_codes(df=hex_states)
+        for name, source, states in (
+            ("hex", hex_source, hex_states),
+            ("uint32", code_source, code_states),
+        ):
+            seconds = best_of(
+                lambda: states.merge(source, on="icao24", how="outer", copy=False)
+            )
+            report(f"icao24 merge ({name})", rows, seconds)
+            print(f"{'':<40} parquet={_parquet_size(df=source):>12,} bytes")
+        seconds = best_of(lambda: with_icao24_codes(df=hex_source))
+        report("icao24 encode", rows, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from multiprocessing import get_context
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Callable, Tuple
+
+import pandas as pd
+from plugins.scripts.opensky.client import OpenSkyClient
+from plugins.scripts.opensky.transformers import MetadataETL
+from tests.benchmarks.common import S3BucketStub, report
+
+
+ROWS = (500_000, 2_000_000)
+DATABASE_COLUMNS = (
+    "icao24,registration,manufacturericao,manufacturername,model,typecode,"
+    "serialnumber,linenumber,icaoaircrafttype,operator,operatorcallsign,"
+    "operatoricao,operatoriata,owner,testreg,registered,reguntil,status,built,"
+    "firstflightdate,seatconfiguration,engines,modes,adsb,acars,notes,"
+    "categoryDescription"
+)
+
+
+def _write_database(path: str, rows: int) -> None:
+    with open(path, "w") as file:
+        file.write(DATABASE_COLUMNS + "\n")
+        for i in range(rows):
+            file.write(
+                f'"{i:06x}","AB-{i % 99999:05d}","BOEING","Boeing","737 NG",'
+                f'"B738","{i}","","L2J","Test Air {i % 500}","TEST","TAR","TA",'
+                f'"Test Lease {i % 300}","","2001-03-02","2040-03-02","",'
+                f'"2000-10-05","","","CFM INTL. CFM56 SERIES","false","true",'
+                f'"false","","Large"\n'
+            )
+
+
+def _pandas_parse(path: str, output: str) -> None:
+    metadata = pd.read_csv(path)
+    metadata = metadata[
+        [
+            "icao24",
+            "registration",
+            "model",
+            "manufacturericao",
+            "owner",
+            "operator",
+            "built",
+        ]
+    ].rename(columns={"manufacturericao": "manufacturer_icao"})
+    metadata.to_parquet(output, index=False)
+
+
+def _streaming_parse(path: str, output: str) -> None:
+    transformer = MetadataETL(
+        s3_bucket=S3BucketStub(),
+        opensky_client=OpenSkyClient(auth="benchmark"),
+        meta_filename="benchmark-meta",
+    )
+    source_metadata = transformer._extract(path=path)
+    metadata = transformer._transform(source_metadata=source_metadata)
+    transformer._load(metadata=metadata, path=output)
+
+
+def _measure(
+    func: Callable[[str, str], None], path: str, output: str
+) -> Tuple[float, int]:
+    start = time.perf_counter()
+    func(path, output)
+    seconds = time.perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main() -> None:
+    context = get_context("spawn")
+    for rows in ROWS:
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = os.path.join(spool_dir, "aircraftDatabase.csv")
+            output = os.path.join(spool_dir, "metafile.parquet")
+            _write_database(path=path, rows=rows)
+            size = os.path.getsize(path) / 2**20
+            print(f"aircraftDatabase.csv {size:.0f} MiB")
+            for name, func in (
+                ("metadata parse (pandas)", _pandas_parse),
+                ("metadata parse (streaming)", _streaming_parse),
+            ):
+                with context.Pool(processes=1) as pool:
+                    seconds, max_rss = pool.apply(_measure, (func, path, output))
+                report(name, rows, seconds)
+                scale = 2**10 if sys.platform != "darwin" else 2**20
+                print(f"{'':<40} max_rss={max_rss / scale:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
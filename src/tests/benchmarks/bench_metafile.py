@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from plugins.common.icao24 import with_icao24_codes
+from plugins.common.schema import conform_table, table_to_frame
+from plugins.scripts.complete_flights.constants import METAFILE_SCHEMA
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from tests.benchmarks.common import best_of, report
+
+
+ROWS = (100_000, 500_000, 2_000_000)
+LANDINGS = 1_000
+
+
+def _legacy_metadata(rows: int) -> pd.DataFrame:
+    index = np.arange(rows)
+    return pd.DataFrame(
+        data={
+            "icao24": [f"{i:06x}" for i in index],
+            "registration": [f"AB-{i % 99999:05d}" for i in index],
+            "model": [f"737-{i % 40}" for i in index],
+            "manufacturer_icao": [("BOEING", "AIRBUS")[i % 2] for i in index],
+            "owner": [f"Test Lease {i % 300}" for i in index],
+            "operator": [f"Test Air {i % 500}" for i in index],
+            "built": [None if i % 3 == 0 else "2000-10-05" for i in index],
+        }
+    )
+
+
+def _legacy_add_metadata(data: bytes, complete: pd.DataFrame) -> pd.DataFrame:
+    metadata = with_icao24_codes(df=pd.read_parquet(io.BytesIO(data)))
+    complete = complete.merge(right=metadata, on="icao24", how="left")
+    built_not_null = complete["built"].isnull() == False
+    complete.loc[built_not_null, "built"] = pd.to_datetime(
+        complete.loc[built_not_null, "built"], format="%Y-%m-%d"
+    )
+    return complete
+
+
+def _typed_add_metadata(data: bytes, complete: pd.DataFrame) -> pd.DataFrame:
+    table = conform_table(table=pq.read_table(io.BytesIO(data)), schema=METAFILE_SCHEMA)
+    metadata = table_to_frame(table=table)
+    return complete.merge(right=metadata, on="icao24", how="left")
+
+
+def _indexed_add_metadata(index: MetadataIndex, complete: pd.DataFrame) -> pd.DataFrame:
+    aircraft = index.lookup(codes=complete["icao24"].to_numpy())
+    return pd.concat([complete.reset_index(drop=True), aircraft], axis=1)
+
+
+def main() -> None:
+    directory = tempfile.TemporaryDirectory()
+    for rows in ROWS:
+        legacy = _legacy_metadata(rows=rows)
+        buffer = io.BytesIO()
+        legacy.to_parquet(buffer, index=False)
+        legacy_data = buffer.getvalue()
+        typed = conform_table(
+            table=pq.read_table(io.BytesIO(legacy_data)), schema=METAFILE_SCHEMA
+        )
+        buffer = io.BytesIO()
+        pq.write_table(typed, buffer)
+        typed_data = buffer.getvalue()
+        rng = np.random.default_rng(rows)
+        complete = pd.DataFrame(
+            data={
+                "icao24": rng.choice(rows, size=LANDINGS, replace=False).astype(
+                    np.uint32
+                )
+            }
+        )
+        seconds = best_of(lambda: _legacy_add_metadata(legacy_data, complete))
+        report("metafile load + merge (legacy)", rows, seconds)
+        seconds = best_of(lambda: _typed_add_metadata(typed_data, complete))
+        report("metafile load + merge (typed)", rows, seconds)
+        path = os.path.join(directory.name, f"benchmark-meta-{rows}.arrow")
+        MetadataIndex.build(table=typed, path=path)
+        index = MetadataIndex.open(path=path)
+        seconds = best_of(lambda: _indexed_add_metadata(index, complete))
+        report("metadata index lookup", rows, seconds)
+        print(f"{'':<40} parquet {len(legacy_data):>12,} -> {len(typed_data):>12,}")
+
+
+if __name__ == "__main__":
+    main()
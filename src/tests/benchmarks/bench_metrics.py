@@ -0,0 +1,49 @@
+from time import perf_counter
+from unittest import mock
+
+from plugins.common.constants import METRICS
+from plugins.common.metrics import instrumented
+from tests.benchmarks.common import best_of, report
+
+
+CALLS = 100_000
+
+
+class Stage:
+    def run(self, value: int) -> int:
+        return value
+
+    @instrumented(stage="run")
+    def instrumented_run(self, value: int) -> int:
+        return value
+
+
+def _calls(func) -> float:
+    start = perf_counter()
+    for value in range(CALLS):
+        func(value)
+    return perf_counter() - start
+
+
+def main() -> None:
+    stage = Stage()
+    report("plain call", CALLS, best_of(lambda: _calls(stage.run)))
+    with mock.patch("plugins.common.metrics.METRICS", METRICS._replace(ENABLED=False)):
+        report(
+            "instrumented call (disabled)",
+            CALLS,
+            best_of(lambda: _calls(stage.instrumented_run)),
+        )
+    with mock.patch(
+        "plugins.common.metrics.METRICS",
+        METRICS._replace(ENABLED=True, EXPORTERS=()),
+    ):
+        report(
+            "instrumented call (enabled)",
+            CALLS,
+            best_of(lambda: _calls(stage.instrumented_run)),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import bson
+import numpy as np
+import pandas as pd
+from plugins.common.constants import all_fields_present
+from plugins.scripts.complete_flights.constants import MONGODB
+from plugins.scripts.complete_flights.db import AircraftUtilizationClient, Flights
+from plugins.scripts.complete_flights.encoders import encode_flights
+from tests.benchmarks.common import best_of, report
+
+
+ROWS = (1_000, 10_000, 100_000)
+BENCHMARK_MONGODB = MONGODB._replace(DB="aircraft_utilization_benchmark")
+
+
+def random_complete(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    models = np.array(["Boeing 737", "Airbus 320", None], dtype=object)
+    complete = pd.DataFrame(
+        data={
+            "icao24": pd.Series(rng.choice(2**24, size=rows, replace=False)).map(
+                "{:06x}".format
+            ),
+            "flight_duration_minutes": rng.integers(1, 900, size=rows),
+            "landed_at": pd.to_datetime(
+                1712338215 - rng.integers(0, 300, size=rows), unit="s", utc=True
+            ),
+            "registration": rng.choice(models, size=rows),
+            "model": rng.choice(models, size=rows),
+            "manufacturer_icao": rng.choice(models, size=rows),
+            "owner": rng.choice(models, size=rows),
+            "operator": rng.choice(models, size=rows),
+            "built": pd.Series(
+                rng.choice(
+                    np.array([pd.Timestamp("2000-02-01"), None], dtype=object),
+                    size=rows,
+                ),
+                dtype=object,
+            ),
+        }
+    )
+    return complete
+
+
+def legacy_documents(complete: pd.DataFrame) -> list:
+    return [
+        bson.encode(
+            Flights(
+                icao24=r["icao24"],
+                landed_at=r["landed_at"],
+                duration_minutes=r["flight_duration_minutes"],
+                registration=r["registration"],
+                model=r["model"],
+                manufacturer_icao=r["manufacturer_icao"],
+                owner=r["owner"],
+                operator=r["operator"],
+                built=r["built"],
+            )
+        )
+        for r in complete.replace({np.nan: None}).to_dict("records")
+    ]
+
+
+def main() -> None:
+    for rows in ROWS:
+        complete = random_complete(rows=rows)
+        seconds = best_of(lambda: legacy_documents(complete=complete))
+        report("encode (to_dict + TypedDict)", rows, seconds)
+        seconds = best_of(lambda: encode_flights(df=complete))
+        report("encode (column-wise)", rows, seconds)
+        print(f"{'':<40} {rows / seconds:>25,.0f} docs/s")
+        if not all_fields_present(BENCHMARK_MONGODB):
+            continue
+        client = AircraftUtilizationClient(credentials=BENCHMARK_MONGODB)
+        seconds = best_of(lambda: client.write_flights(df=complete))
+        report("insert (unordered batches)", rows, seconds)
+        print(f"{'':<40} {rows / seconds:>25,.0f} docs/s")
+        client._db.client.drop_database(BENCHMARK_MONGODB.DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import json
+
+import pandas as pd
+from plugins.scripts.opensky.constants import STATES_COLUMNS
+from plugins.scripts.opensky.decoders import decode_states
+from tests.benchmarks.common import best_of, peak_memory, random_states_payload, report
+
+
+ROWS = (10_000, 100_000)
+COLUMNS = [
+    STATES_COLUMNS.ICAO24,
+    STATES_COLUMNS.LAST_CONTACT,
+    STATES_COLUMNS.VELOCITY,
+    STATES_COLUMNS.VERTICAL_RATE,
+]
+
+
+def _full_frame_decode(payload: bytes) -> pd.DataFrame:
+    states = pd.DataFrame(data=json.loads(payload)["states"], columns=STATES_COLUMNS)
+    return states[COLUMNS]
+
+
+def main() -> None:
+    for rows in ROWS:
+        payload = random_states_payload(rows=rows)
+        for name, func in (
+            ("states decode (full frame)", lambda: _full_frame_decode(payload)),
+            ("states decode (projected)", lambda: decode_states(payload, COLUMNS)),
+        ):
+            report(name, rows, best_of(func))
+            _, peak = peak_memory(func)
+            print(f"{'':<40} peak={peak / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from datetime import UTC, date, datetime
+import tempfile
+from time import perf_counter
+
+import boto3
+from moto import mock_aws
+import pyarrow as pa
+from plugins.common.constants import S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.opensky.archive import ARCHIVE_COLUMNS, SnapshotArchive
+from plugins.scripts.opensky.decoders import decode_snapshot
+from plugins.scripts.replay.engine import (
+    REPLAY_COLUMNS,
+    ReplayChunk,
+    Replayer,
+    ReplaySettings,
+    sort_flights,
+)
+from plugins.scripts.replay.sessions import FlightSessionizer
+from tests.benchmarks.common import best_of, report
+from tests.benchmarks.traffic import TrafficGenerator
+
+
+AIRCRAFT = (500, 2_000)
+BATCH_AIRCRAFT = (10_000, 20_000)
+SNAPSHOTS = 288
+INTERVAL = 300
+DAY = date(2024, 4, 5)
+START = round(datetime(2024, 4, 5, tzinfo=UTC).timestamp())
+CREDENTIALS = S3Sts(
+    REGION="us-east-2",
+    ROLE_ARN="arn:aws:iam::123456789012:role/Benchmark",
+    BUCKET="benchmark-bucket",
+    ROLE_SESSION="Benchmark",
+)
+FLIGHT_COLUMNS = ["icao24", "flight_duration_minutes", "landed_at"]
+
+
+def _archive_table(archive: SnapshotArchive, aircraft: int) -> pa.Table:
+    generator = TrafficGenerator(
+        aircraft=aircraft, seed=3, start=START, interval=INTERVAL
+    )
+    return pa.concat_tables(
+        [
+            archive.snapshot_table(
+                snapshot=decode_snapshot(payload=payload, columns=ARCHIVE_COLUMNS)
+            )
+            for payload in generator.payloads(count=SNAPSHOTS)
+        ]
+    )
+
+
+def main() -> None:
+    with mock_aws(), tempfile.TemporaryDirectory() as directory:
+        boto3.client("s3", region_name=CREDENTIALS.REGION).create_bucket(
+            Bucket=CREDENTIALS.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": CREDENTIALS.REGION},
+        )
+        connector = S3BucketConnector(credentials=CREDENTIALS)
+        archive = SnapshotArchive(s3_bucket=connector, prefix="benchmark-archive")
+        settings = ReplaySettings(
+            credentials=CREDENTIALS,
+            meta_filename="benchmark-meta",
+            archive_prefix="benchmark-archive",
+            index_dir=directory,
+            overlap_seconds=0,
+        )
+        sessionizer = FlightSessionizer()
+        chunk = ReplayChunk(start=START, end=START + SNAPSHOTS * INTERVAL)
+        for aircraft in AIRCRAFT:
+            table = _archive_table(archive=archive, aircraft=aircraft)
+            connector.upload_parquet_table(
+                table=table, filename=archive.daily_filename(day=DAY)
+            )
+            started = perf_counter()
+            streamed = Replayer(settings=settings).replay(chunk=chunk).flights
+            report(
+                "flights (streaming replay)", table.num_rows, perf_counter() - started
+            )
+            states = archive.read_day(day=DAY, columns=REPLAY_COLUMNS)
+            report(
+                "flights (batch sessionize)",
+                table.num_rows,
+                best_of(lambda: sessionizer.sessionize(table=states)),
+            )
+            batched = sessionizer.sessionize(table=states)
+            matched = batched.equals(sort_flights(flights=streamed[FLIGHT_COLUMNS]))
+            print(f"{'':<40} flights={len(batched):>9,} matched={matched}")
+            MetadataIndex.clear_indexes()
+        for aircraft in BATCH_AIRCRAFT:
+            states = _archive_table(archive=archive, aircraft=aircraft).select(
+                REPLAY_COLUMNS
+            )
+            seconds = best_of(lambda: sessionizer.sessionize(table=states))
+            report("flights (batch sessionize)", states.num_rows, seconds)
+            print(f"{'':<40} {states.num_rows / seconds:>12,.0f} rows/s")
+        S3BucketConnector.clear_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import io
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from plugins.common.constants import SOURCE_SCHEMA
+from plugins.common.icao24 import with_icao24_codes
+from plugins.common.schema import conform_table, frame_to_table, table_to_frame
+from tests.benchmarks.common import best_of, random_source, report
+
+
+ROWS = (10_000, 100_000, 1_000_000)
+
+
+def _inferred(source) -> bytes:
+    buffer = io.BytesIO()
+    source.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _pinned(source) -> bytes:
+    buffer = io.BytesIO()
+    pq.write_table(frame_to_table(df=source, schema=SOURCE_SCHEMA), buffer)
+    return buffer.getvalue()
+
+
+def _read_pinned(data: bytes) -> None:
+    table = pq.read_table(io.BytesIO(data))
+    table_to_frame(table=conform_table(table=table, schema=SOURCE_SCHEMA))
+
+
+def main() -> None:
+    for rows in ROWS:
+        source = with_icao24_codes(df=random_source(rows=rows))
+        rng = np.random.default_rng(rows)
+        source["velocity"] = rng.random(rows) * 250
+        source["vertical_rate"] = rng.normal(0, 5, size=rows)
+        inferred = _inferred(source=source)
+        pinned = _pinned(source=source)
+        seconds = best_of(lambda: _inferred(source=source))
+        report("source write (inferred)", rows, seconds)
+        seconds = best_of(lambda: _pinned(source=source))
+        report("source write (pinned)", rows, seconds)
+        seconds = best_of(lambda: pq.read_table(io.BytesIO(inferred)).to_pandas())
+        report("source read (inferred)", rows, seconds)
+        seconds = best_of(lambda: _read_pinned(data=pinned))
+        report("source read (pinned)", rows, seconds)
+        print(f"{'':<40} parquet {len(inferred):>12,} -> {len(pinned):>12,} bytes")
+        memory = (
+            pa.Table.from_pandas(source, preserve_index=False).nbytes,
+            frame_to_table(df=source, schema=SOURCE_SCHEMA).nbytes,
+        )
+        print(f"{'':<40} arrow   {memory[0]:>12,} -> {memory[1]:>12,} bytes")
+
+
+if __name__ == "__main__":
+    main()
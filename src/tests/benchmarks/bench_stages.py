@@ -0,0 +1,311 @@
+import argparse
+from datetime import UTC, datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+from time import perf_counter
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, TypeVar
+
+import boto3
+from moto import mock_aws
+from plugins.common.constants import SOURCE_SCHEMA, S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
+from plugins.scripts.opensky.client import OpenSkyClient
+from plugins.scripts.opensky.decoders import decode_states
+from plugins.scripts.opensky.transformers import ActiveFlightsETL, MetadataETL
+from tests.benchmarks.common import AircraftUtilizationStub
+from tests.benchmarks.traffic import TrafficGenerator
+
+
+AIRCRAFT = (1_000, 10_000, 100_000)
+CYCLES = 3
+WARMUP_CYCLES = 3
+INTERVAL = 60
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+MIN_SECONDS = 0.005
+MIN_BYTES = 1 << 20
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "stages.json")
+CREDENTIALS = S3Sts(
+    REGION="us-east-2",
+    ROLE_ARN="arn:aws:iam::123456789012:role/Benchmark",
+    BUCKET="benchmark-bucket",
+    ROLE_SESSION="Benchmark",
+)
+SOURCE_FILENAME = "benchmark-source"
+META_FILENAME = "benchmark-meta"
+
+T = TypeVar("T")
+
+
+class StageResult(NamedTuple):
+    seconds: float
+    peak_bytes: int
+
+
+class StageRecorder:
+    def __init__(self, aircraft: int) -> None:
+        self.aircraft = aircraft
+        self.trace = False
+        self._seconds: Dict[str, List[float]] = {}
+        self._peaks: Dict[str, int] = {}
+
+    def __call__(self, stage: str, func: Callable[[], T]) -> T:
+        if not self.trace:
+            start = perf_counter()
+            result = func()
+            self._seconds.setdefault(stage, []).append(perf_counter() - start)
+            return result
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self._peaks[stage] = max(self._peaks.get(stage, 0), peak)
+        return result
+
+    def results(self) -> Dict[str, StageResult]:
+        return {
+            f"{self.aircraft}/{stage}": StageResult(
+                seconds=min(seconds), peak_bytes=self._peaks.get(stage, 0)
+            )
+            for stage, seconds in self._seconds.items()
+        }
+
+
+def _opensky_client(payload: bytes) -> OpenSkyClient:
+    client = OpenSkyClient(auth="benchmark")
+    client.get_states_frame = lambda columns: decode_states(
+        payload=payload, columns=columns
+    )
+    return client
+
+
+def _metadata_stages(
+    record: StageRecorder, connector: S3BucketConnector, generator: TrafficGenerator
+) -> None:
+    with tempfile.TemporaryDirectory() as spool_dir:
+        database_path = generator.write_aircraft_database(
+            path=os.path.join(spool_dir, "aircraftDatabase.csv")
+        )
+        metadata_path = os.path.join(spool_dir, f"{META_FILENAME}.parquet")
+        metadata_etl = MetadataETL(
+            s3_bucket=connector,
+            opensky_client=OpenSkyClient(auth="benchmark"),
+            meta_filename=META_FILENAME,
+            spool_dir=spool_dir,
+        )
+        reader = record(
+            "metadata/_extract", lambda: metadata_etl._extract(database_path)
+        )
+        batches = record(
+            "metadata/_transform",
+            lambda: list(metadata_etl._transform(source_metadata=reader)),
+        )
+        record(
+            "metadata/_load",
+            lambda: metadata_etl._load(metadata=iter(batches), path=metadata_path),
+        )
+
+
+def _adsb_stages(
+    record: StageRecorder,
+    connector: S3BucketConnector,
+    generator: TrafficGenerator,
+    index_dir: str,
+) -> None:
+    active_etl = ActiveFlightsETL(
+        s3_bucket=connector,
+        opensky_client=_opensky_client(payload=generator.payload()),
+        source_filename=SOURCE_FILENAME,
+    )
+    complete_etl = CompleteFlightsETL(
+        s3_bucket=connector,
+        db_client=AircraftUtilizationStub(),
+        source_filename=SOURCE_FILENAME,
+        meta_filename=META_FILENAME,
+        index_dir=index_dir,
+    )
+    reports = record("active/_extract", active_etl._extract)
+    source = record(
+        "active/_transform", lambda: active_etl._transform(source_reports=reports)
+    )
+    record("active/_load", lambda: active_etl._load(source=source))
+    source = record("complete/_extract", complete_etl._extract)
+    metadata = record(
+        "complete/metadata_index",
+        lambda: MetadataIndex.load(
+            s3_bucket=connector, filename=META_FILENAME, directory=index_dir
+        ),
+    )
+    flights = record(
+        "complete/_transform",
+        lambda: complete_etl._transform(source=source, metadata=metadata),
+    )
+    record("complete/_load", lambda: complete_etl._load(flights=flights))
+
+
+def _s3_stages(record: StageRecorder, connector: S3BucketConnector) -> None:
+    source = record(
+        "s3/read_parquet",
+        lambda: connector.read_parquet(filename=SOURCE_FILENAME, schema=SOURCE_SCHEMA),
+    )
+    record(
+        "s3/upload_to_parquet",
+        lambda: connector.upload_to_parquet(
+            df=source, filename=SOURCE_FILENAME, schema=SOURCE_SCHEMA
+        ),
+    )
+
+
+def run(aircraft: int, cycles: int, seed: int = 0) -> Dict[str, StageResult]:
+    record = StageRecorder(aircraft=aircraft)
+    start = round(datetime.now(tz=UTC).timestamp())
+    start -= (WARMUP_CYCLES + cycles + 1) * INTERVAL
+    generator = TrafficGenerator(
+        aircraft=aircraft, seed=seed, start=start, interval=INTERVAL
+    )
+    with mock_aws(), tempfile.TemporaryDirectory() as index_dir:
+        boto3.client("s3", region_name=CREDENTIALS.REGION).create_bucket(
+            Bucket=CREDENTIALS.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": CREDENTIALS.REGION},
+        )
+        S3BucketConnector.clear_clients()
+        MetadataIndex.clear_indexes()
+        connector = S3BucketConnector(credentials=CREDENTIALS)
+        passes = [False] * cycles + [True]
+        for trace in passes:
+            record.trace = trace
+            _metadata_stages(record=record, connector=connector, generator=generator)
+        for _ in range(WARMUP_CYCLES):
+            _adsb_stages(
+                record=lambda stage, func: func(),
+                connector=connector,
+                generator=generator,
+                index_dir=index_dir,
+            )
+        for trace in passes:
+            record.trace = trace
+            _adsb_stages(
+                record=record,
+                connector=connector,
+                generator=generator,
+                index_dir=index_dir,
+            )
+            _s3_stages(record=record, connector=connector)
+        record.trace = False
+        MetadataIndex.clear_indexes()
+    return record.results()
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"results": {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, results: Dict[str, StageResult], cycles: int) -> None:
+    baseline = load_baseline(path=path)
+    baseline.update(
+        machine=platform.platform(),
+        python=platform.python_version(),
+        created_at=datetime.now(tz=UTC).isoformat(timespec="seconds"),
+        cycles=cycles,
+    )
+    baseline["results"].update(
+        {key: result._asdict() for key, result in results.items()}
+    )
+    baseline["results"] = dict(sorted(baseline["results"].items()))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2)
+        file.write("\n")
+
+
+def _regressed(current: float, base: float, tolerance: float, floor: float) -> bool:
+    return current > base * (1 + tolerance) and current - base > floor
+
+
+def compare(results: Dict[str, StageResult], baseline: dict) -> List[str]:
+    regressions = []
+    print(
+        f"{'stage':<36} {'base ms':>10} {'ms':>10} {'ratio':>6} "
+        f"{'base peak':>12} {'peak':>12} {'ratio':>6}"
+    )
+    for key, result in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            print(
+                f"{key:<36} {'-':>10} {result.seconds * 1000:>10.2f} {'-':>6} "
+                f"{'-':>12} {result.peak_bytes:>12,} {'-':>6}"
+            )
+            continue
+        base = StageResult(**base)
+        time_ratio = result.seconds / max(base.seconds, 1e-9)
+        memory_ratio = result.peak_bytes / max(base.peak_bytes, 1)
+        flags = []
+        if _regressed(
+            current=result.seconds,
+            base=base.seconds,
+            tolerance=TIME_TOLERANCE,
+            floor=MIN_SECONDS,
+        ):
+            flags.append("time")
+        if _regressed(
+            current=result.peak_bytes,
+            base=base.peak_bytes,
+            tolerance=MEMORY_TOLERANCE,
+            floor=MIN_BYTES,
+        ):
+            flags.append("memory")
+        if flags:
+            regressions.append(f"{key} ({', '.join(flags)})")
+        print(
+            f"{key:<36} {base.seconds * 1000:>10.2f} {result.seconds * 1000:>10.2f} "
+            f"{time_ratio:>6.2f} {base.peak_bytes:>12,} {result.peak_bytes:>12,} "
+            f"{memory_ratio:>6.2f}{'  REGRESSION' if flags else ''}"
+        )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Per-stage ETL benchmarks on synthetic ADS-B traffic"
+    )
+    parser.add_argument("--aircraft", type=int, nargs="+", default=AIRCRAFT)
+    parser.add_argument("--cycles", type=int, default=CYCLES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    results = {}
+    for aircraft in args.aircraft:
+        results.update(run(aircraft=aircraft, cycles=args.cycles, seed=args.seed))
+
+    baseline = load_baseline(path=args.baseline)
+    print(
+        f"baseline: {baseline.get('machine', '-')} "
+        f"python {baseline.get('python', '-')} {baseline.get('created_at', '-')}"
+    )
+    regressions = compare(results=results, baseline=baseline)
+    if args.save_baseline:
+        save_baseline(path=args.baseline, results=results, cycles=args.cycles)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"Regressions: {'; '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import tempfile
+
+import boto3
+import fakeredis
+from moto import mock_aws
+from plugins.common.constants import ACTIVE_FLIGHTS_COLUMNS, S3Sts
+from plugins.common.icao24 import with_icao24_codes
+from plugins.common.s3 import S3BucketConnector
+from plugins.common.state import (
+    ArrowStateStore,
+    RedisStateStore,
+    S3ParquetStateStore,
+    StateStore,
+)
+from tests.benchmarks.common import best_of, random_source, report
+
+
+ROWS = (1_000, 10_000, 20_000)
+CREDENTIALS = S3Sts(
+    REGION="us-east-2",
+    ROLE_ARN="arn:aws:iam::123456789012:role/Benchmark",
+    BUCKET="benchmark-bucket",
+    ROLE_SESSION="Benchmark",
+)
+FILENAME = "benchmark-source"
+
+
+def _cycle(store: StateStore, source) -> None:
+    store.read(
+        columns=tuple(ACTIVE_FLIGHTS_COLUMNS),
+        filters=[(ACTIVE_FLIGHTS_COLUMNS.FLIGHT_LAST_CONTACT, ">", 1712337830)],
+    )
+    store.write(df=source)
+
+
+def main() -> None:
+    with mock_aws(), tempfile.TemporaryDirectory() as directory:
+        boto3.client("s3", region_name=CREDENTIALS.REGION).create_bucket(
+            Bucket=CREDENTIALS.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": CREDENTIALS.REGION},
+        )
+        connector = S3BucketConnector(credentials=CREDENTIALS)
+        stores = {
+            "s3 parquet": S3ParquetStateStore(s3_bucket=connector, filename=FILENAME),
+            "arrow ipc": ArrowStateStore(
+                s3_bucket=connector,
+                filename=FILENAME,
+                directory=directory,
+                checkpoint_seconds=15 * 60,
+            ),
+            "redis": RedisStateStore(client=fakeredis.FakeRedis(), prefix=FILENAME),
+        }
+        for rows in ROWS:
+            source = with_icao24_codes(df=random_source(rows=rows))
+            for name, store in stores.items():
+                store.write(df=source)
+                seconds = best_of(lambda: _cycle(store=store, source=source))
+                report(f"state cycle ({name})", rows, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from plugins.common.constants import SOURCE_SCHEMA
+from plugins.common.icao24 import with_icao24_codes
+from plugins.common.schema import conform_frame
+from plugins.scripts.opensky.state_update import merge_states
+from tests.benchmarks.common import best_of, peak_memory, random_source, report
+
+
+ROWS = (10_000, 100_000, 1_000_000)
+ACTIVE_FLIGHTS = [
+    "icao24",
+    "takeoff_at",
+    "flight_last_contact",
+    "flight_trajectory",
+    "is_first_contact",
+]
+STATES = ["icao24", "last_contact", "velocity", "vertical_rate"]
+
+
+def legacy_merge_states(
+    states: pd.DataFrame, active_flights: pd.DataFrame
+) -> pd.DataFrame:
+    source = states.merge(active_flights, how="outer", on="icao24")
+    filled = [
+        "last_contact",
+        "velocity",
+        "vertical_rate",
+        "takeoff_at",
+        "flight_last_contact",
+    ]
+    source[filled] = source[filled].fillna(0)
+    source = source.astype(
+        {
+            "last_contact": pd.Int32Dtype(),
+            "takeoff_at": pd.Int32Dtype(),
+            "flight_last_contact": pd.Int32Dtype(),
+        }
+    )
+    source[["is_first_contact"]] = source[["is_first_contact"]].replace(
+        to_replace=[pd.NA, True], value=[True, False]
+    )
+    valid_last_contact_mask = source["last_contact"] != 0
+    source.loc[valid_last_contact_mask, "flight_last_contact"] = source["last_contact"]
+    return conform_frame(df=source, schema=SOURCE_SCHEMA)
+
+
+def _reports(rows: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    source = with_icao24_codes(df=random_source(rows=rows))
+    source = conform_frame(df=source, schema=SOURCE_SCHEMA)
+    source = source.sort_values("icao24", ignore_index=True)
+    rng = np.random.default_rng(1)
+    landed = rng.random(rows) < 0.1
+    states = source.loc[~landed, STATES].sample(frac=1.0, random_state=rng)
+    return states.reset_index(drop=True), source[ACTIVE_FLIGHTS]
+
+
+def main() -> None:
+    for rows in ROWS:
+        states, active_flights = _reports(rows=rows)
+        for name, func in (
+            ("pandas merge", legacy_merge_states),
+            ("sorted merge", merge_states),
+        ):
+            seconds = best_of(
+                lambda: func(states=states, active_flights=active_flights)
+            )
+            report(f"state update ({name})", rows, seconds)
+            _, peak = peak_memory(
+                lambda: func(states=states, active_flights=active_flights)
+            )
+            print(f"{'':<40} peak={peak:>12,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import json
+from time import perf_counter
+import tracemalloc
+from typing import Callable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.db import AircraftUtilizationClient
+
+
+class S3BucketStub(S3BucketConnector):
+    def __init__(self) -> None:
+        pass
+
+    def upload_parquet_file(self, path: str, filename: str) -> None:
+        pass
+
+
+class AircraftUtilizationStub(AircraftUtilizationClient):
+    def __init__(self) -> None:
+        pass
+
+    def write_flights(self, df: pd.DataFrame) -> None:
+        pass
+
+
+def random_source(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    now = 1712338130
+    icao24 = pd.Series(rng.choice(2**24, size=rows, replace=False)).map("{:06x}".format)
+    last_contact = np.where(
+        rng.random(rows) < 0.1, 0, now - rng.integers(0, 300, size=rows)
+    )
+    velocity = rng.choice([0.0, 5.0, 9.5, 80.0, 240.0], size=rows)
+    vertical_rate = rng.choice([-6.0, -1.1, 0.0, 0.0, 1.1, 6.3], size=rows)
+    velocity[rng.random(rows) < 0.05] = np.nan
+    vertical_rate[rng.random(rows) < 0.05] = np.nan
+    takeoff_at = np.where(
+        rng.random(rows) < 0.3, 0, now - rng.integers(600, 36000, size=rows)
+    )
+    flight_trajectory = rng.choice(
+        np.array(["climb", "descend", "other", None], dtype=object), size=rows
+    )
+    is_first_contact = rng.random(rows) < 0.05
+    source = pd.DataFrame(
+        data={
+            "icao24": icao24,
+            "last_contact": last_contact,
+            "velocity": velocity,
+            "vertical_rate": vertical_rate,
+            "takeoff_at": takeoff_at,
+            "flight_last_contact": now - rng.integers(0, 300, size=rows),
+            "flight_trajectory": flight_trajectory,
+            "is_first_contact": is_first_contact,
+        }
+    )
+    return source.astype(
+        {
+            "last_contact": pd.Int32Dtype(),
+            "takeoff_at": pd.Int32Dtype(),
+            "flight_last_contact": pd.Int32Dtype(),
+        }
+    )
+
+
+def random_states_payload(rows: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    now = 1712338230
+    icao24 = rng.choice(2**24, size=rows, replace=False)
+    last_contact = now - rng.integers(0, 300, size=rows)
+    velocity = rng.random(rows) * 250
+    vertical_rate = rng.choice([-6.0, -1.1, 0.0, 1.1, 6.3], size=rows)
+    states = [
+        [
+            f"{icao24[i]:06x}",
+            "TEST123 ",
+            "Ukraine",
+            int(last_contact[i]),
+            int(last_contact[i]),
+            -37.80467681,
+            144.9659498,
+            700.25,
+            False,
+            None if i % 20 == 0 else float(velocity[i]),
+            5.154,
+            None if i % 25 == 0 else float(vertical_rate[i]),
+            None,
+            620.25,
+            "1234",
+            False,
+            0,
+        ]
+        for i in range(rows)
+    ]
+    return json.dumps({"time": now, "states": states}, separators=(",", ":")).encode()
+
+
+def best_of(func: Callable[[], object], repeat: int = 3) -> float:
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(func: Callable[[], object]) -> Tuple[float, int]:
+    tracemalloc.start()
+    try:
+        start = perf_counter()
+        func()
+        seconds = perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def report(name: str, rows: int, seconds: float) -> None:
+    print(f"{name:<40} rows={rows:>9,} {seconds * 1000:>10.2f} ms")
@@ -0,0 +1,221 @@
+import csv
+import json
+from typing import Iterator, List, NamedTuple
+
+import numpy as np
+
+
+class FlightPhases(NamedTuple):
+    PARKED: int = 0
+    CLIMB: int = 1
+    CRUISE: int = 2
+    DESCENT: int = 3
+    ROLLOUT: int = 4
+
+
+class TrafficRates(NamedTuple):
+    DROPOUT: float = 0.02
+    STALE: float = 0.01
+    VELOCITY_NA: float = 0.03
+    VERTICAL_RATE_NA: float = 0.04
+    ALTITUDE_NA: float = 0.05
+    POSITION_NA: float = 0.02
+    CALLSIGN_NA: float = 0.01
+
+
+FLIGHT_PHASES = FlightPhases()
+TRAFFIC_RATES = TrafficRates()
+PHASE_STEPS = {
+    FLIGHT_PHASES.PARKED: (5, 60),
+    FLIGHT_PHASES.CLIMB: (2, 5),
+    FLIGHT_PHASES.CRUISE: (5, 120),
+    FLIGHT_PHASES.DESCENT: (2, 7),
+    FLIGHT_PHASES.ROLLOUT: (1, 2),
+}
+INITIAL_PHASES = (0.4, 0.1, 0.35, 0.15, 0.0)
+AIRCRAFT_DATABASE_COLUMNS = (
+    "icao24",
+    "registration",
+    "manufacturericao",
+    "manufacturername",
+    "model",
+    "typecode",
+    "owner",
+    "operator",
+    "built",
+)
+MODELS = (
+    ("BOEING", "737-8"),
+    ("BOEING", "787-9"),
+    ("AIRBUS", "A320 214"),
+    ("AIRBUS", "A321 271NX"),
+    ("EMBRAER", "ERJ 190-100"),
+    ("CESSNA", "172S"),
+)
+OPERATORS = ("UIA", "Lufthansa", "Ryanair", "Wizz Air", "Private", "")
+
+
+class TrafficGenerator:
+    def __init__(
+        self,
+        aircraft: int,
+        seed: int = 0,
+        start: int = 1712338230,
+        interval: int = 60,
+        rates: TrafficRates = TRAFFIC_RATES,
+    ) -> None:
+        self._rng = np.random.default_rng(seed)
+        self.rates = rates
+        self.interval = interval
+        self.time = start
+        self.icao24 = self._rng.choice(2**24, size=aircraft, replace=False)
+        self._hex = np.array([f"{code:06x}" for code in self.icao24.tolist()])
+        self._callsigns = np.char.add("TST", (self.icao24 % 10000).astype(str))
+        self.phase = self._rng.choice(
+            len(INITIAL_PHASES), size=aircraft, p=INITIAL_PHASES
+        )
+        self.remaining = np.zeros(aircraft, dtype=np.int64)
+        self._draw_remaining(mask=np.ones(aircraft, dtype=bool))
+        self.last_contact = np.full(aircraft, start, dtype=np.int64)
+        self.longitude = self._rng.uniform(-180, 180, size=aircraft)
+        self.latitude = self._rng.uniform(-60, 70, size=aircraft)
+        self.altitude = np.where(
+            self.phase == FLIGHT_PHASES.CRUISE,
+            self._rng.uniform(9000, 12000, size=aircraft),
+            self._rng.uniform(0, 4000, size=aircraft),
+        )
+
+    def _draw_remaining(self, mask: np.ndarray) -> None:
+        for phase, (low, high) in PHASE_STEPS.items():
+            selected = mask & (self.phase == phase)
+            self.remaining[selected] = self._rng.integers(
+                low, high, size=int(selected.sum())
+            )
+
+    def _advance(self) -> None:
+        self.time += self.interval
+        self.remaining -= 1
+        finished = self.remaining <= 0
+        self.phase[finished] = (self.phase[finished] + 1) % len(FLIGHT_PHASES)
+        self._draw_remaining(mask=finished)
+
+    def _kinematics(self) -> tuple:
+        size = self.phase.size
+        velocity = np.zeros(size)
+        vertical_rate = np.zeros(size)
+        for phase, speed, rate in (
+            (FLIGHT_PHASES.CLIMB, (80, 200), (2, 15)),
+            (FLIGHT_PHASES.CRUISE, (200, 260), (0, 0)),
+            (FLIGHT_PHASES.DESCENT, (60, 200), (-10, -2)),
+            (FLIGHT_PHASES.ROLLOUT, (0, 9), (0, 0)),
+        ):
+            selected = self.phase == phase
+            count = int(selected.sum())
+            velocity[selected] = self._rng.uniform(*speed, size=count).round(2)
+            vertical_rate[selected] = self._rng.uniform(*rate, size=count).round(2)
+        turbulent = (self.phase == FLIGHT_PHASES.CRUISE) & (
+            self._rng.random(size) < 0.3
+        )
+        vertical_rate[turbulent] = self._rng.normal(0, 0.3, int(turbulent.sum())).round(
+            2
+        )
+        climbing = self.phase == FLIGHT_PHASES.CLIMB
+        descending = self.phase == FLIGHT_PHASES.DESCENT
+        self.altitude[climbing] += vertical_rate[climbing] * self.interval
+        self.altitude[descending] += vertical_rate[descending] * self.interval
+        np.clip(self.altitude, 0, 13000, out=self.altitude)
+        self.altitude[self.phase == FLIGHT_PHASES.ROLLOUT] = 0
+        return velocity, vertical_rate
+
+    def _missing(self, rate: float) -> np.ndarray:
+        return self._rng.random(self.phase.size) < rate
+
+    def snapshot(self) -> dict:
+        rates = self.rates
+        velocity, vertical_rate = self._kinematics()
+        reported = (self.phase != FLIGHT_PHASES.PARKED) & ~self._missing(
+            rate=rates.DROPOUT
+        )
+        self.last_contact[reported] = self.time - self._rng.integers(
+            0, max(self.interval // 4, 1), size=int(reported.sum())
+        )
+        stale = reported & self._missing(rate=rates.STALE)
+        self.last_contact[stale] -= self._rng.integers(
+            self.interval, 10 * self.interval, size=int(stale.sum())
+        )
+        on_ground = self.phase == FLIGHT_PHASES.ROLLOUT
+        indices = np.flatnonzero(reported)
+        columns = [
+            self._hex[indices].tolist(),
+            self._nullable(
+                values=self._callsigns, rate=rates.CALLSIGN_NA, indices=indices
+            ),
+            ["Ukraine"] * indices.size,
+            self._nullable(
+                values=self.last_contact, rate=rates.POSITION_NA, indices=indices
+            ),
+            self.last_contact[indices].tolist(),
+            self._nullable(
+                values=self.longitude.round(4), rate=rates.POSITION_NA, indices=indices
+            ),
+            self._nullable(
+                values=self.latitude.round(4), rate=rates.POSITION_NA, indices=indices
+            ),
+            self._nullable(
+                values=self.altitude.round(2), rate=rates.ALTITUDE_NA, indices=indices
+            ),
+            on_ground[indices].tolist(),
+            self._nullable(values=velocity, rate=rates.VELOCITY_NA, indices=indices),
+            self._rng.uniform(0, 360, size=indices.size).round(2).tolist(),
+            self._nullable(
+                values=vertical_rate, rate=rates.VERTICAL_RATE_NA, indices=indices
+            ),
+            [None] * indices.size,
+            self._nullable(
+                values=self.altitude.round(2), rate=rates.ALTITUDE_NA, indices=indices
+            ),
+            ["1000"] * indices.size,
+            [False] * indices.size,
+            [0] * indices.size,
+        ]
+        snapshot = {"time": self.time, "states": list(zip(*columns))}
+        self._advance()
+        return snapshot
+
+    def _nullable(self, values: np.ndarray, rate: float, indices: np.ndarray) -> List:
+        missing = self._missing(rate=rate)[indices]
+        values = values[indices].astype(object)
+        values[missing] = None
+        return values.tolist()
+
+    def payload(self) -> bytes:
+        return json.dumps(self.snapshot(), separators=(",", ":")).encode()
+
+    def payloads(self, count: int) -> Iterator[bytes]:
+        for _ in range(count):
+            yield self.payload()
+
+    def write_aircraft_database(self, path: str) -> str:
+        rng = np.random.default_rng(self.icao24.size)
+        models = rng.integers(0, len(MODELS), size=self.icao24.size)
+        operators = rng.integers(0, len(OPERATORS), size=self.icao24.size)
+        built = rng.integers(1970, 2024, size=self.icao24.size)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file, quoting=csv.QUOTE_ALL)
+            writer.writerow(AIRCRAFT_DATABASE_COLUMNS)
+            for index, code in enumerate(self.icao24.tolist()):
+                manufacturer, model = MODELS[models[index]]
+                writer.writerow(
+                    (
+                        f"{code:06x}",
+                        f"UR-{code % 17576:05d}",
+                        manufacturer,
+                        manufacturer.title(),
+                        model,
+                        "",
+                        OPERATORS[operators[index]],
+                        OPERATORS[operators[index]],
+                        "" if index % 7 == 0 else f"{built[index]}-01-01",
+                    )
+                )
+        return path
@@ -0,0 +1,348 @@
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Union
+import unittest
+
+from bson import ObjectId
+from commands.built_string_to_dt import BuiltStringToDatetimeMigration
+from commands.migration import (
+    Migration,
+    MigrationRange,
+    MigrationRunner,
+    range_filter,
+    ranges_from_boundaries,
+)
+from pymongo.errors import BulkWriteError
+
+
+OPERATORS = {
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+    "$in": lambda value, bound: value in bound,
+}
+
+
+def matches(document: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(
+                OPERATORS[operator](document[key], bound)
+                for operator, bound in condition.items()
+            ):
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documents: List[dict]) -> None:
+        self.documents = documents
+
+    def sort(self, keys: Any, direction: int = 1) -> "FakeCursor":
+        keys = [(keys, direction)] if isinstance(keys, str) else keys
+        for key, direction in reversed(keys):
+            self.documents.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def batch_size(self, size: int) -> "FakeCursor":
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class FakeCollection:
+    def __init__(self, time_series: bool = False) -> None:
+        self.time_series = time_series
+        self.documents: List[dict] = []
+        self.inserted = 0
+
+    def ids(self) -> List[Any]:
+        return sorted(document["_id"] for document in self.documents)
+
+    def _matching(self, query: dict) -> List[dict]:
+        return [document for document in self.documents if matches(document, query)]
+
+    def find(self, query: dict, projection: Union[dict, None] = None) -> FakeCursor:
+        documents = [dict(document) for document in self._matching(query=query)]
+        if projection is not None:
+            documents = [
+                {key: document[key] for key in projection if key in document}
+                for document in documents
+            ]
+        return FakeCursor(documents=documents)
+
+    def find_one(self, query: dict) -> dict:
+        return next(iter(self.find(query=query)), None)
+
+    def insert_many(self, documents: List[dict], ordered: bool = True) -> None:
+        errors = []
+        ids = {document["_id"] for document in self.documents}
+        for index, document in enumerate(documents):
+            document = {"_id": ObjectId(), **document}
+            if not self.time_series and document["_id"] in ids:
+                errors.append({"index": index, "code": 11000})
+                continue
+            ids.add(document["_id"])
+            self.documents.append(document)
+            self.inserted += 1
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def update_one(self, query: dict, update: dict) -> None:
+        stored = self._matching(query=query)[0]
+        stored.update(update.get("$set", {}))
+        for key, increment in update.get("$inc", {}).items():
+            stored[key] += increment
+
+    def delete_many(self, query: dict) -> SimpleNamespace:
+        deleted = self._matching(query=query)
+        self.documents = [d for d in self.documents if d not in deleted]
+        return SimpleNamespace(deleted_count=len(deleted))
+
+    def aggregate(self, pipeline: List[dict]) -> List[dict]:
+        bucket_auto = pipeline[0]["$bucketAuto"]
+        field = bucket_auto["groupBy"][1:]
+        values = sorted(document[field] for document in self.documents)
+        size = -(-len(values) // bucket_auto["buckets"])
+        buckets, start = [], 0
+        while start < len(values):
+            end = min(start + size, len(values))
+            while end < len(values) and values[end] == values[end - 1]:
+                end += 1
+            buckets.append({"_id": {"min": values[start], "max": values[end - 1]}})
+            start = end
+        return buckets
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.databases = defaultdict(lambda: defaultdict(FakeCollection))
+
+    def __getitem__(self, name: str) -> Dict[str, FakeCollection]:
+        return self.databases[name]
+
+    def close(self) -> None:
+        pass
+
+
+class FakeRunner(MigrationRunner):
+    def __init__(self, client: FakeClient, **kwargs) -> None:
+        super().__init__(workers=1, **kwargs)
+        self.client = client
+
+    def _client(self) -> FakeClient:
+        return self.client
+
+
+class DoubleDuration(Migration):
+    def __init__(self, field: str = "_id", fail_on: int = 0) -> None:
+        super().__init__(
+            name="double_duration", source_db="old", target_db="new", field=field
+        )
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def transform(self, documents: List[dict]) -> List[dict]:
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("Migration interrupted")
+        return [
+            {**document, "duration_minutes": document["duration_minutes"] * 2}
+            for document in documents
+        ]
+
+
+class TestRanges(unittest.TestCase):
+    def test_ranges_from_boundaries(self) -> None:
+        ranges = ranges_from_boundaries(boundaries=[10, 20])
+
+        self.assertEqual(
+            ranges,
+            [
+                MigrationRange(index=0, lower=None, upper=10),
+                MigrationRange(index=1, lower=10, upper=20),
+                MigrationRange(index=2, lower=20, upper=None),
+            ],
+        )
+
+    def test_range_filter(self) -> None:
+        migration_range = MigrationRange(index=1, lower=10, upper=20)
+
+        self.assertEqual(
+            range_filter(field="landed_at", migration_range=migration_range),
+            {"$and": [{"landed_at": {"$gte": 10}}, {"landed_at": {"$lt": 20}}]},
+        )
+        self.assertEqual(
+            range_filter(
+                field="landed_at", migration_range=migration_range, last=[12, 7]
+            ),
+            {
+                "$and": [
+                    {
+                        "$or": [
+                            {"landed_at": {"$gt": 12}},
+                            {"landed_at": 12, "_id": {"$gt": 7}},
+                        ]
+                    },
+                    {"landed_at": {"$lt": 20}},
+                ]
+            },
+        )
+        self.assertEqual(
+            range_filter(
+                field="_id",
+                migration_range=MigrationRange(index=0, lower=None, upper=None),
+                last=[3, 3],
+            ),
+            {"_id": {"$gt": 3}},
+        )
+        self.assertEqual(
+            range_filter(
+                field="_id",
+                migration_range=MigrationRange(index=0, lower=None, upper=None),
+            ),
+            {},
+        )
+
+
+class TestMigrationRunner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeClient()
+        self.source = self.client["old"]["flights"]
+        for index in range(50):
+            self.source.documents.append(
+                {
+                    "_id": index,
+                    "icao24": f"{index:06x}",
+                    "landed_at": datetime(2024, 4, 5, index % 12),
+                    "duration_minutes": index,
+                }
+            )
+        self.target = self.client["new"]["flights"]
+        self.control = self.client["new"]["migrations"]
+
+    def runner(self, migration: Migration) -> FakeRunner:
+        return FakeRunner(
+            client=self.client, migration=migration, ranges=4, batch_size=4
+        )
+
+    def assertMigrated(self) -> None:
+        self.assertEqual(self.target.ids(), list(range(50)))
+        for document in self.target.documents:
+            self.assertEqual(document["duration_minutes"], document["_id"] * 2)
+
+    def test_run(self) -> None:
+        with self.assertLogs("commands.migration") as logm:
+            total = self.runner(migration=DoubleDuration(field="landed_at")).run()
+
+        self.assertEqual(total, 50)
+        self.assertMigrated()
+        checkpoints = sorted(self.control.documents, key=lambda d: d["index"])
+        self.assertEqual(len(checkpoints), 4)
+        self.assertTrue(all(checkpoint["done"] for checkpoint in checkpoints))
+        self.assertEqual(sum(checkpoint["documents"] for checkpoint in checkpoints), 50)
+        self.assertIsNone(checkpoints[0]["lower"])
+        self.assertIsNone(checkpoints[-1]["upper"])
+        self.assertIn("Migrated 50 documents of double_duration", logm.output[-1])
+        self.assertIn("docs/s", logm.output[-1])
+
+    def test_resume(self) -> None:
+        with self.assertRaises(RuntimeError):
+            self.runner(migration=DoubleDuration(field="landed_at", fail_on=6)).run()
+        migrated = len(self.target.documents)
+
+        with self.assertLogs("commands.migration") as logm:
+            total = self.runner(migration=DoubleDuration(field="_id")).run()
+
+        self.assertEqual(migrated + total, 50)
+        self.assertMigrated()
+        self.assertIn("over planned field landed_at", logm.output[0])
+        self.assertIn("ranges pending", logm.output[1])
+
+    def test_rerun_skips_done_ranges(self) -> None:
+        self.runner(migration=DoubleDuration()).run()
+
+        total = self.runner(migration=DoubleDuration()).run()
+
+        self.assertEqual(total, 0)
+        self.assertMigrated()
+
+    def test_resume_after_insert_into_time_series(self) -> None:
+        self.target = self.client["new"]["flights"] = FakeCollection(time_series=True)
+        update_one = self.control.update_one
+        updates = []
+
+        def crash_after_insert(query: dict, update: dict) -> None:
+            updates.append(query)
+            if len(updates) == 3:
+                raise RuntimeError("Migration interrupted")
+            update_one(query=query, update=update)
+
+        self.control.update_one = crash_after_insert
+        with self.assertRaises(RuntimeError):
+            self.runner(migration=DoubleDuration(field="landed_at")).run()
+        self.control.update_one = update_one
+        migrated = sum(checkpoint["documents"] for checkpoint in self.control.documents)
+
+        with self.assertLogs("commands.migration", level="WARNING") as logm:
+            total = self.runner(migration=DoubleDuration(field="landed_at")).run()
+
+        self.assertEqual(migrated + total, 50)
+        self.assertEqual(self.target.inserted, 50)
+        self.assertMigrated()
+        self.assertIn("Skipped 4 documents already migrated", logm.output[0])
+
+    def test_reset_and_duplicates(self) -> None:
+        self.runner(migration=DoubleDuration()).run()
+        runner = self.runner(migration=DoubleDuration())
+
+        runner.reset()
+        with self.assertLogs("commands.migration", level="WARNING") as logm:
+            total = runner.run()
+
+        self.assertEqual(total, 50)
+        self.assertMigrated()
+        self.assertIn("already migrated by double_duration", logm.output[0])
+
+
+class TestBuiltStringToDatetimeMigration(unittest.TestCase):
+    def test_transform(self) -> None:
+        flight = {
+            "_id": 1,
+            "icao24": "000001",
+            "landed_at": datetime(2024, 4, 5),
+            "duration_minutes": 30,
+            "registration": "UR-PSA",
+            "model": None,
+            "manufacturer_icao": None,
+            "owner": None,
+            "operator": None,
+        }
+        documents = [
+            {**flight, "built": "2018-01-01"},
+            {**flight, "_id": 2, "built": "2018"},
+            {**flight, "_id": 3, "built": None},
+        ]
+
+        migrated = BuiltStringToDatetimeMigration().transform(documents=documents)
+
+        self.assertEqual(
+            [document["built"] for document in migrated],
+            [datetime(2018, 1, 1), None, None],
+        )
+        self.assertEqual([document["_id"] for document in migrated], [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from plugins.common.icao24 import (
+    decode_icao24,
+    encode_icao24,
+    with_icao24_codes,
+    with_icao24_hex,
+)
+
+
+class TestIcao24(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        codes = np.random.default_rng(0).choice(2**24, size=10_000, replace=False)
+        codes = np.concatenate([codes, [0, 1, 0xFFFFFF]]).astype(np.uint32)
+
+        hex_values = decode_icao24(codes=codes)
+        result, valid = encode_icao24(values=pd.Series(hex_values))
+
+        self.assertTrue(valid.all())
+        self.assertTrue(np.array_equal(result, codes))
+        self.assertEqual(
+            hex_values.tolist(), [f"{code:06x}" for code in codes.tolist()]
+        )
+
+    def test_leading_zeros(self) -> None:
+        values = pd.Series(["000000", "000001", "00a1b2", "0f0000"])
+
+        codes, valid = encode_icao24(values=values)
+
+        self.assertTrue(valid.all())
+        self.assertEqual(codes.tolist(), [0x0, 0x1, 0xA1B2, 0xF0000])
+        self.assertEqual(decode_icao24(codes=codes).tolist(), values.tolist())
+
+    def test_upper_case(self) -> None:
+        codes, valid = encode_icao24(values=pd.Series(["A2345B", "a2345b"]))
+
+        self.assertTrue(valid.all())
+        self.assertEqual(codes.tolist(), [0xA2345B, 0xA2345B])
+        self.assertEqual(decode_icao24(codes=codes).tolist(), ["a2345b", "a2345b"])
+
+    def test_malformed(self) -> None:
+        values = pd.Series(
+            ["a23456", None, "", "a2345", "a234567", "g23456", " a2345", "ü23456"]
+        )
+
+        codes, valid = encode_icao24(values=values)
+
+        self.assertEqual(valid.tolist(), [True] + [False] * 7)
+        self.assertEqual(codes[0], 0xA23456)
+
+    def test_arrow_input(self) -> None:
+        chunked = pa.chunked_array([["zzzzzz", "00a1b2"], ["ffffff"]])
+        sliced = pa.array(["zzzzzz", "00a1b2", "ffffff"]).slice(1)
+
+        for values in (chunked, sliced):
+            codes, valid = encode_icao24(values=values)
+
+            self.assertEqual(codes[valid].tolist(), [0xA1B2, 0xFFFFFF])
+
+    def test_empty(self) -> None:
+        codes, valid = encode_icao24(values=pd.Series([], dtype=object))
+
+        self.assertEqual(len(codes), 0)
+        self.assertEqual(len(valid), 0)
+        self.assertEqual(len(decode_icao24(codes=codes)), 0)
+
+    def test_with_icao24_codes(self) -> None:
+        df = pd.DataFrame(
+            data={"icao24": ["00a1b2", "bad", None, "ffffff"], "velocity": [1, 2, 3, 4]}
+        )
+        df_exp = pd.DataFrame(
+            data={
+                "icao24": np.array([0xA1B2, 0xFFFFFF], dtype=np.uint32),
+                "velocity": [1, 4],
+            }
+        )
+
+        with self.assertLogs() as logm:
+            result = with_icao24_codes(df=df)
+            self.assertIn("Dropping 2 rows with malformed icao24", logm.output[-1])
+
+        self.assertTrue(result.equals(df_exp))
+        self.assertTrue(
+            with_icao24_hex(df=result)["icao24"].equals(
+                pd.Series(["00a1b2", "ffffff"], name="icao24", dtype=object)
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
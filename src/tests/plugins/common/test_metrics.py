@@ -0,0 +1,240 @@
+import json
+import os
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+import pandas as pd
+from plugins.common.constants import METRICS, S3Sts
+from plugins.common.metrics import (
+    StageMetrics,
+    count_rows,
+    instrumented,
+    record_bytes,
+    record_error,
+)
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.opensky.transformers import SourceReports
+
+
+class Pipeline:
+    def __init__(self, rows: int = 3) -> None:
+        self.rows = rows
+
+    @instrumented(stage="extract")
+    def _extract(self) -> pd.DataFrame:
+        record_bytes(count=100)
+        return pd.DataFrame(data={"value": range(self.rows)})
+
+    @instrumented(stage="transform")
+    def _transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        record_error()
+        return df.iloc[:1]
+
+    @instrumented(stage="batches")
+    def _batches(self, df: pd.DataFrame):
+        for start in range(0, len(df), 2):
+            yield df.iloc[start : start + 2]
+
+    @instrumented(stage="allocate")
+    def _allocate(self) -> int:
+        return len(bytearray(1 << 22))
+
+    @instrumented(stage="etl")
+    def etl(self) -> pd.DataFrame:
+        df = self._extract()
+        list(self._batches(df=df))
+        return self._transform(df=df)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.textfile_dir = tempfile.TemporaryDirectory()
+        self.settings = METRICS._replace(
+            ENABLED=True,
+            EXPORTERS=("log",),
+            TRACE_MEMORY=False,
+            TEXTFILE_DIR=self.textfile_dir.name,
+        )
+
+    def tearDown(self) -> None:
+        self.textfile_dir.cleanup()
+
+    def enable(self, **settings) -> None:
+        patcher = mock.patch(
+            "plugins.common.metrics.METRICS", self.settings._replace(**settings)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_logged(self, func) -> dict:
+        with self.assertLogs("plugins.common.metrics") as logm:
+            func()
+        self.assertEqual(len(logm.records), 1)
+        return json.loads(logm.records[0].getMessage())
+
+    def test_disabled(self) -> None:
+        self.enable(ENABLED=False)
+
+        with self.assertNoLogs("plugins.common.metrics"):
+            result = Pipeline().etl()
+
+        self.assertEqual(len(result), 1)
+
+    def test_run_logged_once(self) -> None:
+        self.enable()
+
+        line = self.run_logged(func=Pipeline(rows=5).etl)
+
+        self.assertEqual(line["run"], "Pipeline.etl")
+        stages = line["stages"]
+        self.assertEqual(
+            list(stages),
+            [
+                "Pipeline.extract",
+                "Pipeline.batches",
+                "Pipeline.transform",
+                "Pipeline.etl",
+            ],
+        )
+        self.assertEqual(stages["Pipeline.extract"]["rows_out"], 5)
+        self.assertEqual(stages["Pipeline.extract"]["bytes"], 100)
+        self.assertEqual(stages["Pipeline.etl"]["bytes"], 100)
+        self.assertEqual(stages["Pipeline.transform"]["rows_in"], 5)
+        self.assertEqual(stages["Pipeline.transform"]["rows_out"], 1)
+        self.assertEqual(stages["Pipeline.transform"]["errors"], 1)
+        self.assertEqual(stages["Pipeline.etl"]["errors"], 1)
+        self.assertEqual(stages["Pipeline.extract"]["errors"], 0)
+        self.assertEqual(stages["Pipeline.batches"]["calls"], 4)
+        self.assertEqual(stages["Pipeline.batches"]["rows_in"], 5)
+        self.assertEqual(stages["Pipeline.batches"]["rows_out"], 5)
+        for metrics in stages.values():
+            self.assertGreaterEqual(metrics["wall_seconds"], 0)
+            self.assertGreaterEqual(metrics["cpu_seconds"], 0)
+            self.assertEqual(metrics["peak_bytes"], 0)
+
+    def test_trace_memory(self) -> None:
+        self.enable(TRACE_MEMORY=True)
+
+        line = self.run_logged(func=Pipeline()._allocate)
+
+        self.assertGreaterEqual(
+            line["stages"]["Pipeline.allocate"]["peak_bytes"], 1 << 22
+        )
+
+    def test_count_rows(self) -> None:
+        df = pd.DataFrame(data={"value": range(3)})
+
+        self.assertEqual(count_rows(value=df), 3)
+        self.assertEqual(count_rows(value=[df, df]), 6)
+        self.assertEqual(
+            count_rows(value=SourceReports(states=df, latest_source=df)), 6
+        )
+        self.assertEqual(count_rows(value="path"), 0)
+
+    def test_export_prometheus(self) -> None:
+        self.enable(EXPORTERS=("prometheus",))
+
+        Pipeline().etl()
+
+        path = os.path.join(
+            self.textfile_dir.name, f"{METRICS.PREFIX}_pipeline_etl.prom"
+        )
+        with open(path) as file:
+            lines = file.read().splitlines()
+        self.assertIn(
+            f'{METRICS.PREFIX}_stage_rows_out{{run="Pipeline.etl",'
+            'stage="Pipeline.extract"} 3',
+            lines,
+        )
+        self.assertIn(f"# TYPE {METRICS.PREFIX}_stage_wall_seconds gauge", lines)
+        self.assertEqual(os.listdir(self.textfile_dir.name), [os.path.basename(path)])
+
+    def test_export_statsd(self) -> None:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+            server.bind(("127.0.0.1", 0))
+            server.settimeout(5)
+            self.enable(
+                EXPORTERS=("statsd",),
+                STATSD_HOST="127.0.0.1",
+                STATSD_PORT=server.getsockname()[1],
+            )
+
+            Pipeline()._extract()
+
+            lines = [server.recv(1024).decode() for _ in range(7)]
+        prefix = f"{METRICS.PREFIX}.Pipeline.extract.Pipeline.extract"
+        self.assertTrue(lines[0].startswith(f"{prefix}.wall_seconds:"))
+        self.assertTrue(lines[0].endswith("|ms"))
+        self.assertIn(f"{prefix}.rows_out:3|g", lines)
+        self.assertIn(f"{prefix}.bytes:100|g", lines)
+
+    def test_unknown_exporter(self) -> None:
+        self.enable(EXPORTERS=("unknown",))
+
+        with self.assertLogs("plugins.common.metrics", level="WARNING") as logm:
+            Pipeline()._extract()
+
+        self.assertIn("Unknown metrics exporter unknown", logm.output[0])
+
+    def test_merge(self) -> None:
+        first = StageMetrics(calls=1, wall_seconds=1.0, rows_out=2, peak_bytes=5)
+        second = StageMetrics(calls=1, wall_seconds=0.5, rows_out=3, peak_bytes=4)
+
+        merged = first.merge(second)
+
+        self.assertEqual(
+            merged,
+            StageMetrics(calls=2, wall_seconds=1.5, rows_out=5, peak_bytes=5),
+        )
+
+
+class TestS3Metrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        boto3.client("s3", region_name=credentials.REGION).create_bucket(
+            Bucket=credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": credentials.REGION},
+        )
+        self.s3_bucket = S3BucketConnector(credentials=credentials)
+        patcher = mock.patch(
+            "plugins.common.metrics.METRICS",
+            METRICS._replace(ENABLED=True, EXPORTERS=("log",)),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        S3BucketConnector.clear_clients()
+        self.mock.stop()
+
+    def test_bytes_transferred(self) -> None:
+        df = pd.DataFrame(data={"value": range(10)})
+        with self.assertLogs("plugins.common.metrics") as logm:
+            self.s3_bucket.upload_to_parquet(df=df, filename="test")
+            self.s3_bucket.read_parquet(filename="test")
+        size = self.s3_bucket._s3.head_object(Bucket="test-bucket", Key="test.parquet")[
+            "ContentLength"
+        ]
+
+        upload, read = [
+            json.loads(record.getMessage())["stages"] for record in logm.records
+        ]
+
+        self.assertEqual(upload["S3BucketConnector.upload_to_parquet"]["bytes"], size)
+        self.assertEqual(read["S3BucketConnector.read_parquet_table"]["bytes"], size)
+        self.assertEqual(read["S3BucketConnector.read_parquet_table"]["rows_out"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import os
+import pstats
+import sys
+import tempfile
+from time import perf_counter
+import unittest
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from plugins.common.constants import PROFILING, S3Sts
+from plugins.common.profiling import (
+    TaskProfiler,
+    collapse_stack,
+    collapse_stats,
+    profile_key,
+)
+from plugins.common.s3 import S3BucketConnector
+
+
+def busy_loop(seconds: float = 0.05) -> int:
+    total, start = 0, perf_counter()
+    while perf_counter() - start < seconds:
+        total += sum(range(1000))
+    return total
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_profile_key(self) -> None:
+        key = profile_key("adsb_etl", "manual__2024-01-01T00:00:00+00:00", "task")
+
+        self.assertEqual(key, "adsb_etl/manual__2024-01-01T00_00_00_00_00/task")
+
+    def test_collapse_stack(self) -> None:
+        stack = collapse_stack(frame=sys._getframe())
+
+        self.assertTrue(stack.endswith(f"{__name__}:test_collapse_stack"))
+        self.assertNotIn(" ", stack)
+
+    def test_write_deterministic(self) -> None:
+        with self.assertLogs("plugins.common.profiling") as logm:
+            with TaskProfiler(
+                key=profile_key("dag", "run", "task"),
+                directory=self.directory.name,
+                mode="deterministic",
+            ) as profiler:
+                busy_loop()
+
+        pstats_path, collapsed_path = profiler.paths()
+        self.assertEqual(
+            pstats_path, os.path.join(self.directory.name, "dag/run/task.pstats")
+        )
+        self.assertEqual(
+            collapsed_path, os.path.join(self.directory.name, "dag/run/task.collapsed")
+        )
+        stats = pstats.Stats(pstats_path)
+        self.assertTrue(any(function == "busy_loop" for _, _, function in stats.stats))
+        with open(collapsed_path) as file:
+            lines = file.read().splitlines()
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertTrue(
+            any(
+                "test_profiling:busy_loop;<built-in_method_builtins.sum>" in line
+                for line in lines
+            )
+        )
+        self.assertFalse(profiler.stacks)
+        self.assertIn("Hot functions for dag/run/task:", logm.output[-1])
+        self.assertIn("busy_loop", logm.output[-1])
+
+    def test_write_sampling(self) -> None:
+        with self.assertLogs("plugins.common.profiling") as logm:
+            with TaskProfiler(
+                key=profile_key("dag", "run", "task"),
+                directory=self.directory.name,
+                mode="sampling",
+                sample_seconds=0.001,
+            ) as profiler:
+                busy_loop()
+
+        self.assertEqual(
+            profiler.paths(),
+            [os.path.join(self.directory.name, "dag/run/task.collapsed")],
+        )
+        with open(profiler.paths()[0]) as file:
+            lines = file.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any(f"{__name__}:busy_loop" in line for line in lines))
+        self.assertFalse(any("cProfile" in line for line in lines))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory.name, "dag/run/task.pstats"))
+        )
+        self.assertIn("Hot functions for dag/run/task:", logm.output[-1])
+        self.assertIn("samples", logm.output[-1])
+
+    def test_collapse_stats(self) -> None:
+        root = ("jobs.py", 1, "run")
+        parse = ("jobs.py", 10, "parse")
+        write = ("jobs.py", 20, "write")
+        encode = ("codec.py", 5, "encode")
+        stats = {
+            root: (1, 1, 0.1, 1.0, {}),
+            parse: (1, 1, 0.2, 0.4, {root: (1, 1, 0.2, 0.4)}),
+            write: (1, 1, 0.1, 0.5, {root: (1, 1, 0.1, 0.5)}),
+            encode: (
+                2,
+                2,
+                0.6,
+                0.6,
+                {parse: (1, 1, 0.2, 0.2), write: (1, 1, 0.4, 0.4)},
+            ),
+        }
+
+        stacks = collapse_stats(stats=stats)
+
+        self.assertEqual(
+            stacks,
+            {
+                "jobs:run": 100000,
+                "jobs:run;jobs:parse": 200000,
+                "jobs:run;jobs:parse;codec:encode": 200000,
+                "jobs:run;jobs:write": 100000,
+                "jobs:run;jobs:write;codec:encode": 400000,
+            },
+        )
+
+    def test_unknown_mode(self) -> None:
+        with self.assertRaises(ValueError) as _:
+            TaskProfiler(key="unknown", mode="both")
+
+    def test_hot_functions_limit(self) -> None:
+        with TaskProfiler(
+            key="limited", directory=self.directory.name, top_functions=2
+        ) as profiler:
+            busy_loop()
+
+        self.assertEqual(len(profiler.hot_functions()), 2)
+
+    def test_exception_propagates(self) -> None:
+        with self.assertRaises(ValueError):
+            with TaskProfiler(key="failed", directory=self.directory.name):
+                raise ValueError("failed")
+
+        for extension in ("pstats", "collapsed"):
+            self.assertTrue(
+                os.path.exists(os.path.join(self.directory.name, f"failed.{extension}"))
+            )
+
+
+class FailingBucket:
+    def upload_file(self, path: str, key: str) -> None:
+        raise ClientError({"Error": {"Code": "AccessDenied"}}, "PutObject")
+
+
+class TestProfilingUpload(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        self.directory = tempfile.TemporaryDirectory()
+        credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        self.s3 = boto3.client("s3", region_name=credentials.REGION)
+        self.s3.create_bucket(
+            Bucket=credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": credentials.REGION},
+        )
+        self.s3_bucket = S3BucketConnector(credentials=credentials)
+
+    def tearDown(self) -> None:
+        S3BucketConnector.clear_clients()
+        self.directory.cleanup()
+        self.mock.stop()
+
+    def test_upload(self) -> None:
+        with TaskProfiler(
+            key=profile_key("dag", "run", "task"),
+            directory=self.directory.name,
+            s3_bucket=self.s3_bucket,
+        ):
+            busy_loop()
+
+        keys = [
+            item["Key"]
+            for item in self.s3.list_objects_v2(Bucket="test-bucket")["Contents"]
+        ]
+        self.assertEqual(
+            sorted(keys),
+            [
+                f"{PROFILING.S3_PREFIX}/dag/run/task.collapsed",
+                f"{PROFILING.S3_PREFIX}/dag/run/task.pstats",
+            ],
+        )
+
+    def test_upload_failure_keeps_task_outcome(self) -> None:
+        with self.assertLogs("plugins.common.profiling", level="WARNING") as logm:
+            with TaskProfiler(
+                key="uploaded", directory=self.directory.name, s3_bucket=FailingBucket()
+            ):
+                busy_loop()
+        self.assertIn("Failed to write profile uploaded", logm.output[0])
+
+        with self.assertRaises(ValueError) as _:
+            with TaskProfiler(
+                key="failed", directory=self.directory.name, s3_bucket=FailingBucket()
+            ):
+                raise ValueError("failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,17 @@
 from io import BytesIO
+import os
+import tempfile
 from typing import Dict, List
 import unittest
+from unittest import mock
 
 import boto3
 from botocore.exceptions import ClientError
 from moto import mock_aws
 import pandas as pd
-from plugins.common.constants import S3Sts
+from plugins.common.cache import S3DiskCache
+from plugins.common.constants import S3_CLIENT, S3Sts
+from plugins.common.exceptions import InvalidSource
 
 from plugins.common.s3 import S3BucketConnector
 
@@ -67,6 +72,61 @@ class TestS3BucketConnectorMethods(unittest.TestCase):
 
         self.assertTrue(result.empty)
 
+    def test_read_parquet_projected(self) -> None:
+        filename = "test_file"
+        key = f"{filename}.parquet"
+        rows = 50_000
+        df = pd.DataFrame(
+            data={
+                "col1": range(rows),
+                "col2": [str(value) for value in range(rows)],
+                "col3": 1.0,
+            }
+        )
+        out_buffer = BytesIO()
+        df.to_parquet(path=out_buffer, index=False, row_group_size=5_000)
+        self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=key)
+        df_expected = df.loc[df["col1"] >= 47_500, ["col1"]].reset_index(drop=True)
+
+        with mock.patch.object(
+            self.s3_bucket_connection._s3,
+            "get_object",
+            wraps=self.s3_bucket_connection._s3.get_object,
+        ) as get_object:
+            result = self.s3_bucket_connection.read_parquet(
+                filename=filename, columns=["col1"], filters=[("col1", ">=", 47_500)]
+            )
+
+        self.assertTrue(result.equals(df_expected))
+        for call in get_object.call_args_list:
+            self.assertIn("Range", call.kwargs)
+        bytes_read = sum(
+            len(range(*map(int, call.kwargs["Range"][6:].split("-"))))
+            for call in get_object.call_args_list
+        )
+        self.assertLess(bytes_read, len(out_buffer.getvalue()) // 2)
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
+    def test_read_parquet_projected_empty(self) -> None:
+        result = self.s3_bucket_connection.read_parquet(
+            filename="test_file", columns=["col1"], filters=[("col1", ">", 0)]
+        )
+
+        self.assertTrue(result.empty)
+
+    def test_read_parquet_projected_missing_column(self) -> None:
+        filename = "test_file"
+        key = f"{filename}.parquet"
+        out_buffer = BytesIO()
+        pd.DataFrame(data={"col1": [1, 2]}).to_parquet(path=out_buffer, index=False)
+        self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=key)
+
+        with self.assertRaises(InvalidSource) as _:
+            self.s3_bucket_connection.read_parquet(filename=filename, columns=["col2"])
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
     def test_upload_to_parquet(self) -> None:
         filename = "test_file"
         key = f"{filename}.parquet"
@@ -83,6 +143,290 @@ class TestS3BucketConnectorMethods(unittest.TestCase):
 
         self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
 
+    def test_upload_parquet_file(self) -> None:
+        filename = "test_file"
+        key = f"{filename}.parquet"
+        test_data: Dict[str, List[int]] = {"col1": [1, 2], "col2": [4, 5]}
+        df_expected = pd.DataFrame(data=test_data)
+
+        with tempfile.NamedTemporaryFile(suffix=".parquet") as file:
+            df_expected.to_parquet(file.name, index=False)
+            self.s3_bucket_connection.upload_parquet_file(
+                path=file.name, filename=filename
+            )
+
+        data = self.s3_bucket.Object(key=key).get().get("Body").read()
+        df_result = pd.read_parquet(BytesIO(data))
+
+        self.assertTrue(df_result.equals(df_expected))
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
+    def test_upload_and_read_json(self) -> None:
+        filename = "test_file"
+        key = f"{filename}.json"
+        data_exp = {"etag": '"abc"', "content_hash": None}
+
+        self.s3_bucket_connection.upload_json(data=data_exp, filename=filename)
+        result = self.s3_bucket_connection.read_json(filename=filename)
+
+        self.assertEqual(result, data_exp)
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
+    def test_read_json_empty(self) -> None:
+        result = self.s3_bucket_connection.read_json(filename="test_file")
+
+        self.assertEqual(result, {})
+
+
+class TestS3BucketConnectorClients(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        S3BucketConnector.clear_clients()
+        self.credentials_dir = tempfile.TemporaryDirectory()
+        self.client_settings = mock.patch(
+            "plugins.common.s3.S3_CLIENT",
+            S3_CLIENT._replace(CREDENTIALS_CACHE_DIR=self.credentials_dir.name),
+        )
+        self.client_settings.start()
+        self.s3_credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        s3 = boto3.resource(
+            "s3", endpoint_url=f"https://s3.{self.s3_credentials.REGION}.amazonaws.com"
+        )
+        s3.create_bucket(
+            Bucket=self.s3_credentials.BUCKET,
+            CreateBucketConfiguration={
+                "LocationConstraint": self.s3_credentials.REGION
+            },
+        )
+
+    def tearDown(self) -> None:
+        S3BucketConnector.clear_clients()
+        self.client_settings.stop()
+        self.credentials_dir.cleanup()
+        self.mock.stop()
+
+    def run_task(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 255
+            try:
+                with mock.patch.object(
+                    S3BucketConnector,
+                    "_assume_role",
+                    wraps=S3BucketConnector._assume_role,
+                ) as assume_role:
+                    connector = S3BucketConnector(credentials=self.s3_credentials)
+                    connector.upload_json(data={"test": True}, filename="test_file")
+                code = assume_role.call_count
+            finally:
+                os._exit(code)
+        return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+    def test_assume_role_once(self) -> None:
+        with mock.patch.object(
+            S3BucketConnector,
+            "_assume_role",
+            wraps=S3BucketConnector._assume_role,
+        ) as assume_role:
+            connectors = [
+                S3BucketConnector(credentials=self.s3_credentials) for _ in range(10)
+            ]
+            for connector in connectors:
+                connector.upload_json(data={"test": True}, filename="test_file")
+                connector.read_json(filename="test_file")
+
+        self.assertEqual(assume_role.call_count, 1)
+        self.assertEqual(len({id(connector._s3) for connector in connectors}), 1)
+
+    def test_client_config(self) -> None:
+        connector = S3BucketConnector(credentials=self.s3_credentials)
+
+        config = connector._s3.meta.config
+        self.assertEqual(config.max_pool_connections, S3_CLIENT.MAX_POOL_CONNECTIONS)
+        self.assertEqual(config.retries["mode"], "adaptive")
+
+    def test_refresh_expired_credentials(self) -> None:
+        expired = {
+            "access_key": "expired",
+            "secret_key": "expired",
+            "token": "expired",
+            "expiry_time": "2000-01-01T00:00:00+00:00",
+        }
+        with mock.patch.object(
+            S3BucketConnector,
+            "_assume_role",
+            side_effect=[expired, S3BucketConnector._assume_role(self.s3_credentials)],
+        ) as assume_role:
+            connector = S3BucketConnector(credentials=self.s3_credentials)
+            connector.upload_json(data={"test": True}, filename="test_file")
+
+        self.assertEqual(assume_role.call_count, 2)
+
+    def test_assume_role_once_across_task_processes(self) -> None:
+        assume_roles = [self.run_task() for _ in range(3)]
+
+        self.assertEqual(assume_roles, [1, 0, 0])
+        (cached,) = os.listdir(self.credentials_dir.name)
+        mode = os.stat(os.path.join(self.credentials_dir.name, cached)).st_mode
+        self.assertEqual(mode & 0o777, 0o600)
+
+    def test_refresh_expiring_cached_credentials(self) -> None:
+        expiring = {
+            **S3BucketConnector._assume_role(self.s3_credentials),
+            "expiry_time": "2000-01-01T00:00:00+00:00",
+        }
+        with mock.patch.object(
+            S3BucketConnector, "_assume_role", return_value=expiring
+        ):
+            S3BucketConnector(credentials=self.s3_credentials)
+        S3BucketConnector.clear_clients()
+
+        self.assertEqual(self.run_task(), 1)
+
+    def test_fork_resets_refreshers(self) -> None:
+        S3BucketConnector(credentials=self.s3_credentials)
+        pid = os.fork()
+        if pid == 0:
+            os._exit(len(S3BucketConnector._refreshers))
+
+        self.assertEqual(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]), 0)
+        self.assertIn(self.s3_credentials, S3BucketConnector._refreshers)
+
+    def test_clear_clients_stops_refreshers(self) -> None:
+        S3BucketConnector(credentials=self.s3_credentials)
+        refresher = S3BucketConnector._refreshers[self.s3_credentials]
+        self.assertTrue(refresher.is_alive())
+
+        S3BucketConnector.clear_clients()
+
+        self.assertFalse(refresher.is_alive())
+        self.assertEqual(S3BucketConnector._refreshers, {})
+
+
+class TestS3BucketConnectorCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        s3_credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        s3 = boto3.resource(
+            "s3", endpoint_url=f"https://s3.{s3_credentials.REGION}.amazonaws.com"
+        )
+        s3.create_bucket(
+            Bucket=s3_credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": s3_credentials.REGION},
+        )
+        self.s3_bucket = s3.Bucket(s3_credentials.BUCKET)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = S3DiskCache(directory=self.cache_dir.name, max_bytes=1 << 20)
+        self.s3_bucket_connection = S3BucketConnector(
+            credentials=s3_credentials, cache=self.cache
+        )
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+        self.mock.stop()
+
+    def put_parquet(self, df: pd.DataFrame, filename: str) -> int:
+        out_buffer = BytesIO()
+        df.to_parquet(path=out_buffer, index=False)
+        self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=f"{filename}.parquet")
+        return len(out_buffer.getvalue())
+
+    def test_read_parquet_hit(self) -> None:
+        df_expected = pd.DataFrame(data={"col1": [1, 2], "col2": [3, 4]})
+        self.put_parquet(df=df_expected, filename="test_file")
+
+        first = self.s3_bucket_connection.read_parquet(
+            filename="test_file", cached=True
+        )
+        second = self.s3_bucket_connection.read_parquet(
+            filename="test_file", cached=True
+        )
+
+        self.assertTrue(first.equals(df_expected))
+        self.assertTrue(second.equals(df_expected))
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_read_parquet_revalidated(self) -> None:
+        self.put_parquet(df=pd.DataFrame(data={"col1": [1]}), filename="test_file")
+        self.s3_bucket_connection.read_parquet(filename="test_file", cached=True)
+        df_expected = pd.DataFrame(data={"col1": [2, 3]})
+        self.put_parquet(df=df_expected, filename="test_file")
+
+        result = self.s3_bucket_connection.read_parquet(
+            filename="test_file", cached=True
+        )
+
+        self.assertTrue(result.equals(df_expected))
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_read_parquet_empty(self) -> None:
+        result = self.s3_bucket_connection.read_parquet(
+            filename="test_file", cached=True
+        )
+
+        self.assertTrue(result.empty)
+
+    def test_read_parquet_projected(self) -> None:
+        df = pd.DataFrame(data={"col1": [1, 2, 3], "col2": [4, 5, 6]})
+        self.put_parquet(df=df, filename="test_file")
+        df_expected = pd.DataFrame(data={"col2": [5, 6]})
+
+        self.s3_bucket_connection.read_parquet(filename="test_file", cached=True)
+        result = self.s3_bucket_connection.read_parquet(
+            filename="test_file",
+            cached=True,
+            columns=["col2"],
+            filters=[("col1", ">", 1)],
+        )
+
+        self.assertTrue(result.equals(df_expected))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_read_parquet_not_cached(self) -> None:
+        self.put_parquet(df=pd.DataFrame(data={"col1": [1]}), filename="test_file")
+
+        self.s3_bucket_connection.read_parquet(filename="test_file")
+        self.s3_bucket_connection.read_parquet(filename="test_file")
+
+        self.assertEqual(self.cache.misses, 0)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_evict_least_recently_used(self) -> None:
+        sizes = [
+            self.put_parquet(
+                df=pd.DataFrame(data={"col1": list(range(index + 1))}),
+                filename=f"test_file_{index}",
+            )
+            for index in range(3)
+        ]
+        self.cache.max_bytes = sizes[1] + sizes[2]
+
+        for index in range(3):
+            self.s3_bucket_connection.read_parquet(
+                filename=f"test_file_{index}", cached=True
+            )
+
+        bucket = self.s3_bucket.name
+        self.assertIsNone(self.cache.get(bucket=bucket, key="test_file_0.parquet"))
+        self.assertIsNotNone(self.cache.get(bucket=bucket, key="test_file_2.parquet"))
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from plugins.common.constants import SOURCE_SCHEMA
+from plugins.common.exceptions import InvalidSource
+from plugins.common.schema import conform_frame, conform_table, frame_to_table
+
+
+def source_fixture() -> pd.DataFrame:
+    source = pd.DataFrame(
+        data={
+            "icao24": np.array([0x65432A, 0x12C456], dtype=np.uint32),
+            "last_contact": [1712338215, 0],
+            "velocity": np.array([210.11, np.nan], dtype=np.float32),
+            "vertical_rate": np.array([-0.70, 0.00], dtype=np.float32),
+            "takeoff_at": [1712338215, None],
+            "flight_last_contact": [1712338215, 1712338110],
+            "flight_trajectory": pd.Categorical(["other", None]),
+            "is_first_contact": [False, True],
+        }
+    )
+    return source.astype(
+        {
+            "last_contact": pd.Int32Dtype(),
+            "takeoff_at": pd.Int32Dtype(),
+            "flight_last_contact": pd.Int32Dtype(),
+        }
+    )
+
+
+class TestSourceSchema(unittest.TestCase):
+    def test_frame_to_table(self) -> None:
+        table = frame_to_table(df=source_fixture(), schema=SOURCE_SCHEMA)
+
+        self.assertTrue(table.schema.equals(SOURCE_SCHEMA))
+
+    def test_frame_to_table_invalid(self) -> None:
+        source = source_fixture()
+        invalid = (
+            source.drop(columns=["velocity"]),
+            source.assign(icao24=["65432a", "12c456"]),
+            source.assign(icao24=[0x65432A, None]),
+        )
+
+        for df in invalid:
+            with self.assertRaises(InvalidSource) as _:
+                frame_to_table(df=df, schema=SOURCE_SCHEMA)
+
+    def test_conform_frame_round_trip(self) -> None:
+        source = source_fixture()
+
+        result = conform_frame(df=source, schema=SOURCE_SCHEMA)
+
+        self.assertTrue(result.equals(source))
+
+    def test_conform_table_dictionary_width(self) -> None:
+        table = frame_to_table(df=source_fixture(), schema=SOURCE_SCHEMA)
+        index = table.schema.get_field_index("flight_trajectory")
+        trajectory = table.column(index).cast(pa.dictionary(pa.int32(), pa.string()))
+        table = table.set_column(index, "flight_trajectory", trajectory)
+
+        result = conform_table(table=table, schema=SOURCE_SCHEMA)
+
+        self.assertTrue(result.schema.field(index).type.equals(trajectory.type))
+
+    def test_conform_table_legacy(self) -> None:
+        source = source_fixture()
+        legacy = source.astype(
+            {"velocity": float, "vertical_rate": float, "flight_trajectory": object}
+        )
+        legacy["icao24"] = ["65432a", "bad"]
+        table = pa.Table.from_pandas(legacy, preserve_index=False)
+
+        with self.assertLogs() as logm:
+            result = conform_table(table=table, schema=SOURCE_SCHEMA)
+            self.assertIn("Dropping 1 rows with malformed icao24", logm.output[-1])
+
+        self.assertTrue(result.schema.equals(SOURCE_SCHEMA))
+        self.assertEqual(result.column("icao24").to_pylist(), [0x65432A])
+
+    def test_conform_table_projected(self) -> None:
+        table = frame_to_table(df=source_fixture(), schema=SOURCE_SCHEMA)
+
+        result = conform_table(
+            table=table, schema=SOURCE_SCHEMA, columns=["takeoff_at", "icao24"]
+        )
+
+        self.assertEqual(result.column_names, ["takeoff_at", "icao24"])
+        with self.assertRaises(InvalidSource) as _:
+            conform_table(table=table, schema=SOURCE_SCHEMA, columns=["registration"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,361 @@
+import os
+import tempfile
+from typing import Any, List
+import unittest
+from unittest import mock
+
+import boto3
+import fakeredis
+from moto import mock_aws
+import numpy as np
+import pandas as pd
+from plugins.common.constants import S3Sts
+from plugins.common.constants import StateStore as StateStoreSettings
+from plugins.common.exceptions import InvalidSource
+from plugins.common.s3 import S3BucketConnector
+import pyarrow as pa
+from plugins.common.state import (
+    ArrowStateStore,
+    MemoryStateStore,
+    RedisStateStore,
+    S3ParquetStateStore,
+    StateStore,
+    get_state_store,
+)
+import redis
+
+
+def source_fixture() -> pd.DataFrame:
+    source = pd.DataFrame(
+        data={
+            "icao24": np.array([0x65432A, 0x12C456, 0x1B3456], dtype=np.uint32),
+            "last_contact": [1712338215, 1712338215, 0],
+            "velocity": np.array([210.11, 18.41, np.nan], dtype=np.float32),
+            "vertical_rate": np.array([-0.70, 6.11, 0.00], dtype=np.float32),
+            "takeoff_at": [1712338215, 0, None],
+            "flight_last_contact": [1712338215, 1712338215, 1712338110],
+            "flight_trajectory": pd.Categorical(["other", None, "climb"]),
+            "is_first_contact": [False, True, False],
+        }
+    )
+    return source.astype(
+        {
+            "last_contact": pd.Int32Dtype(),
+            "takeoff_at": pd.Int32Dtype(),
+            "flight_last_contact": pd.Int32Dtype(),
+        }
+    )
+
+
+class StateStoreTests:
+    store: StateStore
+
+    def expected(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df
+
+    def test_read_empty(self) -> None:
+        result = self.store.read()
+
+        self.assertTrue(result.empty)
+
+    def test_write_and_read(self) -> None:
+        source = source_fixture()
+
+        self.store.write(df=source)
+        result = self.store.read()
+
+        self.assertTrue(result.equals(self.expected(df=source)))
+
+    def test_read_projected(self) -> None:
+        source = source_fixture()
+        columns = ["icao24", "takeoff_at", "flight_last_contact"]
+        result_exp = source.loc[source["flight_last_contact"] > 1712338200, columns]
+        result_exp = result_exp.reset_index(drop=True)
+
+        self.store.write(df=source)
+        result = self.store.read(
+            columns=columns, filters=[("flight_last_contact", ">", 1712338200)]
+        )
+
+        self.assertTrue(result.equals(self.expected(df=result_exp)))
+
+    def test_read_projected_missing_column(self) -> None:
+        self.store.write(df=source_fixture())
+
+        with self.assertRaises(InvalidSource) as _:
+            self.store.read(columns=["registration"])
+
+    def test_write_replaces_state(self) -> None:
+        source = source_fixture()
+        self.store.write(df=source)
+        active = source.iloc[[2, 0]].reset_index(drop=True)
+
+        self.store.write(df=active)
+        result = self.store.read()
+
+        self.assertTrue(result.equals(self.expected(df=active)))
+
+    def test_read_legacy_types(self) -> None:
+        source = source_fixture()
+        legacy = source.astype(
+            {"velocity": float, "vertical_rate": float, "flight_trajectory": object}
+        )
+        legacy["icao24"] = ["65432a", "12c456", "1b3456"]
+        self.write_legacy(df=legacy)
+
+        result = self.store.read()
+
+        self.assertTrue(result.equals(self.expected(df=source)))
+
+    def test_write_invalid(self) -> None:
+        with self.assertRaises(InvalidSource) as _:
+            self.store.write(df=source_fixture().drop(columns=["velocity"]))
+
+    def test_write_empty(self) -> None:
+        source = source_fixture()
+        self.store.write(df=source)
+        empty = source.iloc[0:0]
+
+        self.store.write(df=empty)
+        result = self.store.read()
+
+        self.assertTrue(result.empty)
+        self.assertEqual(list(result.columns), list(source.columns))
+
+
+class S3StateStoreTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        s3_credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        s3 = boto3.resource(
+            "s3", endpoint_url=f"https://s3.{s3_credentials.REGION}.amazonaws.com"
+        )
+        s3.create_bucket(
+            Bucket=s3_credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": s3_credentials.REGION},
+        )
+        self.s3_bucket = s3.Bucket(s3_credentials.BUCKET)
+        self.s3_bucket_connection = S3BucketConnector(credentials=s3_credentials)
+        self.filename = "test-source"
+
+    def write_legacy(self, df: pd.DataFrame) -> None:
+        self.s3_bucket_connection.upload_to_parquet(df=df, filename=self.filename)
+
+    def tearDown(self) -> None:
+        self.mock.stop()
+
+
+class TestS3ParquetStateStore(StateStoreTests, S3StateStoreTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.store = S3ParquetStateStore(
+            s3_bucket=self.s3_bucket_connection, filename=self.filename
+        )
+
+
+class TestArrowStateStore(StateStoreTests, S3StateStoreTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ArrowStateStore(
+            s3_bucket=self.s3_bucket_connection,
+            filename=self.filename,
+            directory=self.directory.name,
+            checkpoint_seconds=60,
+        )
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        super().tearDown()
+
+    def checkpointed(self) -> pd.DataFrame:
+        return self.s3_bucket_connection.read_parquet(filename=self.filename)
+
+    def test_checkpoint_interval(self) -> None:
+        source = source_fixture()
+
+        self.store.write(df=source)
+        self.store.write(df=source.iloc[[0]])
+
+        self.assertTrue(self.checkpointed().equals(source))
+
+        os.utime(self.store.checkpoint_path, times=(0, 0))
+        self.store.write(df=source.iloc[[1]].reset_index(drop=True))
+
+        self.assertTrue(
+            self.checkpointed().equals(source.iloc[[1]].reset_index(drop=True))
+        )
+
+    def test_restore_from_checkpoint(self) -> None:
+        source = source_fixture()
+        self.s3_bucket_connection.upload_to_parquet(df=source, filename=self.filename)
+
+        result = self.store.read()
+
+        self.assertTrue(result.equals(source))
+        self.assertTrue(os.path.exists(self.store.path))
+
+    def test_local_ahead_of_checkpoint(self) -> None:
+        source = source_fixture()
+        self.store.write(df=source)
+        active = source.iloc[[0]]
+
+        self.store.write(df=active)
+        result = self.store.read()
+
+        self.assertTrue(result.equals(active))
+        self.assertTrue(self.checkpointed().equals(source))
+
+    def test_restore_over_stale_local(self) -> None:
+        source = source_fixture()
+        self.store.write(df=source)
+        with tempfile.TemporaryDirectory() as directory:
+            other = ArrowStateStore(
+                s3_bucket=self.s3_bucket_connection,
+                filename=self.filename,
+                directory=directory,
+                checkpoint_seconds=60,
+            )
+            other.read()
+            active = source.iloc[[1]].reset_index(drop=True)
+            other.write(df=active)
+            os.utime(other.checkpoint_path, times=(0, 0))
+            other.write(df=active)
+
+        with self.assertLogs("plugins.common.state") as logm:
+            result = self.store.read()
+
+        self.assertTrue(result.equals(active))
+        self.assertIn("Restoring state", logm.output[0])
+
+
+class TestGetStateStore(unittest.TestCase):
+    def test_arrow_requires_pinned_fused_task(self) -> None:
+        settings = StateStoreSettings(
+            BACKEND="arrow",
+            ARROW_DIR=tempfile.gettempdir(),
+            CHECKPOINT_SECONDS=60,
+            ARROW_QUEUE="",
+            REDIS_URL="redis://localhost:6379/1",
+        )
+        for fused, queue, rejected in (
+            (False, "", True),
+            (True, "", True),
+            (False, "state", True),
+            (True, "state", False),
+        ):
+            with self.subTest(fused=fused, queue=queue), mock.patch.multiple(
+                "plugins.common.state",
+                ADSB_FUSED=fused,
+                STATE_STORE=settings._replace(ARROW_QUEUE=queue),
+            ):
+                if rejected:
+                    with self.assertRaises(ValueError) as _:
+                        get_state_store(s3_bucket=mock.Mock(), filename="source")
+                else:
+                    store = get_state_store(s3_bucket=mock.Mock(), filename="source")
+                    self.assertIsInstance(store, ArrowStateStore)
+
+
+class TestMemoryStateStore(StateStoreTests, unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = MemoryStateStore()
+
+    def write_legacy(self, df: pd.DataFrame) -> None:
+        self.store.table = pa.Table.from_pandas(df, preserve_index=False)
+
+
+class TestRedisStateStore(StateStoreTests, unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = fakeredis.FakeRedis()
+        self.store = RedisStateStore(client=self.client, prefix="test-source")
+
+    def tearDown(self) -> None:
+        self.client.flushall()
+
+    def write_legacy(self, df: pd.DataFrame) -> None:
+        with mock.patch(
+            "plugins.common.state.conform_frame", side_effect=lambda df, schema: df
+        ):
+            self.store.write(df=df)
+
+    def expected(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.sort_values("icao24", ignore_index=True)
+
+    def commands(self) -> List[str]:
+        commands = []
+        execute_command = redis.Redis.execute_command
+        pipeline_execute_command = redis.client.Pipeline.pipeline_execute_command
+
+        def record(execute: Any) -> Any:
+            def wrapper(client: redis.Redis, *args, **kwargs) -> Any:
+                commands.append(args[0])
+                return execute(client, *args, **kwargs)
+
+            return wrapper
+
+        patcher = mock.patch.multiple(
+            redis.Redis, execute_command=record(execute=execute_command)
+        )
+        pipeline_patcher = mock.patch.multiple(
+            redis.client.Pipeline,
+            pipeline_execute_command=record(execute=pipeline_execute_command),
+        )
+        patcher.start()
+        pipeline_patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(pipeline_patcher.stop)
+        return commands
+
+    def test_hash_per_aircraft(self) -> None:
+        source = source_fixture()
+        self.store.write(df=source)
+
+        self.store.write(df=source.iloc[[0, 1]])
+
+        self.assertEqual(
+            self.client.hget(f"test-source:aircraft:{0x65432A}", "takeoff_at"),
+            b"1712338215",
+        )
+        self.assertFalse(self.client.exists(f"test-source:aircraft:{0x1B3456}"))
+
+    def test_write_only_changed_aircraft(self) -> None:
+        source = source_fixture()
+        RedisStateStore(client=self.client, prefix="test-source").write(df=source)
+        self.store.read()
+        changed = source.copy()
+        changed.loc[0, "velocity"] = 215.0
+
+        commands = self.commands()
+        self.store.write(df=changed)
+
+        self.assertEqual(commands, ["HSET", "ZADD"])
+        self.assertTrue(self.store.read().equals(self.expected(df=changed)))
+
+    def test_read_live_aircraft(self) -> None:
+        source = source_fixture()
+        self.store.write(df=source)
+        store = RedisStateStore(client=self.client, prefix="test-source")
+
+        commands = self.commands()
+        result = store.read(filters=[("flight_last_contact", ">", 1712338200)])
+
+        self.assertEqual(commands, ["GET", "ZRANGEBYSCORE", "HGETALL", "HGETALL"])
+        self.assertEqual(result["icao24"].tolist(), [0x12C456, 0x65432A])
+
+        commands.clear()
+        store.write(df=source.iloc[[0, 1]])
+
+        self.assertEqual(commands, ["ZRANGEBYSCORE", "DEL", "ZREM"])
+        self.assertFalse(self.client.exists(f"test-source:aircraft:{0x1B3456}"))
+        self.assertEqual(self.client.zcard("test-source:aircraft"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
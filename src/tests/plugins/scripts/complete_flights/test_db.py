@@ -0,0 +1,270 @@
+from datetime import datetime
+import json
+import os
+import tempfile
+from typing import Dict
+import unittest
+from unittest import mock
+
+import bson
+import numpy as np
+import pandas as pd
+from plugins.scripts.complete_flights.constants import (
+    MONGODB_CLIENT,
+    Mongodb,
+    MongodbWrite,
+)
+from plugins.scripts.complete_flights.db import AircraftUtilizationClient, Flights
+from plugins.scripts.complete_flights.encoders import encode_flights
+
+
+def complete_fixture(rows: int = 3) -> pd.DataFrame:
+    complete = pd.DataFrame(
+        data={
+            "icao24": [f"{index:06x}" for index in range(rows)],
+            "flight_duration_minutes": np.arange(rows) * 7 + 1,
+            "landed_at": pd.to_datetime(
+                1712338215 + np.arange(rows) * 60, unit="s", utc=True
+            ),
+            "registration": ["AB-CDE", None, np.nan] * (rows // 3)
+            + [None] * (rows % 3),
+            "model": ["Boeing 737"] * rows,
+            "manufacturer_icao": ["BOEING"] * rows,
+            "owner": [None] * rows,
+            "operator": ["Test Air"] * rows,
+            "built": [datetime(2000, 2, 1), None, np.nan] * (rows // 3)
+            + [None] * (rows % 3),
+        }
+    )
+    complete["built"] = complete["built"].astype(object)
+    return complete
+
+
+class TestEncoders(unittest.TestCase):
+    def test_encode_flights_matches_documents(self) -> None:
+        complete = complete_fixture(rows=6)
+        complete.loc[5, "flight_duration_minutes"] = 2**40
+        documents_exp = [
+            bson.encode(
+                Flights(
+                    icao24=r["icao24"],
+                    landed_at=r["landed_at"],
+                    duration_minutes=r["flight_duration_minutes"],
+                    registration=r["registration"],
+                    model=r["model"],
+                    manufacturer_icao=r["manufacturer_icao"],
+                    owner=r["owner"],
+                    operator=r["operator"],
+                    built=r["built"],
+                )
+            )
+            for r in complete.replace({np.nan: None}).to_dict("records")
+        ]
+
+        documents = encode_flights(df=complete)
+
+        self.assertEqual(documents, documents_exp)
+
+    def test_encode_flights_icao24_codes(self) -> None:
+        complete = complete_fixture(rows=3)
+        codes = complete.assign(icao24=np.array([0, 1, 2], dtype=np.uint32))
+
+        documents = encode_flights(df=codes)
+
+        self.assertEqual(documents, encode_flights(df=complete))
+        self.assertEqual(bson.decode(documents[2])["icao24"], "000002")
+        self.assertIn("icao24", codes)
+        self.assertEqual(codes["icao24"].dtype, np.uint32)
+
+    def test_encode_flights_empty(self) -> None:
+        documents = encode_flights(df=complete_fixture(rows=0))
+
+        self.assertEqual(documents, [])
+
+
+class TestAircraftUtilizationClient(unittest.TestCase):
+    def setUp(self) -> None:
+        credentials = Mongodb(
+            HOST="localhost", PORT=27017, USERNAME="test", PASSWORD="test", DB="test"
+        )
+        self.write = MongodbWrite(
+            W="majority", JOURNAL=True, BATCH_BYTES=1024, BATCH_DOCUMENTS=5
+        )
+        self.client = AircraftUtilizationClient(
+            credentials=credentials, write=self.write
+        )
+        self.collection = mock.MagicMock()
+        self.client._flights_collection = lambda: self.collection
+
+    def tearDown(self) -> None:
+        AircraftUtilizationClient.clear_clients()
+
+    def inserted(self) -> list:
+        insert_many = self.collection.with_options.return_value.insert_many
+        return [call.kwargs["documents"] for call in insert_many.call_args_list]
+
+    def test_write_flights_batches(self) -> None:
+        complete = complete_fixture(rows=30)
+
+        self.client.write_flights(df=complete)
+
+        batches = self.inserted()
+        documents = [document.raw for batch in batches for document in batch]
+        self.assertEqual(documents, encode_flights(df=complete))
+        for batch in batches:
+            self.assertLessEqual(len(batch), self.write.BATCH_DOCUMENTS)
+            self.assertLessEqual(
+                sum(len(document.raw) for document in batch), self.write.BATCH_BYTES
+            )
+        insert_many = self.collection.with_options.return_value.insert_many
+        for call in insert_many.call_args_list:
+            self.assertFalse(call.kwargs["ordered"])
+
+    def test_write_flights_write_concern(self) -> None:
+        self.client.write_flights(df=complete_fixture())
+
+        write_concern = self.collection.with_options.call_args.kwargs["write_concern"]
+        self.assertEqual(write_concern.document, {"w": "majority", "j": True})
+
+    def test_write_flights_empty(self) -> None:
+        log_exp = "Empty document. Nothing to write"
+        with self.assertLogs() as logm:
+            self.client.write_flights(df=complete_fixture(rows=0))
+            self.assertIn(log_exp, logm.output[-1])
+
+        self.assertEqual(self.inserted(), [])
+
+
+class TestAircraftUtilizationClientRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        AircraftUtilizationClient.clear_clients()
+        self.credentials = Mongodb(
+            HOST="localhost", PORT=27017, USERNAME="test", PASSWORD="test", DB="test"
+        )
+        patcher = mock.patch("plugins.scripts.complete_flights.db.pymongo.MongoClient")
+        self.mongo_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.database = self.mongo_client.return_value.__getitem__.return_value
+        self.database.list_collection_names.return_value = []
+        self.bootstrap_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.bootstrap_dir.cleanup)
+        settings_patcher = mock.patch(
+            "plugins.scripts.complete_flights.db.MONGODB_CLIENT",
+            MONGODB_CLIENT._replace(BOOTSTRAP_DIR=self.bootstrap_dir.name),
+        )
+        settings_patcher.start()
+        self.addCleanup(settings_patcher.stop)
+
+    def tearDown(self) -> None:
+        AircraftUtilizationClient.clear_clients()
+
+    def run_task(self) -> Dict[str, int]:
+        reader, writer = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(reader)
+            try:
+                self.mongo_client.reset_mock()
+                client = AircraftUtilizationClient(credentials=self.credentials)
+                client.write_flights(df=complete_fixture())
+                calls = {
+                    "clients": self.mongo_client.call_count,
+                    "lists": self.database.list_collection_names.call_count,
+                    "creates": self.database.create_collection.call_count,
+                }
+                with os.fdopen(writer, "w") as file:
+                    json.dump(calls, file)
+            finally:
+                os._exit(0)
+        os.close(writer)
+        with os.fdopen(reader) as file:
+            calls = file.read()
+        os.waitpid(pid, 0)
+        return json.loads(calls)
+
+    def test_client_reused(self) -> None:
+        for _ in range(3):
+            client = AircraftUtilizationClient(credentials=self.credentials)
+            client.write_flights(df=complete_fixture())
+
+        self.mongo_client.assert_called_once_with(
+            host="localhost",
+            port=27017,
+            username="test",
+            password="test",
+            maxPoolSize=MONGODB_CLIENT.MAX_POOL_SIZE,
+            compressors=MONGODB_CLIENT.COMPRESSORS,
+            maxIdleTimeMS=MONGODB_CLIENT.MAX_IDLE_TIME_MS,
+            connectTimeoutMS=MONGODB_CLIENT.CONNECT_TIMEOUT_MS,
+        )
+        self.database.create_collection.assert_called_once()
+        insert_many = (
+            self.database.create_collection.return_value.with_options.return_value
+        ).insert_many
+        self.assertEqual(insert_many.call_count, 3)
+
+    def test_bootstrap_once_across_task_processes(self) -> None:
+        runs = [self.run_task() for _ in range(3)]
+
+        self.assertEqual(
+            runs,
+            [
+                {"clients": 1, "lists": 1, "creates": 1},
+                {"clients": 1, "lists": 0, "creates": 0},
+                {"clients": 1, "lists": 0, "creates": 0},
+            ],
+        )
+
+    def test_existing_collection_not_created(self) -> None:
+        self.database.list_collection_names.return_value = ["flights"]
+
+        AircraftUtilizationClient(credentials=self.credentials)._flights_collection()
+
+        self.database.list_collection_names.assert_called_once_with(
+            filter={"name": "flights"}
+        )
+        self.database.create_collection.assert_not_called()
+
+    def test_expired_bootstrap_rechecked(self) -> None:
+        client = AircraftUtilizationClient(credentials=self.credentials)
+        client._flights_collection()
+        os.utime(client._bootstrap_marker(), times=(0, 0))
+
+        AircraftUtilizationClient.clear_clients()
+        AircraftUtilizationClient(credentials=self.credentials)._flights_collection()
+
+        self.assertEqual(self.database.list_collection_names.call_count, 2)
+
+    def test_client_per_server(self) -> None:
+        AircraftUtilizationClient(credentials=self.credentials)
+        AircraftUtilizationClient(credentials=self.credentials._replace(DB="other"))
+        AircraftUtilizationClient(credentials=self.credentials._replace(HOST="other"))
+
+        self.assertEqual(self.mongo_client.call_count, 2)
+
+    def test_collection_per_name(self) -> None:
+        AircraftUtilizationClient(credentials=self.credentials)._flights_collection()
+        AircraftUtilizationClient(
+            credentials=self.credentials, collection="flights_replay"
+        )._flights_collection()
+
+        self.assertEqual(
+            [
+                call.kwargs["name"]
+                for call in self.database.create_collection.call_args_list
+            ],
+            ["flights", "flights_replay"],
+        )
+
+    def test_clear_clients(self) -> None:
+        AircraftUtilizationClient(credentials=self.credentials)._flights_collection()
+
+        AircraftUtilizationClient.clear_clients()
+        AircraftUtilizationClient(credentials=self.credentials)._flights_collection()
+
+        self.assertEqual(self.mongo_client.call_count, 2)
+        self.database.create_collection.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from plugins.common.constants import S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.constants import METAFILE_SCHEMA
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+
+
+def metadata_fixture(rows: int = 100) -> pd.DataFrame:
+    rng = np.random.default_rng(rows)
+    index = np.arange(rows)
+    metadata = pd.DataFrame(
+        data={
+            "icao24": rng.choice(2**24, size=rows, replace=False).astype(np.uint32),
+            "registration": [f"AB-{i:05d}" for i in index],
+            "model": [f"737-{i % 7}" for i in index],
+            "manufacturer_icao": [("BOEING", "AIRBUS", None)[i % 3] for i in index],
+            "owner": [None] * rows,
+            "operator": [f"Test Air {i % 5}" for i in index],
+            "built": pd.to_datetime(
+                [None if i % 4 == 0 else f"20{i % 24:02d}-01-01" for i in index]
+            ),
+        }
+    )
+    return metadata
+
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        s3_credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        s3 = boto3.resource(
+            "s3", endpoint_url=f"https://s3.{s3_credentials.REGION}.amazonaws.com"
+        )
+        s3.create_bucket(
+            Bucket=s3_credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": s3_credentials.REGION},
+        )
+        self.s3_bucket_connection = S3BucketConnector(credentials=s3_credentials)
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = "test-meta"
+
+    def tearDown(self) -> None:
+        MetadataIndex.clear_indexes()
+        self.directory.cleanup()
+        self.mock.stop()
+
+    def load(self) -> MetadataIndex:
+        return MetadataIndex.load(
+            s3_bucket=self.s3_bucket_connection,
+            filename=self.filename,
+            directory=self.directory.name,
+        )
+
+    def test_lookup_matches_merge(self) -> None:
+        metadata = metadata_fixture()
+        codes = np.concatenate(
+            [metadata["icao24"].to_numpy()[[5, 0, 5, 99]], [0, 2**24 - 1]]
+        ).astype(np.uint32)
+        complete = pd.DataFrame(data={"icao24": codes})
+        result_exp = complete.merge(right=metadata, on="icao24", how="left")
+        result_exp["built"] = result_exp["built"].astype("datetime64[ms]")
+
+        aircraft = MetadataIndex.from_frame(df=metadata).lookup(codes=codes)
+        result = pd.concat([complete, aircraft], axis=1)
+
+        self.assertTrue(result.fillna(-1).equals(result_exp.fillna(-1)))
+
+    def test_lookup_empty(self) -> None:
+        index = MetadataIndex.from_table(table=METAFILE_SCHEMA.empty_table())
+
+        result = index.lookup(codes=np.array([1, 2], dtype=np.uint32))
+
+        self.assertEqual(len(result), 2)
+        self.assertTrue(result.isna().all().all())
+
+    def test_load_builds_index_once(self) -> None:
+        metadata = metadata_fixture()
+        self.s3_bucket_connection.upload_to_parquet(df=metadata, filename=self.filename)
+        read_parquet_table = mock.Mock(
+            side_effect=self.s3_bucket_connection.read_parquet_table
+        )
+        self.s3_bucket_connection.read_parquet_table = read_parquet_table
+
+        index = self.load()
+        MetadataIndex.clear_indexes()
+        reopened = self.load()
+
+        self.assertIs(self.load(), reopened)
+        self.assertEqual(read_parquet_table.call_count, 1)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        codes = metadata["icao24"].to_numpy()
+        self.assertTrue(index.lookup(codes=codes).equals(reopened.lookup(codes=codes)))
+
+    def test_load_rebuilds_on_refresh(self) -> None:
+        metadata = metadata_fixture()
+        self.s3_bucket_connection.upload_to_parquet(df=metadata, filename=self.filename)
+        index = self.load()
+        refreshed = metadata.assign(registration="UR-PSA")
+        self.s3_bucket_connection.upload_to_parquet(
+            df=refreshed, filename=self.filename
+        )
+
+        result = self.load().lookup(codes=metadata["icao24"].to_numpy()[:1])
+
+        self.assertEqual(result["registration"].tolist(), ["UR-PSA"])
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        self.assertFalse(os.path.exists(index.path))
+
+    def test_load_missing(self) -> None:
+        with self.assertLogs() as logm:
+            index = self.load()
+            self.assertIn("Metadata test-meta not found", logm.output[-1])
+
+        self.assertEqual(len(index), 0)
+
+    def test_open_memory_mapped(self) -> None:
+        path = os.path.join(self.directory.name, "test-meta.arrow")
+        MetadataIndex.build(
+            table=pa.Table.from_pandas(
+                metadata_fixture(rows=10_000), preserve_index=False
+            ),
+            path=path,
+        )
+
+        allocated = pa.total_allocated_bytes()
+        index = MetadataIndex.open(path=path)
+
+        self.assertEqual(pa.total_allocated_bytes(), allocated)
+        self.assertEqual(len(index), 10_000)
+        self.assertTrue(np.all(np.diff(index._keys.astype(np.int64)) > 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
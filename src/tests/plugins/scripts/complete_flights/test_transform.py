@@ -1,13 +1,17 @@
 from datetime import datetime
 from io import BytesIO
+from itertools import product
+import tempfile
 import unittest
 
 import boto3
 from moto import mock_aws
+import numpy as np
 import pandas as pd
-from plugins.common.constants import S3Sts
+from plugins.common.constants import SOURCE_SCHEMA, S3Sts
 from plugins.common.s3 import S3BucketConnector
 from plugins.scripts.complete_flights.db import AircraftUtilizationClient
+from plugins.scripts.complete_flights.metadata import MetadataIndex
 from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
 
 
@@ -44,14 +48,18 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
 
         self.source_filename = "test-source"
         self.meta_filename = "test-meta"
+        self.index_dir = tempfile.TemporaryDirectory()
         self.transformer = CompleteFlightsETL(
             s3_bucket=self.s3_bucket_connection,
             db_client=db_client,
             source_filename=self.source_filename,
             meta_filename=self.meta_filename,
+            index_dir=self.index_dir.name,
         )
 
     def tearDown(self) -> None:
+        MetadataIndex.clear_indexes()
+        self.index_dir.cleanup()
         self.mock.stop()
 
     def test_is_takeoff_ok(self) -> None:
@@ -207,6 +215,65 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
 
         self.assertEqual(result, result_exp)
 
+    def test_determine_flight_statuses_matches_row_wise(self) -> None:
+        combinations = product(
+            [True, False, None],
+            [6.3, 0.0, -1.1, np.NaN],
+            [240.52, 9.52, 0.0, np.NaN],
+            [1712338130, 0],
+            ["climb", "descend", "other", None],
+        )
+        source = pd.DataFrame(
+            data=[
+                {
+                    "icao24": "a23456",
+                    "last_contact": last_contact,
+                    "velocity": velocity,
+                    "vertical_rate": vertical_rate,
+                    "takeoff_at": 1712337230,
+                    "flight_last_contact": 1712338130,
+                    "flight_trajectory": flight_trajectory,
+                    "is_first_contact": is_first_contact,
+                }
+                for (
+                    is_first_contact,
+                    vertical_rate,
+                    velocity,
+                    last_contact,
+                    flight_trajectory,
+                ) in combinations
+            ]
+        )
+        result_exp = source.apply(self.transformer._determine_flight_status, axis=1)
+
+        result = self.transformer._determine_flight_statuses(source=source)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_determine_flight_statuses_typed_source(self) -> None:
+        data = {
+            "icao24": ["a23456", "65432a", "1b3456"],
+            "last_contact": [1712338130, 1712338130, 0],
+            "velocity": [240.52, 9.52, 0.0],
+            "vertical_rate": [6.3, 0.0, 0.0],
+            "takeoff_at": [0, 1712337230, 1712337230],
+            "flight_last_contact": [1712338130, 1712338130, 1712338130],
+            "flight_trajectory": ["climb", "descend", "descend"],
+            "is_first_contact": [True, False, False],
+        }
+        source = pd.DataFrame(data=data).astype(
+            {
+                "last_contact": pd.Int32Dtype(),
+                "takeoff_at": pd.Int32Dtype(),
+                "flight_last_contact": pd.Int32Dtype(),
+            }
+        )
+        result_exp = pd.Series(["takeoff", "landing", "other"], dtype=object)
+
+        result = self.transformer._determine_flight_statuses(source=source)
+
+        self.assertTrue(result.equals(result_exp))
+
     def test_determine_flight_trajectory_climb(self) -> None:
         result_exp = "climb"
         data = {
@@ -274,6 +341,68 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
 
         self.assertEqual(result, result_exp)
 
+    def test_determine_flight_trajectories_matches_row_wise(self) -> None:
+        combinations = product(
+            [6.3, 0.0, -1.1, np.NaN],
+            ["climb", "descend", "other", None],
+        )
+        active = pd.DataFrame(
+            data=[
+                {
+                    "icao24": "a23456",
+                    "last_contact": 1712338130,
+                    "velocity": 110.52,
+                    "vertical_rate": vertical_rate,
+                    "takeoff_at": 1712337230,
+                    "flight_last_contact": 1712338130,
+                    "flight_trajectory": flight_trajectory,
+                    "is_first_contact": False,
+                }
+                for vertical_rate, flight_trajectory in combinations
+            ]
+        )
+        result_exp = active.apply(self.transformer._determine_flight_trajectory, axis=1)
+
+        result = self.transformer._determine_flight_trajectories(active=active)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_determine_flight_trajectories_na(self) -> None:
+        data = {
+            "vertical_rate": [pd.NA, pd.NA, 1.1],
+            "flight_trajectory": ["descend", "climb", pd.NA],
+        }
+        active = pd.DataFrame(data=data).astype({"vertical_rate": pd.Float64Dtype()})
+        result_exp = pd.Series(["descend", "other", "climb"], dtype=object)
+
+        result = self.transformer._determine_flight_trajectories(active=active)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_flight_duration_minutes_int32(self) -> None:
+        data = {
+            "takeoff_at": [1712338000, 1712338000, 1712338000, pd.NA],
+            "last_contact": [1712338060, 1712338061, 1712338000, 1712338000],
+        }
+        complete = pd.DataFrame(data=data, dtype=pd.Int32Dtype())
+        result_exp = pd.Series([1, 2, 0, pd.NA], dtype=pd.Int32Dtype())
+
+        result = self.transformer._flight_duration_minutes(complete=complete)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_flight_duration_minutes_float_na(self) -> None:
+        data = {
+            "takeoff_at": [1712338000.0, np.NaN],
+            "last_contact": [1712338061.0, 1712338000.0],
+        }
+        complete = pd.DataFrame(data=data)
+        result_exp = pd.Series([2, pd.NA], dtype=pd.Int32Dtype())
+
+        result = self.transformer._flight_duration_minutes(complete=complete)
+
+        self.assertTrue(result.equals(result_exp))
+
     def test_extract_ok(self) -> None:
         key = f"{self.source_filename}.parquet"
         data_exp = {
@@ -297,6 +426,18 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
         source_exp.to_parquet(path=out_buffer, index=False)
         self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=key)
 
+        source_exp["icao24"] = np.array([0x65432A, 0x1B3456], dtype=np.uint32)
+        source_exp = source_exp.astype(
+            {
+                "last_contact": pd.Int32Dtype(),
+                "velocity": np.float32,
+                "vertical_rate": np.float32,
+                "takeoff_at": pd.Int32Dtype(),
+                "flight_last_contact": pd.Int32Dtype(),
+                "flight_trajectory": "category",
+            }
+        )
+
         source = self.transformer._extract()
 
         self.assertTrue(source.equals(source_exp))
@@ -362,12 +503,14 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
             "manufacturer_icao": ["BOEING", "AIRBUS"],
             "owner": ["Test Lease", "New Test Lease"],
             "operator": ["Test Air", "New Test Air"],
-            "built": ["2000-02-01", "1990-03-05"],
+            "built": pd.to_datetime(["2000-02-01", "1990-03-05"]),
         }
         metadata = pd.DataFrame(data=metadata_data)
+        metadata["icao24"] = np.array([0x65432A, 0x12C456], dtype=np.uint32)
         complte = pd.DataFrame(data=data)
+        complte["icao24"] = np.array([0x65432A, 0x1B3456], dtype=np.uint32)
         data_exp = {
-            "icao24": ["65432a"],
+            "icao24": np.array([0x65432A], dtype=np.uint32),
             "flight_duration_minutes": 154,
             "landed_at": 1712338215,
             "registration": "AB-CDE",
@@ -381,12 +524,12 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
         result_exp["landed_at"] = pd.to_datetime(
             result_exp["landed_at"], unit="s", utc=True
         )
-        result_exp["built"] = pd.to_datetime(
-            result_exp["built"],
-        ).astype(object)
+        result_exp["built"] = pd.to_datetime(result_exp["built"]).astype(
+            "datetime64[ms]"
+        )
 
         result = self.transformer._transform_complete(
-            complete=complte, metadata=metadata
+            complete=complte, metadata=MetadataIndex.from_frame(df=metadata)
         )
 
         self.assertTrue(result.equals(result_exp))
@@ -397,6 +540,22 @@ class TestCompleteFlightsETLMethods(unittest.TestCase):
             self.transformer.etl()
             self.assertIn(log_exp, logm.output[-1])
 
+    def test_etl_empty_in_memory_source(self) -> None:
+        key = f"{self.source_filename}.parquet"
+        source = pd.DataFrame(columns=SOURCE_SCHEMA.names)
+
+        log_exp = "Empty source report"
+        with self.assertLogs() as logm:
+            self.transformer.etl(source=source)
+            self.assertIn(log_exp, logm.output[-1])
+
+        data = self.s3_bucket.Object(key=key).get().get("Body").read()
+        result = pd.read_parquet(BytesIO(data))
+        self.assertTrue(result.empty)
+        self.assertEqual(list(result.columns), list(source.columns))
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,156 @@
+from datetime import UTC, date, datetime
+from io import BytesIO
+import json
+import tempfile
+import unittest
+
+import boto3
+from moto import mock_aws
+import numpy as np
+import pyarrow.parquet as pq
+from plugins.common.constants import S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.opensky.archive import ARCHIVE_COLUMNS, SnapshotArchive
+from plugins.scripts.opensky.constants import ARCHIVE_SCHEMA
+from plugins.scripts.opensky.decoders import StatesSnapshot, decode_snapshot
+
+
+DAY = date(2024, 4, 5)
+START = round(datetime(2024, 4, 5, tzinfo=UTC).timestamp())
+
+
+def snapshot(time: int, aircraft: int = 3) -> StatesSnapshot:
+    states = [
+        [f"{0xA00000 + index:06x}", f"TEST{index}   ", "Ukraine", time - 5, time]
+        + [30.5 + index, 50.4, 1000.0, False, 240.52, 90.0, 6.3, None]
+        + [1100.0, "7000", False, 0]
+        for index in reversed(range(aircraft))
+    ]
+    payload = json.dumps({"time": time, "states": states}).encode()
+    return decode_snapshot(payload=payload, columns=ARCHIVE_COLUMNS)
+
+
+class TestSnapshotArchive(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        self.s3 = boto3.client("s3", region_name=credentials.REGION)
+        self.s3.create_bucket(
+            Bucket=credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": credentials.REGION},
+        )
+        self.s3_bucket = S3BucketConnector(credentials=credentials)
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.archive = SnapshotArchive(
+            s3_bucket=self.s3_bucket,
+            prefix="archive",
+            row_group_size=4,
+            spool_dir=self.spool_dir.name,
+        )
+
+    def tearDown(self) -> None:
+        S3BucketConnector.clear_clients()
+        self.spool_dir.cleanup()
+        self.mock.stop()
+
+    def keys(self) -> list:
+        return self.s3_bucket.list_keys(prefix="archive/")
+
+    def read_object(self, key: str) -> pq.ParquetFile:
+        body = self.s3.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+        return pq.ParquetFile(BytesIO(body))
+
+    def test_write_partitioned(self) -> None:
+        self.archive.write(snapshot=snapshot(time=START + 3600 + 300))
+
+        key = f"archive/date=2024-04-05/hour=01/{START + 3900}.parquet"
+        self.assertEqual(self.keys(), [key])
+        parquet_file = self.read_object(key=key)
+        self.assertEqual(
+            parquet_file.metadata.row_group(0).column(0).compression, "ZSTD"
+        )
+        table = parquet_file.read()
+        self.assertTrue(table.schema.equals(ARCHIVE_SCHEMA))
+        self.assertEqual(table.column("time").to_pylist(), [START + 3900] * 3)
+        self.assertEqual(
+            table.column("icao24").to_pylist(), [0xA00000, 0xA00001, 0xA00002]
+        )
+        self.assertEqual(table.column("callsign").to_pylist()[0], "TEST0   ")
+        self.assertEqual(table.column("time_position").to_pylist()[0], START + 3895)
+        self.assertEqual(table.column("longitude").type.bit_width, 32)
+
+    def test_compact(self) -> None:
+        times = [START + offset for offset in (0, 300, 3600, 86100)]
+        for time in times:
+            self.archive.write(snapshot=snapshot(time=time))
+        self.archive.write(snapshot=snapshot(time=START + 86400))
+
+        self.archive.compact(day=DAY)
+
+        self.assertEqual(
+            self.keys(),
+            [
+                "archive/date=2024-04-05/2024-04-05.parquet",
+                f"archive/date=2024-04-06/hour=00/{START + 86400}.parquet",
+            ],
+        )
+        parquet_file = self.read_object(key=self.keys()[0])
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertEqual(
+            parquet_file.metadata.row_group(0).column(0).compression, "ZSTD"
+        )
+        table = parquet_file.read()
+        self.assertTrue(table.schema.equals(ARCHIVE_SCHEMA))
+        self.assertEqual(table.column("time").to_pylist(), np.repeat(times, 3).tolist())
+        self.assertEqual(
+            table.column("icao24").to_pylist(), [0xA00000, 0xA00001, 0xA00002] * 4
+        )
+
+    def test_compact_late_snapshots(self) -> None:
+        self.archive.write(snapshot=snapshot(time=START))
+        self.archive.compact(day=DAY)
+        self.archive.write(snapshot=snapshot(time=START + 600))
+        self.archive.write(snapshot=snapshot(time=START, aircraft=2))
+
+        table = self.archive.read_day(day=DAY, columns=["time", "icao24"])
+        self.archive.compact(day=DAY)
+
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(self.keys(), ["archive/date=2024-04-05/2024-04-05.parquet"])
+        compacted = self.archive.read_day(day=DAY)
+        self.assertEqual(
+            compacted.column("time").to_pylist(), [START] * 2 + [START + 600] * 3
+        )
+        self.assertTrue(compacted.sort_by("time").equals(compacted))
+
+    def test_read_day_filters(self) -> None:
+        for time in (START, START + 300):
+            self.archive.write(snapshot=snapshot(time=time))
+        self.archive.compact(day=DAY)
+        self.archive.write(snapshot=snapshot(time=START + 600))
+
+        table = self.archive.read_day(
+            day=DAY, columns=["icao24"], filters=[("time", ">=", START + 300)]
+        )
+
+        self.assertEqual(table.column_names, ["icao24"])
+        self.assertEqual(table.num_rows, 6)
+
+    def test_empty_day(self) -> None:
+        table = self.archive.read_day(day=DAY, columns=["time", "icao24"])
+
+        self.archive.compact(day=DAY)
+
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.column_names, ["time", "icao24"])
+        self.assertEqual(self.keys(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
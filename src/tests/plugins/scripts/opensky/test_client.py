@@ -0,0 +1,323 @@
+import gzip
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, List, Union
+import unittest
+from unittest import mock
+
+from plugins.common.exceptions import InvalidResponseError
+from plugins.scripts.opensky.client import DatabaseVersion, OpenSkyClient
+from plugins.scripts.opensky.constants import OpenSkyHttp
+
+
+STATES = {
+    "time": 1712338230,
+    "states": [
+        [
+            "a23456",
+            "Speedbird",
+            "Ukraine",
+            1712338230,
+            1712338130,
+            -37.80467681,
+            144.9659498,
+            700.25,
+            False,
+            240.52,
+            5.154,
+            6.3,
+            None,
+            620.25,
+            "Code",
+            False,
+            0,
+        ],
+    ],
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def do_GET(self) -> None:
+        self.server.requests.append(
+            (self.client_address, self.headers.get("Accept-Encoding", ""))
+        )
+        self.server.ranges.append(self.headers.get("Range"))
+        behaviour = (
+            self.server.behaviours.pop(0) if self.server.behaviours else ok_response
+        )
+        behaviour(self)
+
+    def send_body(self, status: int, body: bytes, gzipped: bool = False) -> None:
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Rate-Limit-Remaining", "100")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.requests: List[tuple] = []
+        self.ranges: List[Union[str, None]] = []
+        self.behaviours: List[Callable[[StubHandler], None]] = []
+
+    def handle_error(self, request: object, client_address: object) -> None:
+        pass
+
+
+DATABASE_CSV = b"icao24,registration\n" + b"a23456,ABCD-E\n" * 10000
+DATABASE_ETAG = '"65f1c0b3-1a2b3c"'
+DATABASE_LAST_MODIFIED = "Wed, 13 Mar 2024 16:25:55 GMT"
+
+
+def database_response(handler: StubHandler, truncate: bool = False) -> None:
+    if handler.headers.get("If-None-Match") == DATABASE_ETAG:
+        handler.send_response(304)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    body = DATABASE_CSV
+    status = 200
+    range_header = handler.headers.get("Range")
+    if range_header and handler.headers.get("If-Range") == DATABASE_ETAG:
+        offset = int(range_header.removeprefix("bytes=").rstrip("-"))
+        body = DATABASE_CSV[offset:]
+        status = 206
+    handler.send_response(status)
+    handler.send_header("Content-Type", "text/csv")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("ETag", DATABASE_ETAG)
+    handler.send_header("Last-Modified", DATABASE_LAST_MODIFIED)
+    if status == 206:
+        handler.send_header(
+            "Content-Range",
+            f"bytes {len(DATABASE_CSV) - len(body)}-{len(DATABASE_CSV) - 1}"
+            f"/{len(DATABASE_CSV)}",
+        )
+    handler.end_headers()
+    if truncate:
+        handler.wfile.write(body[: len(body) // 2])
+        handler.wfile.flush()
+        handler.close_connection = True
+        return
+    handler.wfile.write(body)
+
+
+def truncated_database_response(handler: StubHandler) -> None:
+    database_response(handler=handler, truncate=True)
+
+
+def ok_response(handler: StubHandler) -> None:
+    handler.send_body(status=200, body=json.dumps(STATES).encode())
+
+
+def gzip_response(handler: StubHandler) -> None:
+    handler.send_body(status=200, body=json.dumps(STATES).encode(), gzipped=True)
+
+
+def unavailable_response(handler: StubHandler) -> None:
+    handler.send_body(status=503, body=b"")
+
+
+def rate_limited_response(handler: StubHandler) -> None:
+    handler.send_body(status=429, body=b"")
+
+
+def slow_response(handler: StubHandler) -> None:
+    time.sleep(1)
+    ok_response(handler)
+
+
+class TestOpenSkyClientMethods(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StubServer()
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.server_thread.start()
+        host, port = self.server.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+        self.http = OpenSkyHttp(
+            CONNECT_TIMEOUT_SECONDS=1,
+            READ_TIMEOUT_SECONDS=5,
+            RETRIES=2,
+            BACKOFF_SECONDS=0.01,
+            HEDGE_AFTER_SECONDS=None,
+            POOL_SIZE=2,
+        )
+        self.client = OpenSkyClient(auth="test", http=self.http, base_url=self.base_url)
+        self.spool_dir = tempfile.mkdtemp()
+        self.database_path = os.path.join(self.spool_dir, "aircraftDatabase.csv")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.spool_dir)
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_states_gzip(self) -> None:
+        self.server.behaviours = [gzip_response]
+
+        with mock.patch("plugins.scripts.opensky.client.record_bytes") as record:
+            result = self.client.get_states()
+
+        self.assertEqual(result, STATES)
+        self.assertIn("gzip", self.server.requests[0][1])
+        record.assert_called_once_with(
+            count=len(gzip.compress(json.dumps(STATES).encode()))
+        )
+
+    def test_get_states_keep_alive(self) -> None:
+        for _ in range(3):
+            self.client.get_states()
+
+        client_addresses = {address for address, _ in self.server.requests}
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(client_addresses), 1)
+
+    def test_get_states_retry_ok(self) -> None:
+        self.server.behaviours = [unavailable_response, unavailable_response]
+
+        with self.assertLogs(level="WARNING") as _:
+            result = self.client.get_states()
+
+        self.assertEqual(result, STATES)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_get_states_retries_exhausted(self) -> None:
+        self.server.behaviours = [unavailable_response] * 3
+
+        with self.assertLogs(level="WARNING") as _:
+            with self.assertRaises(InvalidResponseError) as _:
+                self.client.get_states()
+
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_get_states_rate_limited_not_retried(self) -> None:
+        self.server.behaviours = [rate_limited_response]
+
+        with self.assertRaises(InvalidResponseError) as _:
+            self.client.get_states()
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_get_states_read_timeout_retry(self) -> None:
+        self.client.close()
+        self.client = OpenSkyClient(
+            auth="test",
+            http=self.http._replace(READ_TIMEOUT_SECONDS=0.2),
+            base_url=self.base_url,
+        )
+        self.server.behaviours = [slow_response]
+
+        with self.assertLogs(level="WARNING") as _:
+            result = self.client.get_states()
+
+        self.assertEqual(result, STATES)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_get_states_hedged(self) -> None:
+        self.client.close()
+        self.client = OpenSkyClient(
+            auth="test",
+            http=self.http._replace(HEDGE_AFTER_SECONDS=0.05),
+            base_url=self.base_url,
+        )
+        self.server.behaviours = [slow_response]
+
+        start = time.perf_counter()
+        result = self.client.get_states()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(result, STATES)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertLess(elapsed, 0.8)
+
+    def test_get_states_frame_ok(self) -> None:
+        result = self.client.get_states_frame(columns=["icao24", "last_contact"])
+
+        self.assertListEqual(result["icao24"].tolist(), ["a23456"])
+        self.assertListEqual(result["last_contact"].tolist(), [1712338130])
+
+    def test_get_aircraft_database_ok(self) -> None:
+        self.server.behaviours = [database_response]
+
+        result = self.client.get_aircraft_database(
+            version=DatabaseVersion(), path=self.database_path
+        )
+
+        with open(self.database_path, "rb") as file:
+            self.assertEqual(file.read(), DATABASE_CSV)
+        self.assertEqual(result.path, self.database_path)
+        self.assertEqual(
+            result.version,
+            DatabaseVersion(
+                etag=DATABASE_ETAG,
+                last_modified=DATABASE_LAST_MODIFIED,
+                content_hash=sha256(DATABASE_CSV).hexdigest(),
+            ),
+        )
+
+    def test_get_aircraft_database_not_modified(self) -> None:
+        self.server.behaviours = [database_response]
+        version = DatabaseVersion(
+            etag=DATABASE_ETAG,
+            last_modified=DATABASE_LAST_MODIFIED,
+            content_hash="stored",
+        )
+
+        result = self.client.get_aircraft_database(
+            version=version, path=self.database_path
+        )
+
+        self.assertIsNone(result.path)
+        self.assertEqual(result.version, version)
+        self.assertFalse(os.path.exists(self.database_path))
+
+    def test_get_aircraft_database_invalid(self) -> None:
+        self.server.behaviours = [rate_limited_response]
+
+        with self.assertRaises(InvalidResponseError) as _:
+            self.client.get_aircraft_database(
+                version=DatabaseVersion(), path=self.database_path
+            )
+
+    def test_get_aircraft_database_resumed(self) -> None:
+        self.server.behaviours = [truncated_database_response, database_response]
+
+        with self.assertLogs(level="WARNING") as _:
+            result = self.client.get_aircraft_database(
+                version=DatabaseVersion(), path=self.database_path
+            )
+
+        with open(self.database_path, "rb") as file:
+            self.assertEqual(file.read(), DATABASE_CSV)
+        self.assertEqual(result.version.content_hash, sha256(DATABASE_CSV).hexdigest())
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIsNone(self.server.ranges[0])
+        self.assertRegex(self.server.ranges[1], r"^bytes=[1-9][0-9]*-$")
+        self.assertFalse(os.path.exists(f"{self.database_path}.part"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+from plugins.common.exceptions import InvalidResponseError
+from plugins.scripts.opensky.constants import STATES_COLUMNS
+from plugins.scripts.opensky.decoders import decode_snapshot, decode_states
+
+
+class TestDecodeStates(unittest.TestCase):
+    def setUp(self) -> None:
+        self.columns = [
+            "icao24",
+            "last_contact",
+            "velocity",
+            "vertical_rate",
+        ]
+        self.states = [
+            [
+                "a23456",
+                "Speedbird",
+                "Ukraine",
+                1712338230,
+                1712338130,
+                -37.80467681,
+                144.9659498,
+                700.25,
+                False,
+                240.52,
+                5.154,
+                6.3,
+                [1, 2],
+                620.25,
+                "Code",
+                False,
+                0,
+            ],
+            [
+                "65432a",
+                "TEST1   ",
+                "Poland",
+                None,
+                1712338135,
+                None,
+                None,
+                None,
+                True,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                False,
+                0,
+            ],
+        ]
+
+    def test_decode_states_ok(self) -> None:
+        payload = json.dumps({"time": 1712338230, "states": self.states}).encode()
+        data_exp = {
+            "icao24": ["a23456", "65432a"],
+            "last_contact": [1712338130, 1712338135],
+            "velocity": [240.52, np.NaN],
+            "vertical_rate": [6.3, np.NaN],
+        }
+        result_exp = pd.DataFrame(data=data_exp)
+
+        result = decode_states(payload=payload, columns=self.columns)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_decode_states_matches_full_frame(self) -> None:
+        payload = json.dumps(
+            {"states": self.states, "time": 1712338230}, indent=2
+        ).encode()
+        result_exp = pd.DataFrame(data=self.states, columns=STATES_COLUMNS)[
+            self.columns
+        ]
+
+        result = decode_states(payload=payload, columns=self.columns)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_decode_states_null_last_contact(self) -> None:
+        states = [self.states[0][:4] + [None] + self.states[0][5:], self.states[1]]
+        payload = json.dumps({"time": 1712338230, "states": states}).encode()
+
+        result = decode_states(payload=payload, columns=self.columns)
+
+        self.assertListEqual(result["last_contact"].tolist(), [0, 1712338135])
+        self.assertEqual(result["last_contact"].dtype, np.int64)
+
+    def test_decode_states_null_states(self) -> None:
+        payload = b'{"time": 1712338230, "states": null}'
+
+        result = decode_states(payload=payload, columns=self.columns)
+
+        self.assertTrue(result.empty)
+        self.assertListEqual(list(result.columns), self.columns)
+
+    def test_decode_states_single_column(self) -> None:
+        payload = json.dumps({"time": 1712338230, "states": self.states}).encode()
+        result_exp = pd.DataFrame(data={"icao24": ["a23456", "65432a"]})
+
+        result = decode_states(payload=payload, columns=["icao24"])
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_decode_states_invalid(self) -> None:
+        short_row = [self.states[0][:16]]
+        payloads = (
+            b"",
+            b"[]",
+            b'{"time": 1712338230}',
+            b'{"time": 1712338230, "states": "invalid"}',
+            b'{"time": 1712338230, "states": [1, 2]}',
+            json.dumps({"states": short_row}).encode(),
+            json.dumps({"states": self.states})[:-10].encode(),
+        )
+        for payload in payloads:
+            with self.subTest(payload=payload[:40]):
+                with self.assertRaises(InvalidResponseError) as _:
+                    decode_states(payload=payload, columns=self.columns)
+
+    def test_decode_snapshot_ok(self) -> None:
+        payload = json.dumps({"states": self.states, "time": 1712338230}).encode()
+
+        result = decode_snapshot(payload=payload, columns=self.columns)
+
+        self.assertEqual(result.time, 1712338230)
+        self.assertTrue(
+            result.states.equals(decode_states(payload=payload, columns=self.columns))
+        )
+
+    def test_decode_snapshot_invalid_time(self) -> None:
+        for time in (None, "1712338230", 1712338230.5):
+            payload = json.dumps({"time": time, "states": self.states}).encode()
+            with self.subTest(time=time):
+                with self.assertRaises(InvalidResponseError) as _:
+                    decode_snapshot(payload=payload, columns=self.columns)
+        with self.assertRaises(InvalidResponseError) as _:
+            decode_snapshot(
+                payload=json.dumps({"states": self.states}).encode(),
+                columns=self.columns,
+            )
+
+    def test_decode_states_unknown_column(self) -> None:
+        with self.assertRaises(ValueError) as _:
+            decode_states(payload=b"{}", columns=["unknown"])
+
+
+if __name__ == "__main__":
+    unittest.main()
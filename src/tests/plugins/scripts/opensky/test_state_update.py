@@ -0,0 +1,153 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from plugins.common.constants import SOURCE_SCHEMA
+from plugins.common.schema import conform_frame
+from plugins.scripts.opensky.state_update import merge_states
+
+
+def pandas_merge_states(
+    states: pd.DataFrame, active_flights: pd.DataFrame
+) -> pd.DataFrame:
+    source = states.merge(active_flights, how="outer", on="icao24")
+    filled = [
+        "last_contact",
+        "velocity",
+        "vertical_rate",
+        "takeoff_at",
+        "flight_last_contact",
+    ]
+    source[filled] = source[filled].fillna(0)
+    source = source.astype(
+        {
+            "last_contact": pd.Int32Dtype(),
+            "takeoff_at": pd.Int32Dtype(),
+            "flight_last_contact": pd.Int32Dtype(),
+        }
+    )
+    source[["is_first_contact"]] = source[["is_first_contact"]].replace(
+        to_replace=[pd.NA, True], value=[True, False]
+    )
+    valid_last_contact_mask = source["last_contact"] != 0
+    source.loc[valid_last_contact_mask, "flight_last_contact"] = source["last_contact"]
+    source = conform_frame(df=source, schema=SOURCE_SCHEMA)
+    return source.sort_values("icao24").reset_index(drop=True)
+
+
+def random_reports(rows: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    now = 1712338230
+    states = pd.DataFrame(
+        data={
+            "icao24": rng.choice(4 * rows + 1, rows, replace=False).astype(np.uint32),
+            "last_contact": rng.choice([0, now], rows),
+            "velocity": np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows)),
+            "vertical_rate": rng.random(rows),
+        }
+    )
+    active_flights = pd.DataFrame(
+        data={
+            "icao24": rng.choice(4 * rows + 1, rows, replace=False).astype(np.uint32),
+            "takeoff_at": pd.array(rng.choice([0, now - 600], rows), dtype="Int32"),
+            "flight_last_contact": pd.array(
+                rng.choice([now - 300, now - 60], rows), dtype="Int32"
+            ),
+            "flight_trajectory": pd.Categorical(
+                rng.choice(["climb", "other", "descend", None], rows)
+            ),
+            "is_first_contact": rng.random(rows) < 0.5,
+        }
+    )
+    return states, active_flights
+
+
+class TestMergeStates(unittest.TestCase):
+    def setUp(self) -> None:
+        self.states = pd.DataFrame(
+            data={
+                "icao24": np.array([0x65432A, 0x12C456], dtype=np.uint32),
+                "last_contact": [1712338230, 0],
+                "velocity": [210.11, np.nan],
+                "vertical_rate": [-0.7, 6.11],
+            }
+        )
+        self.active_flights = pd.DataFrame(
+            data={
+                "icao24": np.array([0x65432A, 0x1B3456], dtype=np.uint32),
+                "takeoff_at": [1712338215, 1712338205],
+                "flight_last_contact": [1712338115, 1712338135],
+                "flight_trajectory": ["other", "climb"],
+                "is_first_contact": [True, pd.NA],
+            }
+        )
+
+    def test_merge_states_ok(self) -> None:
+        result_exp = pd.DataFrame(
+            data={
+                "icao24": np.array([0x12C456, 0x1B3456, 0x65432A], dtype=np.uint32),
+                "last_contact": pd.array([0, 0, 1712338230], dtype="Int32"),
+                "velocity": np.array([0, 0, 210.11], dtype=np.float32),
+                "vertical_rate": np.array([6.11, 0, -0.7], dtype=np.float32),
+                "takeoff_at": pd.array([0, 1712338205, 1712338215], dtype="Int32"),
+                "flight_last_contact": pd.array(
+                    [0, 1712338135, 1712338230], dtype="Int32"
+                ),
+                "flight_trajectory": pd.Categorical([np.nan, "climb", "other"]),
+                "is_first_contact": [True, True, False],
+            }
+        )
+
+        result = merge_states(states=self.states, active_flights=self.active_flights)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_merge_states_matches_pandas_merge(self) -> None:
+        for rows in (1, 10, 1000):
+            states, active_flights = random_reports(rows=rows, seed=rows)
+            for flights in (
+                active_flights,
+                active_flights.sort_values("icao24"),
+                active_flights.astype({"flight_trajectory": object}),
+            ):
+                result_exp = pandas_merge_states(states=states, active_flights=flights)
+
+                result = merge_states(states=states, active_flights=flights)
+
+                self.assertTrue(result.equals(result_exp))
+
+    def test_merge_states_fixture_matches_pandas_merge(self) -> None:
+        result_exp = pandas_merge_states(
+            states=self.states, active_flights=self.active_flights
+        )
+
+        result = merge_states(states=self.states, active_flights=self.active_flights)
+
+        self.assertTrue(result.equals(result_exp))
+
+    def test_merge_states_empty(self) -> None:
+        states, active_flights = random_reports(rows=10)
+        for states, active_flights in (
+            (states.iloc[:0], active_flights),
+            (states, active_flights.iloc[:0]),
+            (states.iloc[:0], active_flights.iloc[:0]),
+        ):
+            result_exp = pandas_merge_states(
+                states=states, active_flights=active_flights
+            )
+
+            result = merge_states(states=states, active_flights=active_flights)
+
+            self.assertTrue(result.equals(result_exp))
+
+    def test_merge_states_does_not_modify_input(self) -> None:
+        states, active_flights = self.states.copy(), self.active_flights.copy()
+
+        merge_states(states=self.states, active_flights=self.active_flights)
+
+        self.assertTrue(self.states.equals(states))
+        self.assertTrue(self.active_flights.equals(active_flights))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,32 @@
-from datetime import UTC, datetime, timedelta
+from datetime import UTC, date, datetime, timedelta
+from hashlib import sha256
 from io import BytesIO
+import json
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 import boto3
 from moto import mock_aws
 import numpy as np
 import pandas as pd
-from plugins.common.constants import S3Sts
+import pyarrow as pa
+from plugins.common.constants import METRICS, S3Sts
 from plugins.common.exceptions import InvalidResponseError, InvalidSource
 from plugins.common.s3 import S3BucketConnector
-from plugins.scripts.opensky.client import OpenSkyClient
+from plugins.scripts.complete_flights.constants import METAFILE_SCHEMA
+from plugins.scripts.complete_flights.db import AircraftUtilizationClient
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.complete_flights.transformers import CompleteFlightsETL
+from plugins.scripts.opensky.client import (
+    AircraftDatabase,
+    DatabaseVersion,
+    OpenSkyClient,
+)
+from plugins.scripts.opensky.archive import SnapshotArchive
+from plugins.scripts.opensky.decoders import decode_snapshot, decode_states
 from plugins.scripts.opensky.transformers import (
     ActiveFlightsETL,
     MetadataETL,
@@ -17,33 +34,61 @@ from plugins.scripts.opensky.transformers import (
 )
 
 
+SOURCE_DTYPES = {
+    "icao24": np.uint32,
+    "last_contact": pd.Int32Dtype(),
+    "velocity": np.float32,
+    "vertical_rate": np.float32,
+    "takeoff_at": pd.Int32Dtype(),
+    "flight_last_contact": pd.Int32Dtype(),
+    "flight_trajectory": "category",
+}
+
+
+class AircraftUtilizationRecorder(AircraftUtilizationClient):
+    def __init__(self) -> None:
+        self.flights = []
+
+    def write_flights(self, df: pd.DataFrame) -> None:
+        self.flights.append(df)
+
+
 class TestActiveFlightsETLMethods(unittest.TestCase):
+    def set_states_monkey(self, states_response: dict) -> None:
+        payload = json.dumps(states_response).encode()
+        self.opensky_client.get_states_frame = lambda columns: decode_states(
+            payload=payload, columns=columns
+        )
+        self.opensky_client.get_states_snapshot = lambda columns: decode_snapshot(
+            payload=payload, columns=columns
+        )
+
     def set_default_states_monkey(self) -> None:
         states_exp = {
             "time": 1712338230,
             "states": [
-                {
-                    "icao24": "a23456",
-                    "callsign": "Speedbird",
-                    "origin_country": "Ukraine",
-                    "time_position": 1712338230,
-                    "last_contact": 1712338130,
-                    "longitude": -37.80467681,
-                    "latitude": 144.9659498,
-                    "baro_altitude": 700.25,
-                    "on_ground": False,
-                    "velocity": 240.52,
-                    "true_track": 5.154,
-                    "vertical_rate": 6.3,
-                    "sensors": None,
-                    "geo_altitude": 620.25,
-                    "squawk": "Code",
-                    "spi": False,
-                    "position_source": 0,
-                },
+                [
+                    "a23456",
+                    "Speedbird",
+                    "Ukraine",
+                    1712338230,
+                    1712338130,
+                    -37.80467681,
+                    144.9659498,
+                    700.25,
+                    False,
+                    240.52,
+                    5.154,
+                    6.3,
+                    None,
+                    620.25,
+                    "Code",
+                    False,
+                    0,
+                ],
             ],
         }
-        self.opensky_client.get_states = lambda: states_exp
+        self.set_states_monkey(states_response=states_exp)
 
     def setUp(self) -> None:
         self.mock = mock_aws()
@@ -74,13 +119,16 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
             opensky_client=self.opensky_client,
             source_filename=self.source_filename,
         )
+        self.index_dir = tempfile.TemporaryDirectory()
 
     def tearDown(self) -> None:
+        MetadataIndex.clear_indexes()
+        self.index_dir.cleanup()
         self.mock.stop()
 
     def test_extract_opensky_states_ok(self) -> None:
         states_data_exp = {
-            "icao24": ["a23456"],
+            "icao24": np.array([0xA23456], dtype=np.uint32),
             "last_contact": [1712338130],
             "velocity": [240.52],
             "vertical_rate": [6.3],
@@ -91,14 +139,69 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
 
         self.assertTrue(states.equals(states_exp))
 
+    def test_extract_opensky_states_archived(self) -> None:
+        states_exp = self.transformer._extract_opensky_states()
+        self.transformer.archive = SnapshotArchive(
+            s3_bucket=self.s3_bucket_connection, prefix="archive"
+        )
+
+        states = self.transformer._extract_opensky_states()
+        self.transformer.archive_snapshot()
+
+        self.assertTrue(states.equals(states_exp))
+        key = "archive/date=2024-04-05/hour=17/1712338230.parquet"
+        data = self.s3_bucket.Object(key=key).get().get("Body").read()
+        archived = pd.read_parquet(BytesIO(data))
+        self.assertEqual(archived["time"].tolist(), [1712338230])
+        self.assertEqual(archived["icao24"].tolist(), [0xA23456])
+        self.assertEqual(archived["callsign"].tolist(), ["Speedbird"])
+
+    def test_etl_archive_after_load(self) -> None:
+        calls = []
+        archive = mock.Mock()
+        archive.write.side_effect = lambda snapshot: calls.append("archive")
+        store = mock.Mock()
+        store.read.return_value = pd.DataFrame()
+        store.write.side_effect = lambda df: calls.append("load")
+        self.transformer.archive = archive
+        self.transformer.state_store = store
+
+        self.transformer.etl()
+
+        self.assertEqual(calls, ["load", "archive"])
+        self.assertEqual(archive.write.call_args.kwargs["snapshot"].time, 1712338230)
+
+    def test_etl_archive_failure_logged(self) -> None:
+        archive = mock.Mock()
+        archive.write.side_effect = OSError("archive unavailable")
+        self.transformer.archive = archive
+
+        with mock.patch(
+            "plugins.common.metrics.METRICS",
+            METRICS._replace(ENABLED=True, EXPORTERS=("log",)),
+        ), self.assertLogs() as logm:
+            source = self.transformer.etl()
+
+        self.assertFalse(source.empty)
+        self.assertIn(f"{self.source_filename}.parquet", self._source_keys())
+        self.assertTrue(
+            any("Failed to archive states snapshot" in line for line in logm.output)
+        )
+        stages = json.loads(logm.records[-1].getMessage())["stages"]
+        self.assertEqual(stages["ActiveFlightsETL.archive"]["errors"], 1)
+        self.assertEqual(stages["ActiveFlightsETL.etl"]["errors"], 1)
+
+    def _source_keys(self) -> list:
+        return [obj.key for obj in self.s3_bucket.objects.all()]
+
     def test_extract_opensky_states_invalid(self) -> None:
         no_states_data = {"time": 1712338230}
-        self.opensky_client.get_states = lambda: no_states_data
+        self.set_states_monkey(states_response=no_states_data)
         with self.assertRaises(InvalidResponseError) as _:
             self.transformer._extract_opensky_states()
 
         invalid_states_data = {"time": 1712338230, "states": "invalid"}
-        self.opensky_client.get_states = lambda: invalid_states_data
+        self.set_states_monkey(states_response=invalid_states_data)
         with self.assertRaises(InvalidResponseError) as _:
             self.transformer._extract_opensky_states()
 
@@ -106,20 +209,35 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
 
     def test_extract_latest_source_ok(self) -> None:
         key = f"{self.source_filename}.parquet"
-        data_exp = {
-            "icao24": ["a23456", "65432a"],
-            "last_contact": [1712338235, 1712338225],
-            "velocity": [18.41, 240.52],
-            "vertical_rate": [6.11, 0],
-            "takeoff_at": [None, 1712338215],
-            "flight_last_contact": [None, 1712338225],
-            "flight_trajectory": [None, "other"],
-            "is_first_contact": [None, False],
+        active_last_contact = round(
+            (datetime.now(tz=UTC) - timedelta(minutes=19)).timestamp()
+        )
+        inactive_last_contact = round(
+            (datetime.now(tz=UTC) - timedelta(minutes=21)).timestamp()
+        )
+        source_data = {
+            "icao24": ["a23456", "65432a", "1b3456"],
+            "last_contact": [1712338235, 1712338225, 1712338215],
+            "velocity": [18.41, 240.52, 137.18],
+            "vertical_rate": [6.11, 0, -1.1],
+            "takeoff_at": [None, 1712338215, 1712338205],
+            "flight_last_contact": [None, active_last_contact, inactive_last_contact],
+            "flight_trajectory": [None, "other", "descend"],
+            "is_first_contact": [None, False, False],
         }
         out_buffer = BytesIO()
-        latest_source_exp = pd.DataFrame(data=data_exp)
-        latest_source_exp.to_parquet(path=out_buffer, index=False)
+        pd.DataFrame(data=source_data).to_parquet(path=out_buffer, index=False)
         self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=key)
+        data_exp = {
+            "icao24": np.array([0x65432A], dtype=np.uint32),
+            "takeoff_at": pd.array([1712338215], dtype=pd.Int32Dtype()),
+            "flight_last_contact": pd.array(
+                [active_last_contact], dtype=pd.Int32Dtype()
+            ),
+            "flight_trajectory": pd.Categorical(["other"]),
+            "is_first_contact": [False],
+        }
+        latest_source_exp = pd.DataFrame(data=data_exp)
 
         latest_source = self.transformer._extract_latest_source()
 
@@ -138,23 +256,33 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
         latest_source_exp.to_parquet(path=out_buffer, index=False)
         self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=key)
 
-        with self.assertRaises(InvalidSource) as _:
+        with self.assertRaises(InvalidSource) as e:
             self.transformer._extract_latest_source()
+        self.assertIn("flight_last_contact", str(e.exception))
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
+    def test_extract_latest_source_corrupt(self) -> None:
+        key = f"{self.source_filename}.parquet"
+        self.s3_bucket.put_object(Body=b"corrupt", Key=key)
+
+        with self.assertRaises(InvalidSource) as e:
+            self.transformer._extract_latest_source()
+        self.assertIn("cannot be read", str(e.exception))
 
         self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
 
     def test_extract_latest_source_empty(self) -> None:
         data_columns = (
             "icao24",
-            "last_contact",
-            "velocity",
-            "vertical_rate",
             "takeoff_at",
             "flight_last_contact",
             "flight_trajectory",
             "is_first_contact",
         )
-        latest_source_exp = pd.DataFrame(columns=data_columns)
+        latest_source_exp = pd.DataFrame(columns=data_columns).astype(
+            {"icao24": np.uint32}
+        )
 
         latest_source = self.transformer._extract_latest_source()
 
@@ -185,62 +313,6 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
 
         self.assertTrue(active_flights.equals(active_flights_exp))
 
-    def test_update_flight_last_contact_ok(self) -> None:
-        source_data = {
-            "icao24": ["a23456", "65432a", "1b3456"],
-            "last_contact": [0, 1712338237, 1712338135],
-            "velocity": [137.18, 240.52, 18.41],
-            "vertical_rate": [-1.1, 0, 6.11],
-            "takeoff_at": [0, 1712338215, 1712338205],
-            "flight_last_contact": [1712338203, 1712338115, 0],
-            "flight_trajectory": ["descend", "other", "climb"],
-            "is_first_contact": [False, True, np.NaN],
-        }
-        source = pd.DataFrame(data=source_data)
-        data_exp = {
-            "icao24": ["a23456", "65432a", "1b3456"],
-            "last_contact": [0, 1712338237, 1712338135],
-            "velocity": [137.18, 240.52, 18.41],
-            "vertical_rate": [-1.1, 0, 6.11],
-            "takeoff_at": [0, 1712338215, 1712338205],
-            "flight_last_contact": [1712338203, 1712338237, 1712338135],
-            "flight_trajectory": ["descend", "other", "climb"],
-            "is_first_contact": [False, True, np.NaN],
-        }
-        result_exp = pd.DataFrame(data=data_exp)
-
-        result = self.transformer._update_flight_last_contact(source=source)
-
-        self.assertTrue(result.equals(result_exp))
-
-    def test_define_first_contact_ok(self) -> None:
-        source_data = {
-            "icao24": ["a23456", "65432a", "1b3456"],
-            "last_contact": [0, 1712338237, 1712338135],
-            "velocity": [137.18, 240.52, 18.41],
-            "vertical_rate": [-1.1, 0, 6.11],
-            "takeoff_at": [0, 1712338215, 1712338205],
-            "flight_last_contact": [1712338203, 1712338237, 1712338135],
-            "flight_trajectory": ["descend", "other", "climb"],
-            "is_first_contact": [False, True, pd.NA],
-        }
-        source = pd.DataFrame(data=source_data)
-        data_exp = {
-            "icao24": ["a23456", "65432a", "1b3456"],
-            "last_contact": [0, 1712338237, 1712338135],
-            "velocity": [137.18, 240.52, 18.41],
-            "vertical_rate": [-1.1, 0, 6.11],
-            "takeoff_at": [0, 1712338215, 1712338205],
-            "flight_last_contact": [1712338203, 1712338237, 1712338135],
-            "flight_trajectory": ["descend", "other", "climb"],
-            "is_first_contact": [False, False, True],
-        }
-        result_exp = pd.DataFrame(data=data_exp)
-
-        result = self.transformer._define_first_contact(source=source)
-
-        self.assertTrue(result.equals(result_exp))
-
     def test_remove_inactive_ok(self) -> None:
         inactive_last_contact = round(
             (datetime.now(tz=UTC) - timedelta(minutes=21)).timestamp()
@@ -273,7 +345,7 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
 
     def test_extract_ok(self) -> None:
         states_data_exp = {
-            "icao24": ["a23456"],
+            "icao24": np.array([0xA23456], dtype=np.uint32),
             "last_contact": [1712338130],
             "velocity": [240.52],
             "vertical_rate": [6.3],
@@ -281,21 +353,33 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
         states_exp = pd.DataFrame(data=states_data_exp)
 
         key = f"{self.source_filename}.parquet"
-        source_data_exp = {
+        active_last_contact = round(datetime.now(tz=UTC).timestamp())
+        source_data = {
             "icao24": ["a23456", "65432a"],
             "last_contact": [1712338235, 1712338225],
             "velocity": [18.41, 240.52],
             "vertical_rate": [6.11, 0],
             "takeoff_at": [None, 1712338215],
-            "flight_last_contact": [None, 1712338225],
+            "flight_last_contact": [None, active_last_contact],
             "flight_trajectory": [None, "other"],
             "is_first_contact": [None, False],
         }
         out_buffer = BytesIO()
-        latest_source_exp = pd.DataFrame(data=source_data_exp)
-        latest_source_exp.to_parquet(path=out_buffer, index=False)
+        pd.DataFrame(data=source_data).to_parquet(path=out_buffer, index=False)
         self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key=key)
 
+        latest_source_exp = pd.DataFrame(
+            data={
+                "icao24": np.array([0x65432A], dtype=np.uint32),
+                "takeoff_at": pd.array([1712338215], dtype=pd.Int32Dtype()),
+                "flight_last_contact": pd.array(
+                    [active_last_contact], dtype=pd.Int32Dtype()
+                ),
+                "flight_trajectory": pd.Categorical(["other"]),
+                "is_first_contact": [False],
+            }
+        )
+
         source_reports = self.transformer._extract()
 
         self.assertTrue(source_reports.states.equals(states_exp))
@@ -306,7 +390,7 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
     def test_transform_ok(self) -> None:
         active_last_contact = round(datetime.now(tz=UTC).timestamp())
         states_data = {
-            "icao24": ["65432a", "12c456"],
+            "icao24": np.array([0x65432A, 0x12C456], dtype=np.uint32),
             "last_contact": [
                 active_last_contact,
                 active_last_contact,
@@ -316,7 +400,7 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
         }
         states = pd.DataFrame(data=states_data)
         source_data = {
-            "icao24": ["a23456", "65432a", "1b3456"],
+            "icao24": np.array([0xA23456, 0x65432A, 0x1B3456], dtype=np.uint32),
             "last_contact": [
                 0,
                 active_last_contact - 15 * 60,
@@ -337,31 +421,24 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
         source_reports = SourceReports(states=states, latest_source=latest_source)
 
         result_data = {
-            "icao24": ["65432a", "12c456", "1b3456"],
-            "last_contact": [active_last_contact, active_last_contact, 0],
-            "velocity": [210.11, 18.41, 0.00],
-            "vertical_rate": [-0.70, 6.11, 0.00],
+            "icao24": np.array([0x12C456, 0x1B3456, 0x65432A], dtype=np.uint32),
+            "last_contact": [active_last_contact, 0, active_last_contact],
+            "velocity": [18.41, 0.00, 210.11],
+            "vertical_rate": [6.11, 0.00, -0.70],
             "takeoff_at": [
-                1712338215,
                 0,
                 1712338205,
+                1712338215,
             ],
             "flight_last_contact": [
-                active_last_contact,
                 active_last_contact,
                 active_last_contact - 5 * 60,
+                active_last_contact,
             ],
-            "flight_trajectory": ["other", np.NaN, "climb"],
-            "is_first_contact": [False, True, False],
+            "flight_trajectory": [np.NaN, "climb", "other"],
+            "is_first_contact": [True, False, False],
         }
-        result_exp = pd.DataFrame(result_data)
-        result_exp = result_exp.astype(
-            {
-                "last_contact": pd.Int32Dtype(),
-                "takeoff_at": pd.Int32Dtype(),
-                "flight_last_contact": pd.Int32Dtype(),
-            }
-        )
+        result_exp = pd.DataFrame(result_data).astype(SOURCE_DTYPES)
 
         result = self.transformer._transform(source_reports=source_reports)
 
@@ -370,7 +447,7 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
     def test_load_ok(self) -> None:
         key = f"{self.source_filename}.parquet"
         source_data_exp = {
-            "icao24": ["65432a", "12c456", "1b3456"],
+            "icao24": np.array([0x65432A, 0x12C456, 0x1B3456], dtype=np.uint32),
             "last_contact": [1712338215, 1712338215, 0],
             "velocity": [210.11, 18.41, 0.00],
             "vertical_rate": [-0.70, 6.11, 0.00],
@@ -387,7 +464,7 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
             "flight_trajectory": ["other", np.NaN, "climb"],
             "is_first_contact": [False, True, False],
         }
-        source_exp = pd.DataFrame(source_data_exp)
+        source_exp = pd.DataFrame(source_data_exp).astype(SOURCE_DTYPES)
 
         self.transformer._load(source=source_exp)
 
@@ -399,6 +476,112 @@ class TestActiveFlightsETLMethods(unittest.TestCase):
 
         self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
 
+    def put_metadata(self) -> None:
+        metadata = pd.DataFrame(
+            data={
+                "icao24": ["65432a"],
+                "registration": ["UR-PSA"],
+                "model": ["737-8"],
+                "manufacturer_icao": ["BOEING"],
+                "owner": ["UIA"],
+                "operator": ["UIA"],
+                "built": ["2018-01-01"],
+            }
+        )
+        out_buffer = BytesIO()
+        metadata.to_parquet(path=out_buffer, index=False)
+        self.s3_bucket.put_object(Body=out_buffer.getvalue(), Key="test-meta.parquet")
+
+    def run_two_task_cycle(self, complete: CompleteFlightsETL) -> None:
+        self.transformer.etl()
+        complete.etl()
+
+    def run_fused_cycle(self, complete: CompleteFlightsETL) -> None:
+        complete.etl(source=self.transformer.etl(load=False))
+
+    def test_etl_fused_matches_two_task(self) -> None:
+        key = f"{self.source_filename}.parquet"
+        now = round(datetime.now(tz=UTC).timestamp())
+        self.set_states_monkey(
+            states_response={
+                "time": now,
+                "states": [
+                    ["65432a", None, "Ukraine", now, now]
+                    + [None, None, None, False, 0.0, None, 0.0]
+                    + [None, None, None, False, 0],
+                    ["12c456", None, "Ukraine", now, now]
+                    + [None, None, None, False, 80.5, None, 6.11]
+                    + [None, None, None, False, 0],
+                ],
+            }
+        )
+        latest_source = pd.DataFrame(
+            data={
+                "icao24": ["65432a", "1b3456"],
+                "last_contact": [now - 60, now - 120],
+                "velocity": [9.5, 240.52],
+                "vertical_rate": [-1.2, 0.0],
+                "takeoff_at": [now - 3600, now - 7200],
+                "flight_last_contact": [now - 60, now - 120],
+                "flight_trajectory": ["descend", "other"],
+                "is_first_contact": [False, False],
+            }
+        ).astype(
+            {
+                "last_contact": pd.Int32Dtype(),
+                "takeoff_at": pd.Int32Dtype(),
+                "flight_last_contact": pd.Int32Dtype(),
+            }
+        )
+        self.put_metadata()
+
+        results = []
+        for run_cycle in (self.run_two_task_cycle, self.run_fused_cycle):
+            self.s3_bucket_connection.upload_to_parquet(
+                df=latest_source, filename=self.source_filename
+            )
+            db_client = AircraftUtilizationRecorder()
+            complete = CompleteFlightsETL(
+                s3_bucket=self.s3_bucket_connection,
+                db_client=db_client,
+                source_filename=self.source_filename,
+                meta_filename="test-meta",
+                index_dir=self.index_dir.name,
+            )
+            run_cycle(complete=complete)
+            data = self.s3_bucket.Object(key=key).get().get("Body").read()
+            results.append((pd.read_parquet(BytesIO(data)), db_client.flights))
+
+        (two_task_state, two_task_flights), (fused_state, fused_flights) = results
+        self.assertTrue(fused_state.equals(two_task_state))
+        self.assertEqual(len(fused_flights), len(two_task_flights))
+        self.assertEqual(len(fused_flights[0]), 1)
+        for fused, two_task in zip(fused_flights, two_task_flights):
+            self.assertTrue(fused.equals(two_task))
+
+        self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
+
+    def test_etl_fused_writes_state_once(self) -> None:
+        self.put_metadata()
+        db_client = AircraftUtilizationRecorder()
+        complete = CompleteFlightsETL(
+            s3_bucket=self.s3_bucket_connection,
+            db_client=db_client,
+            source_filename=self.source_filename,
+            meta_filename="test-meta",
+            index_dir=self.index_dir.name,
+        )
+        uploads = []
+        upload_to_parquet = self.s3_bucket_connection.upload_to_parquet
+        self.s3_bucket_connection.upload_to_parquet = lambda df, filename, schema: (
+            uploads.append(filename),
+            upload_to_parquet(df=df, filename=filename, schema=schema),
+        )
+
+        self.run_fused_cycle(complete=complete)
+
+        self.assertEqual(uploads, [self.source_filename])
+
 
 class TestMetadataETLMethods(unittest.TestCase):
     def set_default_metadata_monkey(self) -> None:
@@ -431,8 +614,21 @@ class TestMetadataETLMethods(unittest.TestCase):
             "notes": ["test"],
             "categoryDescription": ["Large"],
         }
-        metadata_exp = pd.DataFrame(data=metadata)
-        self.opensky_client.get_aircraft_database = lambda: metadata_exp
+        self.metadata_content = pd.DataFrame(data=metadata).to_csv(index=False).encode()
+        self.database_version = DatabaseVersion(
+            etag='"65f1c0b3-1a2b3c"',
+            last_modified="Wed, 13 Mar 2024 16:25:55 GMT",
+            content_hash=sha256(self.metadata_content).hexdigest(),
+        )
+
+        def get_aircraft_database(
+            version: DatabaseVersion, path: str
+        ) -> AircraftDatabase:
+            with open(path, "wb") as file:
+                file.write(self.metadata_content)
+            return AircraftDatabase(path=path, version=self.database_version)
+
+        self.opensky_client.get_aircraft_database = get_aircraft_database
 
     def setUp(self) -> None:
         self.mock = mock_aws()
@@ -456,69 +652,105 @@ class TestMetadataETLMethods(unittest.TestCase):
 
         opensky_auth = "test"
         self.meta_filename = "test-meta"
+        self.spool_dir = tempfile.mkdtemp()
         self.opensky_client = OpenSkyClient(auth=opensky_auth)
         self.set_default_metadata_monkey()
         self.transformer = MetadataETL(
             s3_bucket=self.s3_bucket_connection,
             opensky_client=self.opensky_client,
             meta_filename=self.meta_filename,
+            spool_dir=self.spool_dir,
         )
 
     def tearDown(self) -> None:
+        shutil.rmtree(self.spool_dir)
         self.mock.stop()
 
+    def _spool_metadata(self) -> str:
+        path = os.path.join(self.spool_dir, "aircraftDatabase.csv")
+        with open(path, "wb") as file:
+            file.write(self.metadata_content)
+        return path
+
     def test_extract_ok(self) -> None:
         metadata_data = {
             "icao24": ["a23456"],
             "registration": ["ABCD-E"],
-            "manufacturericao": ["BOEING"],
-            "manufacturername": ["Boeing"],
             "model": ["737 NG"],
-            "typecode": ["B737NG"],
-            "serialnumber": ["A-2345"],
-            "linenumber": ["CD567"],
-            "icaoaircrafttype": ["L1P"],
-            "operator": ["Test Air"],
-            "operatorcallsign": ["TEST AIR"],
-            "operatoricao": ["TAR"],
-            "operatoriata": ["TA"],
+            "manufacturericao": ["BOEING"],
             "owner": ["Test Lease"],
-            "testreg": ["T-AR"],
-            "registered": ["2001-03-02"],
-            "reguntil": ["2040-03-02"],
-            "status": [""],
+            "operator": ["Test Air"],
             "built": ["2000-10-05"],
-            "firstflightdate": ["2001-05-10"],
-            "seatconfiguration": [""],
-            "engines": ["CFM INTL. CFM56 SERIES"],
-            "modes": ["false"],
-            "adsb": ["true"],
-            "acars": ["false"],
-            "notes": ["test"],
-            "categoryDescription": ["Large"],
         }
         metadata_exp = pd.DataFrame(data=metadata_data)
 
-        metadata = self.transformer._extract()
+        reader = self.transformer._extract(path=self._spool_metadata())
+        metadata = reader.read_all().to_pandas()
+
+        self.assertTrue(metadata.equals(metadata_exp))
+
+    def test_extract_pinned_dtypes(self) -> None:
+        self.metadata_content = (
+            b"icao24,registration,manufacturericao,model,operator,owner,built\n"
+            b'"012345",1234,,"737\nNG",Test Air,Test Lease,2000\n'
+        )
+        metadata_data = {
+            "icao24": ["012345"],
+            "registration": ["1234"],
+            "model": ["737\nNG"],
+            "manufacturericao": [None],
+            "owner": ["Test Lease"],
+            "operator": ["Test Air"],
+            "built": ["2000"],
+        }
+        metadata_exp = pd.DataFrame(data=metadata_data)
+
+        reader = self.transformer._extract(path=self._spool_metadata())
+        metadata = reader.read_all().to_pandas()
 
         self.assertTrue(metadata.equals(metadata_exp))
 
     def test_transform_ok(self) -> None:
-        source = self.opensky_client.get_aircraft_database()
+        source = self.transformer._extract(path=self._spool_metadata())
         metadata_data_exp = {
-            "icao24": ["a23456"],
+            "icao24": np.array([0xA23456], dtype=np.uint32),
             "registration": ["ABCD-E"],
-            "model": ["737 NG"],
-            "manufacturer_icao": ["BOEING"],
-            "owner": ["Test Lease"],
-            "operator": ["Test Air"],
-            "built": ["2000-10-05"],
+            "model": pd.Categorical(["737 NG"]),
+            "manufacturer_icao": pd.Categorical(["BOEING"]),
+            "owner": pd.Categorical(["Test Lease"]),
+            "operator": pd.Categorical(["Test Air"]),
+            "built": pd.to_datetime(["2000-10-05"]).astype("datetime64[ms]"),
         }
         metadata_exp = pd.DataFrame(data=metadata_data_exp)
 
-        metadata = self.transformer._transform(source_metadata=source)
+        batches = list(self.transformer._transform(source_metadata=source))
+        metadata = pa.Table.from_batches(batches)
 
-        self.assertTrue(metadata.equals(metadata_exp))
+        self.assertTrue(metadata.schema.equals(METAFILE_SCHEMA))
+        self.assertTrue(metadata.to_pandas(date_as_object=False).equals(metadata_exp))
+
+    def test_transform_deduplicated_sorted(self) -> None:
+        self.metadata_content = (
+            b"icao24,registration,manufacturericao,model,operator,owner,built\n"
+            b"ffffff,FF,BOEING,737,Test Air,,2000-10-05\n"
+            b"00a1b2,A1,AIRBUS,A320,Test Air,,2000\n"
+            b"bad,XX,AIRBUS,A320,Test Air,,\n"
+            b"FFFFFF,FF-2,BOEING,737,Test Air,,\n"
+        )
+        source = self.transformer._extract(path=self._spool_metadata())
+
+        with self.assertLogs() as logm:
+            batches = list(self.transformer._transform(source_metadata=source))
+            self.assertIn("Dropped 1 aircraft with malformed icao24", logm.output[-2])
+            self.assertIn("Dropped 1 aircraft with duplicate icao24", logm.output[-1])
+        metadata = pa.Table.from_batches(batches)
+
+        self.assertEqual(metadata.column("icao24").to_pylist(), [0xA1B2, 0xFFFFFF])
+        self.assertEqual(metadata.column("registration").to_pylist(), ["A1", "FF"])
+        self.assertEqual(
+            metadata.column("built").to_pylist(), [None, date(2000, 10, 5)]
+        )
+        self.assertEqual(metadata.column("owner").null_count, 2)
 
     def test_load_ok(self) -> None:
         key = f"{self.meta_filename}.parquet"
@@ -532,17 +764,97 @@ class TestMetadataETLMethods(unittest.TestCase):
             "built": ["2000-10-05"],
         }
         metadata_exp = pd.DataFrame(data=metadata_data_exp)
+        batch = pa.RecordBatch.from_pandas(metadata_exp, preserve_index=False)
 
-        self.transformer._load(metadata=metadata_exp)
+        self.transformer._load(
+            metadata=[batch, batch],
+            path=os.path.join(self.spool_dir, "metadata.parquet"),
+        )
 
         data = self.s3_bucket.Object(key=key).get().get("Body").read()
         out_buffer = BytesIO(data)
         result = pd.read_parquet(out_buffer)
 
-        self.assertTrue(result.equals(metadata_exp))
+        self.assertTrue(result.equals(pd.concat([metadata_exp] * 2, ignore_index=True)))
 
         self.s3_bucket.delete_objects(Delete={"Objects": [{"Key": key}]})
 
+    def _object_keys(self) -> list:
+        return [obj.key for obj in self.s3_bucket.objects.all()]
+
+    def test_etl_ok(self) -> None:
+        self.transformer.etl()
+
+        version = self.s3_bucket_connection.read_json(
+            filename=f"{self.meta_filename}-version"
+        )
+        self.assertIn(f"{self.meta_filename}.parquet", self._object_keys())
+        self.assertEqual(version, self.database_version._asdict())
+        self.assertListEqual(os.listdir(self.spool_dir), [])
+
+    def _upload_metafile(self) -> None:
+        self.s3_bucket.put_object(Key=f"{self.meta_filename}.parquet", Body=b"stub")
+
+    def test_etl_not_modified(self) -> None:
+        requested_versions = []
+
+        def not_modified(version: DatabaseVersion, path: str) -> AircraftDatabase:
+            requested_versions.append(version)
+            return AircraftDatabase(path=None, version=version)
+
+        self.s3_bucket_connection.upload_json(
+            data=self.database_version._asdict(),
+            filename=f"{self.meta_filename}-version",
+        )
+        self._upload_metafile()
+        self.opensky_client.get_aircraft_database = not_modified
+
+        with self.assertLogs() as logm:
+            self.transformer.etl()
+            self.assertIn("Aircraft database not modified", logm.output[-1])
+
+        self.assertEqual(requested_versions, [self.database_version])
+        body = self.s3_bucket.Object(key=f"{self.meta_filename}.parquet").get()
+        self.assertEqual(body["Body"].read(), b"stub")
+
+    def test_etl_metafile_missing(self) -> None:
+        requested_versions = []
+        get_aircraft_database = self.opensky_client.get_aircraft_database
+
+        def requested(version: DatabaseVersion, path: str) -> AircraftDatabase:
+            requested_versions.append(version)
+            return get_aircraft_database(version=version, path=path)
+
+        self.s3_bucket_connection.upload_json(
+            data=self.database_version._asdict(),
+            filename=f"{self.meta_filename}-version",
+        )
+        self.opensky_client.get_aircraft_database = requested
+
+        with self.assertLogs() as logm:
+            self.transformer.etl()
+            self.assertTrue(any("Metafile missing" in line for line in logm.output))
+
+        self.assertEqual(requested_versions, [DatabaseVersion()])
+        self.assertIn(f"{self.meta_filename}.parquet", self._object_keys())
+
+    def test_etl_content_unchanged(self) -> None:
+        stored_version = self.database_version._replace(etag='"previous"')
+        self.s3_bucket_connection.upload_json(
+            data=stored_version._asdict(),
+            filename=f"{self.meta_filename}-version",
+        )
+        self._upload_metafile()
+
+        self.transformer.etl()
+
+        version = self.s3_bucket_connection.read_json(
+            filename=f"{self.meta_filename}-version"
+        )
+        body = self.s3_bucket.Object(key=f"{self.meta_filename}.parquet").get()
+        self.assertEqual(body["Body"].read(), b"stub")
+        self.assertEqual(version, self.database_version._asdict())
+
 
 if __name__ == "__main__":
     unittest.main()
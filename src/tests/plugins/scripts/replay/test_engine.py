@@ -0,0 +1,165 @@
+from datetime import UTC, date, datetime
+import tempfile
+import unittest
+
+import boto3
+from moto import mock_aws
+import pandas as pd
+from plugins.common.constants import S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.opensky.archive import ARCHIVE_COLUMNS, SnapshotArchive
+from plugins.scripts.opensky.decoders import decode_snapshot
+from plugins.scripts.replay.engine import (
+    ParquetReplaySink,
+    ReplayChunk,
+    ReplayEngine,
+    ReplaySettings,
+    ReplaySink,
+    sort_flights,
+    to_timestamp,
+)
+from tests.benchmarks.traffic import TrafficGenerator
+
+
+DAY = date(2024, 4, 5)
+START = round(datetime(2024, 4, 5, tzinfo=UTC).timestamp())
+INTERVAL = 300
+SNAPSHOTS = 240
+HOUR = 60 * 60
+
+
+class RecordingSink(ReplaySink):
+    def __init__(self) -> None:
+        self.writes = []
+
+    def write(self, flights: pd.DataFrame, chunk: ReplayChunk) -> None:
+        self.writes.append((chunk, flights))
+
+    def flights(self) -> pd.DataFrame:
+        return sort_flights(
+            flights=pd.concat(
+                [flights for _, flights in self.writes], ignore_index=True
+            )
+        )
+
+
+class TestReplayEngine(unittest.TestCase):
+    def test_chunks(self) -> None:
+        settings = ReplaySettings(credentials=None, meta_filename="test-meta")
+        engine = ReplayEngine(
+            settings=settings, sink=RecordingSink(), chunk_seconds=HOUR
+        )
+
+        chunks = engine.chunks(start=START, end=START + 150 * 60)
+
+        self.assertEqual(
+            chunks,
+            [
+                ReplayChunk(start=START, end=START + HOUR),
+                ReplayChunk(start=START + HOUR, end=START + 2 * HOUR),
+                ReplayChunk(start=START + 2 * HOUR, end=START + 150 * 60),
+            ],
+        )
+
+    def test_to_timestamp(self) -> None:
+        self.assertEqual(to_timestamp("2024-04-05"), START)
+        self.assertEqual(to_timestamp("2024-04-05T03:00:00+02:00"), START + HOUR)
+
+
+class TestReplayArchive(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.mock = mock_aws()
+        cls.mock.start()
+        cls.credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        boto3.client("s3", region_name=cls.credentials.REGION).create_bucket(
+            Bucket=cls.credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": cls.credentials.REGION},
+        )
+        cls.directory = tempfile.TemporaryDirectory()
+        archive = SnapshotArchive(
+            s3_bucket=S3BucketConnector(credentials=cls.credentials),
+            prefix="archive",
+            spool_dir=cls.directory.name,
+        )
+        generator = TrafficGenerator(
+            aircraft=200, seed=7, start=START, interval=INTERVAL
+        )
+        for payload in generator.payloads(count=SNAPSHOTS):
+            archive.write(
+                snapshot=decode_snapshot(payload=payload, columns=ARCHIVE_COLUMNS)
+            )
+        archive.compact(day=DAY)
+        cls.settings = ReplaySettings(
+            credentials=cls.credentials,
+            meta_filename="test-meta",
+            archive_prefix="archive",
+            index_dir=cls.directory.name,
+        )
+        cls.start = START + HOUR
+        cls.end = START + SNAPSHOTS * INTERVAL
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        S3BucketConnector.clear_clients()
+        cls.directory.cleanup()
+        cls.mock.stop()
+
+    def tearDown(self) -> None:
+        MetadataIndex.clear_indexes()
+
+    def replay(self, workers: int, chunk_seconds: int) -> RecordingSink:
+        sink = RecordingSink()
+        ReplayEngine(
+            settings=self.settings,
+            sink=sink,
+            workers=workers,
+            chunk_seconds=chunk_seconds,
+        ).replay(start=self.start, end=self.end)
+        return sink
+
+    def test_chunked_replays_match_single_pass(self) -> None:
+        single = self.replay(workers=1, chunk_seconds=24 * HOUR)
+        sequential = self.replay(workers=1, chunk_seconds=3 * HOUR)
+        with self.assertLogs("plugins.scripts.replay.engine") as logm:
+            parallel = self.replay(workers=3, chunk_seconds=2 * HOUR)
+
+        flights = single.flights()
+        self.assertEqual(len(single.writes), 1)
+        self.assertGreater(len(flights), 50)
+        self.assertGreater(len(sequential.writes), 1)
+        self.assertTrue(sequential.flights().equals(flights))
+        self.assertGreater(len(parallel.writes), len(sequential.writes))
+        self.assertTrue(parallel.flights().equals(flights))
+        self.assertTrue(any("with diverged state" in line for line in logm.output))
+        self.assertLess(
+            flights["landed_at"].max(), pd.Timestamp(self.end, unit="s", tz=UTC)
+        )
+
+    def test_parquet_sink(self) -> None:
+        s3_bucket = S3BucketConnector(credentials=self.credentials)
+        engine = ReplayEngine(
+            settings=self.settings,
+            sink=ParquetReplaySink(s3_bucket=s3_bucket, prefix="replay"),
+            workers=1,
+            chunk_seconds=24 * HOUR,
+        )
+
+        total = engine.replay(start=self.start, end=self.end)
+
+        flights = s3_bucket.read_parquet(filename="replay/20240405T010000")
+        self.assertEqual(len(flights), total)
+        self.assertEqual(
+            list(flights.columns[:3]),
+            ["icao24", "flight_duration_minutes", "landed_at"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
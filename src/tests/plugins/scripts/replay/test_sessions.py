@@ -0,0 +1,240 @@
+from datetime import UTC, date, datetime
+import itertools
+import json
+import tempfile
+from typing import List, Tuple, Union
+import unittest
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+import numpy as np
+import pandas as pd
+from plugins.common.constants import S3Sts
+from plugins.common.s3 import S3BucketConnector
+from plugins.scripts.complete_flights.metadata import MetadataIndex
+from plugins.scripts.opensky.archive import ARCHIVE_COLUMNS, SnapshotArchive
+from plugins.scripts.opensky.decoders import decode_snapshot
+from plugins.scripts.replay.engine import (
+    REPLAY_COLUMNS,
+    ReplayChunk,
+    Replayer,
+    ReplaySettings,
+    sort_flights,
+)
+from plugins.scripts.replay.sessions import FlightSessionizer
+from tests.benchmarks.traffic import TrafficGenerator
+
+
+DAY = date(2024, 4, 5)
+START = round(datetime(2024, 4, 5, tzinfo=UTC).timestamp())
+FLIGHT_COLUMNS = ["icao24", "flight_duration_minutes", "landed_at"]
+
+Row = Tuple[str, Union[int, None], Union[float, None], Union[float, None]]
+PARKED = (0.0, 0.0)
+TAXI = (5.0, 0.0)
+CLIMB = (120.0, 8.0)
+CRUISE = (230.0, 0.0)
+DESCEND = (90.0, -5.0)
+PALETTE = [PARKED, TAXI, CLIMB, CRUISE, DESCEND, (None, None), (9.0, None)]
+
+
+def payload(time: int, rows: List[Row]) -> bytes:
+    states = [
+        [icao24, "TEST    ", "Ukraine", last_contact, last_contact]
+        + [30.5, 50.4, 1000.0, False, velocity, 90.0, vertical_rate, None]
+        + [1100.0, "7000", False, 0]
+        for icao24, last_contact, velocity, vertical_rate in rows
+    ]
+    return json.dumps({"time": time, "states": states}).encode()
+
+
+class TestFlightSessionizer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.mock = mock_aws()
+        self.mock.start()
+        credentials = S3Sts(
+            REGION="us-east-2",
+            ROLE_ARN="arn:aws:iam::123456789012:role/TestRunner",
+            BUCKET="test-bucket",
+            ROLE_SESSION="TestRunner",
+        )
+        boto3.client("s3", region_name=credentials.REGION).create_bucket(
+            Bucket=credentials.BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": credentials.REGION},
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = SnapshotArchive(
+            s3_bucket=S3BucketConnector(credentials=credentials),
+            prefix="archive",
+            spool_dir=self.directory.name,
+        )
+        self.settings = ReplaySettings(
+            credentials=credentials,
+            meta_filename="test-meta",
+            archive_prefix="archive",
+            index_dir=self.directory.name,
+            overlap_seconds=0,
+        )
+        self.sessionizer = FlightSessionizer()
+
+    def tearDown(self) -> None:
+        MetadataIndex.clear_indexes()
+        S3BucketConnector.clear_clients()
+        self.directory.cleanup()
+        self.mock.stop()
+
+    def write(self, payloads: List[bytes]) -> None:
+        for data in payloads:
+            self.archive.write(
+                snapshot=decode_snapshot(payload=data, columns=ARCHIVE_COLUMNS)
+            )
+        self.archive.compact(day=DAY)
+
+    def streamed(self) -> pd.DataFrame:
+        replay = Replayer(settings=self.settings).replay(
+            chunk=ReplayChunk(start=START, end=START + 24 * 60 * 60)
+        )
+        if replay.flights.empty:
+            return pd.DataFrame(columns=FLIGHT_COLUMNS)
+        return sort_flights(flights=replay.flights[FLIGHT_COLUMNS])
+
+    def batched(self) -> pd.DataFrame:
+        table = self.archive.read_day(day=DAY, columns=REPLAY_COLUMNS)
+        return self.sessionizer.sessionize(table=table)
+
+    def test_flights(self) -> None:
+        timeline = [
+            [("a00001", START, *PARKED), ("a00002", START, *CLIMB)],
+            [("a00001", START + 55, *CLIMB), ("a00002", START + 60, *CRUISE)],
+            [("a00001", START + 120, *CRUISE)],
+            [("a00001", START + 180, *DESCEND), ("a00002", START + 150, *DESCEND)],
+            [("a00001", START + 240, *TAXI), ("a00002", START + 240, *PARKED)],
+            [("a00001", START + 300, *TAXI)],
+        ]
+        self.write(
+            payloads=[
+                payload(time=START + 60 * index, rows=rows)
+                for index, rows in enumerate(timeline)
+            ]
+        )
+
+        flights = self.batched()
+
+        self.assertEqual(flights["icao24"].tolist(), [0xA00001, 0xA00002])
+        self.assertEqual(flights["flight_duration_minutes"].tolist(), [4, 4])
+        self.assertEqual(
+            flights["landed_at"].tolist(),
+            [pd.Timestamp(START + 240, unit="s", tz=UTC)] * 2,
+        )
+        self.assertTrue(flights.equals(self.streamed()))
+
+    def test_inactivity_gap(self) -> None:
+        timeline = {
+            0: [("a00001", START, *CLIMB), ("a00002", START, *CLIMB)],
+            1: [("a00001", START + 60, *CRUISE), ("a00002", START + 60, *CRUISE)],
+            20: [("a00001", START + 1200, *DESCEND)],
+            21: [("a00001", START + 1260, *TAXI), ("a00002", START + 1259, *DESCEND)],
+            22: [("a00002", START + 1320, *PARKED)],
+        }
+        self.write(
+            payloads=[
+                payload(time=START + 60 * index, rows=rows)
+                for index, rows in timeline.items()
+            ]
+        )
+
+        flights = self.batched()
+
+        self.assertEqual(flights["icao24"].tolist(), [0xA00001])
+        self.assertEqual(flights["flight_duration_minutes"].tolist(), [21])
+        self.assertTrue(flights.equals(self.streamed()))
+
+    def test_metadata(self) -> None:
+        self.write(
+            payloads=[
+                payload(time=START, rows=[("a00001", START, *CLIMB)]),
+                payload(time=START + 60, rows=[("a00001", START + 60, *PARKED)]),
+            ]
+        )
+        metadata = MetadataIndex.from_frame(
+            df=pd.DataFrame(
+                {
+                    "icao24": np.array([0xA00001], dtype=np.uint32),
+                    "registration": ["UR-TST"],
+                    "model": [None],
+                    "manufacturer_icao": [None],
+                    "owner": [None],
+                    "operator": [None],
+                    "built": pd.to_datetime([None]),
+                }
+            )
+        )
+        table = self.archive.read_day(day=DAY, columns=REPLAY_COLUMNS)
+
+        flights = self.sessionizer.sessionize(table=table, metadata=metadata)
+
+        self.assertEqual(flights["registration"].tolist(), ["UR-TST"])
+        self.assertEqual(flights["flight_duration_minutes"].tolist(), [1])
+
+    def test_empty(self) -> None:
+        table = self.archive.read_day(day=DAY, columns=REPLAY_COLUMNS)
+
+        flights = self.sessionizer.sessionize(table=table)
+
+        self.assertTrue(flights.empty)
+        self.assertEqual(flights.columns.tolist(), FLIGHT_COLUMNS)
+
+    def test_unconverged_sessions(self) -> None:
+        self.write(
+            payloads=[
+                payload(time=START + 60 * index, rows=[("a00001", START, *TAXI)])
+                for index in range(3)
+            ]
+        )
+        table = self.archive.read_day(day=DAY, columns=REPLAY_COLUMNS)
+        flips = itertools.cycle([True, False])
+
+        def landings(breaks: np.ndarray, **kwargs) -> np.ndarray:
+            return np.full(breaks.size, next(flips))
+
+        with mock.patch("plugins.scripts.replay.sessions._landings", landings):
+            with self.assertRaises(RuntimeError) as e:
+                self.sessionizer.sessionize(table=table)
+        self.assertIn("did not converge in 4 iterations", str(e.exception))
+
+    def test_matches_streaming_on_random_tracks(self) -> None:
+        rng = np.random.default_rng(seed=11)
+        aircraft = [f"{0xB00000 + index:06x}" for index in range(120)]
+        payloads = []
+        for index in range(150):
+            time = START + 60 * index
+            rows = []
+            for icao24 in aircraft:
+                if rng.random() < 0.3:
+                    continue
+                last_contact = (
+                    0 if rng.random() < 0.03 else time - int(rng.integers(0, 40))
+                )
+                velocity, vertical_rate = PALETTE[rng.integers(0, len(PALETTE))]
+                rows.append((icao24, last_contact, velocity, vertical_rate))
+            payloads.append(payload(time=time, rows=rows))
+        self.write(payloads=payloads)
+
+        flights = self.batched()
+
+        self.assertGreater(len(flights), 100)
+        self.assertTrue(flights.equals(self.streamed()))
+
+    def test_matches_streaming_on_traffic(self) -> None:
+        generator = TrafficGenerator(aircraft=150, seed=5, start=START, interval=300)
+        self.write(payloads=list(generator.payloads(count=200)))
+
+        flights = self.batched()
+
+        self.assertGreater(len(flights), 50)
+        self.assertTrue(flights.equals(self.streamed()))
+
+
+if __name__ == "__main__":
+    unittest.main()